@@ -0,0 +1,323 @@
+"""
+ Benchmarks the projection search across rows, features, classes and threads.
+
+ Each case runs in a fresh process so its peak RSS is its own. Results are written as JSON,
+ with the git commit they were measured at, so runs can be compared between commits:
+
+   python benchmark_projections.py --rows 2000 20000 --features 10 30 --threads 1 4 -o new.json
+   python benchmark_projections.py --compare old.json new.json
+
+ --sample-size runs search cases as approximate searches on that many sampled rows as well (0 for the exact search).
+
+ Operations:
+   search  - search.search_projections() on the native engine
+   greedy  - search.find_easy_explain_data() on the native engine
+   produce - Search/SearchNumeric produce() after fit() (needs d3m)
+   hybrid  - SearchHybrid/SearchHybridNumeric fit() (needs d3m and the blackbox primitive)
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+import libfind_projections
+
+OPERATIONS = ('search', 'greedy', 'produce', 'hybrid')
+SEED_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'd3m_data')
+
+
+def make_planted(rows, features, arity, noise, boxes, seed):
+    """
+     Uniform data in [0, 1) with 'boxes' boxes planted on random attribute pairs, each holding ~10% of the rows.
+     For arity > 0 rows in a box get the box's class, otherwise a random class.
+     For arity 0 (numeric output) rows in a box get a high output, otherwise N(0, 1).
+     A fraction 'noise' of the rows in boxes keep their background output.
+    """
+    rng = np.random.RandomState(seed)
+    data = rng.rand(rows, features)
+    if arity > 0:
+        output = rng.randint(arity, size=rows).astype(float)
+    else:
+        output = rng.randn(rows)
+
+    width = np.sqrt(0.1)
+    for b in range(boxes):
+        att1, att2 = rng.choice(features, 2, replace=False)
+        low1, low2 = rng.rand(2) * (1 - width)
+        inside = ((data[:, att1] >= low1) & (data[:, att1] < low1 + width) &
+                  (data[:, att2] >= low2) & (data[:, att2] < low2 + width))
+        inside &= rng.rand(rows) >= noise
+        if arity > 0:
+            output[inside] = b % arity
+        else:
+            output[inside] = 3 + 0.1 * rng.randn(np.count_nonzero(inside))
+    return data, output
+
+
+def load_seed_dataset(name):
+    """
+     Numeric columns of a d3m_data seed dataset, without rows with missing values.
+     Returns (data, output, arity) with arity 0 for numeric output.
+    """
+    import pandas as pd
+
+    path = os.path.join(SEED_DIR, name, 'data')
+    inputs = pd.read_csv(os.path.join(path, 'trainData.csv'), index_col='d3mIndex')
+    targets = os.path.join(path, 'trainTargets.csv')
+    if not os.path.exists(targets):
+        targets += '.gz'
+    outputs = pd.read_csv(targets, index_col='d3mIndex').iloc[:, 0]
+
+    inputs = inputs.select_dtypes(include=[np.number]).dropna(axis=1, how='all')
+    keep = inputs.notna().all(axis=1) & outputs.notna()
+    inputs, outputs = inputs[keep], outputs[keep]
+
+    # Integer targets with few values are class labels
+    if outputs.dtype.kind in 'if' and (outputs.nunique() > 20 or not (outputs == outputs.round()).all()):
+        return inputs.values.astype(float), outputs.values.astype(float), 0
+    codes, classes = pd.factorize(outputs, sort=True)
+    return inputs.values.astype(float), codes.astype(float), len(classes)
+
+
+def seed_datasets():
+    return sorted(d for d in os.listdir(SEED_DIR) if os.path.isdir(os.path.join(SEED_DIR, d, 'data')))
+
+
+def load_dataset(dataset):
+    if dataset['source'] == 'synthetic':
+        data, output = make_planted(dataset['rows'], dataset['features'], dataset['arity'], dataset['noise'],
+                                    dataset['boxes'], dataset['seed'])
+        return data, output, dataset['arity']
+    return load_seed_dataset(dataset['name'])
+
+
+def engine_datset(data, output, arity):
+    ds = libfind_projections.Datset(np.asfortranarray(data, dtype=float), True)
+    if arity > 0:
+        ds.fill_datset_output_for_classification(np.ascontiguousarray(output, dtype=float))
+    else:
+        ds.fill_datset_output_for_regression(np.ascontiguousarray(output, dtype=float))
+    return ds
+
+
+def primitive(case, arity, hybrid):
+    import find_projections
+
+    if arity > 0:
+        cls, hp = ((find_projections.SearchHybrid, find_projections.SearchHybridHyperparams) if hybrid else
+                   (find_projections.Search, find_projections.SearchHyperparams))
+        values = {'purity': case['purity']}
+    else:
+        cls, hp = ((find_projections.SearchHybridNumeric, find_projections.SearchHybridNumericHyperparams) if hybrid
+                   else (find_projections.SearchNumeric, find_projections.SearchNumericHyperparams))
+        values = {'mode': case['mode']}
+    values.update(binsize=case['binsize'], support=case['support'], num_threads=case['threads'])
+    hyperparams = hp(hp.defaults(), **values)
+    if hybrid:
+        return cls(hyperparams=hyperparams, random_seed=0)
+    return cls(hyperparams=hyperparams)
+
+
+def run_operation(case, data, output, arity):
+    """
+     Runs the operation of 'case' once. Returns (seconds, no. of projections, engine counters or None).
+    """
+    op = case['op']
+    if op in ('search', 'greedy'):
+        ds = engine_datset(data, output, arity)
+        search = libfind_projections.search()
+        search.set_verbose(False)
+        purity = case['purity'] if arity > 0 else 1.0
+        mode = 1 if arity > 0 else case['mode']
+        start = time.perf_counter()
+        if op == 'search':
+            fmap = search.search_projections(ds, case['binsize'], case['support'], purity, mode, case['threads'],
+                                             sample_size=case['sample_size'], candidates=case['candidates'], seed=0)
+        else:
+            fmap = search.find_easy_explain_data(ds, 0.1, case['binsize'], case['support'], purity, mode,
+                                                 case['threads'])
+        seconds = time.perf_counter() - start
+        if fmap is None:
+            raise ValueError('Invalid parameters')
+        return seconds, fmap.get_num_projections(), search.get_stats()
+
+    import pandas as pd
+    from d3m import container
+
+    inputs = container.DataFrame(pd.DataFrame(data), generate_metadata=True)
+    outputs = container.DataFrame(pd.DataFrame(output, columns=['target']), generate_metadata=True)
+    prim = primitive(case, arity, op == 'hybrid')
+    prim.set_training_data(inputs=inputs, outputs=outputs)
+    if op == 'hybrid':
+        start = time.perf_counter()
+        prim.fit()
+        seconds = time.perf_counter() - start
+    else:
+        prim.fit()
+        start = time.perf_counter()
+        prim.produce(inputs=inputs)
+        seconds = time.perf_counter() - start
+    fmap = prim.get_feature_map()
+    return seconds, fmap.get_num_projections() if fmap else 0, None
+
+
+def run_case(case):
+    """
+     Runs one case 'repeat' times. Meant to run in its own process, so ru_maxrss is the case's peak RSS.
+    """
+    result = dict(case)
+    try:
+        data, output, arity = load_dataset(case['dataset'])
+        result.update(rows=data.shape[0], features=data.shape[1], arity=arity)
+        if case['binsize'] >= data.shape[0] or case['support'] >= data.shape[0]:
+            result['skipped'] = 'binsize or support not below the no. of rows'
+            return result
+        times = []
+        for r in range(case['repeat']):
+            seconds, projections, stats = run_operation(case, data, output, arity)
+            times.append(seconds)
+        result.update(times=times, seconds=min(times), projections=projections)
+        if stats is not None:
+            result['stats'] = stats
+    except (ImportError, ValueError) as e:
+        result['skipped'] = str(e)
+    # Kilobytes on Linux, bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    result['peak_rss_mb'] = rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0
+    return result
+
+
+def case_key(result):
+    dataset = result['dataset']
+    name = dataset.get('name') or 'planted-n{rows}-d{features}-k{arity}-e{noise}'.format(**dataset)
+    return (name, result['op'], result['binsize'], result['support'], result['threads'], result.get('sample_size', 0))
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def make_cases(args):
+    datasets = []
+    for rows, features, arity, noise in itertools.product(args.rows, args.features, args.classes, args.noise):
+        datasets.append({'source': 'synthetic', 'rows': rows, 'features': features, 'arity': arity,
+                         'noise': noise, 'boxes': args.boxes, 'seed': args.seed})
+    names = seed_datasets() if args.seed_datasets == ['all'] else (args.seed_datasets or [])
+    for name in names:
+        datasets.append({'source': 'd3m_data', 'name': name})
+
+    cases = []
+    for dataset, op, binsize, support, threads in itertools.product(datasets, args.ops, args.binsize,
+                                                                     args.support, args.threads):
+        # Only search has an approximate mode
+        for sample_size in (args.sample_size if op == 'search' else [0]):
+            cases.append({'dataset': dataset, 'op': op, 'binsize': binsize, 'support': support, 'threads': threads,
+                          'sample_size': sample_size, 'candidates': args.candidates,
+                          'purity': args.purity, 'mode': args.mode, 'repeat': args.repeat})
+    return cases
+
+
+def benchmark(args):
+    cases = make_cases(args)
+    results = []
+    context = multiprocessing.get_context('spawn')
+    for i, case in enumerate(cases):
+        if args.no_isolate:
+            result = run_case(case)
+        else:
+            with context.Pool(1) as pool:
+                result = pool.apply(run_case, (case,))
+        results.append(result)
+        if 'skipped' in result:
+            status = 'skipped: ' + result['skipped']
+        else:
+            status = '%.3fs  %d projections  %.1f MB' % (result['seconds'], result['projections'],
+                                                         result['peak_rss_mb'])
+        print('[%d/%d] %s %s binsize=%d support=%d threads=%d sample=%d  %s' % ((i + 1, len(cases)) + case_key(result)
+                                                                               + (status,)))
+
+    report = {
+        'commit': git_commit(),
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'arguments': vars(args),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=1)
+    return report
+
+
+def compare(old_path, new_path):
+    """
+     Prints time and peak RSS ratios (new / old) for the cases run in both reports.
+    """
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    before = {case_key(r): r for r in old['results'] if 'skipped' not in r}
+    print('%s -> %s' % (old.get('commit'), new.get('commit')))
+    for result in new['results']:
+        key = case_key(result)
+        if 'skipped' in result or key not in before:
+            continue
+        prior = before[key]
+        print('%s %s binsize=%d support=%d threads=%d sample=%d  time %.3fs -> %.3fs (x%.2f)  rss %.1f -> %.1f MB' % (
+            key + (prior['seconds'], result['seconds'], result['seconds'] / max(prior['seconds'], 1e-9),
+                   prior['peak_rss_mb'], result['peak_rss_mb'])))
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the projection search.')
+    parser.add_argument('--rows', type=int, nargs='+', default=[1000, 4000], help='rows of the planted data')
+    parser.add_argument('--features', type=int, nargs='+', default=[10], help='features of the planted data')
+    parser.add_argument('--classes', type=int, nargs='+', default=[2],
+                        help='classes of the planted data (0 for numeric output)')
+    parser.add_argument('--noise', type=float, nargs='+', default=[0.1],
+                        help='fraction of rows in planted boxes keeping their background output')
+    parser.add_argument('--boxes', type=int, default=3, help='boxes planted in the data')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the planted data')
+    parser.add_argument('--seed-datasets', nargs='*', metavar='NAME',
+                        help='d3m_data datasets to include, or "all"')
+    parser.add_argument('--ops', nargs='+', choices=OPERATIONS, default=['search', 'greedy'])
+    parser.add_argument('--binsize', type=int, nargs='+', default=[10])
+    parser.add_argument('--support', type=int, nargs='+', default=[100])
+    parser.add_argument('--threads', type=int, nargs='+', default=[1])
+    parser.add_argument('--sample-size', type=int, nargs='+', default=[0],
+                        help='rows sampled by the approximate search (0 for the exact search)')
+    parser.add_argument('--candidates', type=int, default=100,
+                        help='attribute pairs the approximate search verifies on all rows')
+    parser.add_argument('--purity', type=float, default=0.9)
+    parser.add_argument('--mode', type=int, choices=(0, 1, 2), default=1, help='search mode for numeric output')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each case, the fastest is reported')
+    parser.add_argument('--no-isolate', action='store_true',
+                        help='run cases in this process (peak RSS is then cumulative)')
+    parser.add_argument('-o', '--output', help='JSON file to write the results to')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two JSON reports and exit')
+    return parser.parse_args(argv)
+
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.compare:
+        compare(*args.compare)
+    else:
+        benchmark(args)
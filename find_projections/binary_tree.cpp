@@ -2,7 +2,7 @@
    File:        binary_tree.cpp
    Author(s):   Saswati Ray
    Created:     Fri Feb 19 16:23:48 EST 2016
-   Description: 
+   Description:
    Copyright (c) 2016 Carnegie Mellon University
 */
 
@@ -13,49 +13,20 @@
 
 using namespace std;
 
-/*
- * Constructor
- */
-btree_node::btree_node(int first, int last, double end_value):
-  first(first), last(last), right_cutoff(end_value) {
-
-  this->optimal_start = first;
-  this->optimal_end = last;
-
-  this->left_child = NULL;
-  this->right_child = NULL;
-}
-
-/*
- * Constructor for creating parent node from child nodes
- * right_child may be NULL
- */
-btree_node::btree_node(btree_node *left_child, btree_node *right_child) :
-  left_child(left_child), right_child(right_child) {
-  this->first = left_child->first;
-  this->last = right_child ? right_child->last : left_child->last;
-
-  this->optimal_start = this->first;
-  this->optimal_end = this->last;
-
-  this->right_cutoff = right_child ? right_child->right_cutoff : left_child->right_cutoff;
-}
-
 /*
  * Creates the entire tree upfront for all values for the attribute att
  * iv - Subset of rows for which tree is being constructed
  * bin_size - No. of data points at each leaf (Maybe more if we have very close values around)
  */
-btree_node *btree_node::construct_empty_tree(Datset &ds, int att, bool is_classifier, std::vector<int> &train_rows, std::vector<int> &iv,
-                                             int bin_size, std::vector<btree_node *> *leaves) {
+btree::btree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size) {
   unsigned int i, start = 0, end = iv.size()-1;
   unsigned int size = end-start+1;
-  std::vector<btree_node *> garr;
-  garr.reserve(size/bin_size);
+
+  first.reserve(2*(size/bin_size + 1));
+  last.reserve(2*(size/bin_size + 1));
 
   i = start;
   unsigned int binend = start;
-  int arity = ds.get_num_classes();
 
   /* Construct all the leaf nodes first */
   while(i <= end) {
@@ -76,101 +47,88 @@ btree_node *btree_node::construct_empty_tree(Datset &ds, int att, bool is_classi
 	break;
     }
 
-    btree_node *node = NULL;
-    if(is_classifier)
-      node = new discrete_binary_tree(i, binend, end_value, arity);
-    else
-      node = new numeric_binary_tree(i, binend, end_value);
-    garr.push_back(node);
+    first.push_back(i);
+    last.push_back(binend);
     i = binend+1;
   } /* All leaves created */
 
-    /* Contents should NEVER be deleted from this array. This array is just for browsing-the-leaves purposes */
-  leaves->reserve(garr.size());
-  for ( i = 0 ; i < garr.size() ; i++ ) {
-    leaves->push_back(garr[i]);
+  num_leaves = first.size();
+
+  /* Leaf codes of all rows, in the narrowest type holding the no. of leaves */
+  if(num_leaves <= 0x10000)
+    short_codes.resize(train_rows.size());
+  else
+    codes.resize(train_rows.size());
+  for(int leaf=0; leaf<num_leaves; leaf++) {
+    for(int k=first[leaf]; k<=last[leaf]; k++) {
+      if(!short_codes.empty())
+        short_codes[iv[k]] = leaf;
+      else
+        codes[iv[k]] = leaf;
+    }
   }
+  level_start.push_back(0);
 
-  /* Build parent nodes from leaf nodes till we reach root node 
-   * Right child may be NULL for some parent nodes
+  /* Build parent nodes from pairs of nodes of the level below till we reach root node
+   * Right child may be missing for the last parent of a level
    */
-  while(garr.size() > 1) {
-    std::vector<btree_node *> garr2;
-    garr2.reserve(garr.size()/2+1);
-
-    for(i=0; i<garr.size(); i+=2) {
-      btree_node *left_child = garr[i];
-      btree_node *right_child = (i+1 < garr.size()) ? garr[i+1] : NULL;
-      btree_node *node = NULL;
-      if(is_classifier)
-	node = new discrete_binary_tree(left_child, right_child);
-      else
-	node = new numeric_binary_tree(left_child, right_child);
-      garr2.push_back(node);
+  int below = 0, below_size = num_leaves;
+  while(below_size > 1) {
+    level_start.push_back(below + below_size);
+    for(int k=0; k<below_size; k+=2) {
+      first.push_back(first[below + k]);
+      last.push_back((k+1 < below_size) ? last[below + k + 1] : last[below + k]);
     }
-
-    garr = garr2;
+    below += below_size;
+    below_size = (below_size + 1)/2;
   }
+  level_start.push_back(below + below_size);
 
-  /* Return root node */
-  btree_node *node = garr[0];
-
-  return node;
+  dirty.resize(first.size());
+  touched.resize(first.size());
 }
 
-/* Returns the optimal sum for the entire tree */
-double btree_node::get_node_optimal_sum() {
-  return optimal_sum;
+/*
+ * Creates discrete_binary_tree or numeric_binary_tree for attribute att
+ */
+btree *btree::construct_empty_tree(Datset &ds, int att, bool is_classifier, std::vector<int> &train_rows, std::vector<int> &iv,
+                                   int bin_size) {
+  if(is_classifier)
+    return new discrete_binary_tree(ds, att, train_rows, iv, bin_size);
+  return new numeric_binary_tree(ds, att, train_rows, iv, bin_size);
 }
 
 /*
  * Destructor
  */
-btree_node::~btree_node() {
-  if(left_child)
-    delete left_child;
-  if(right_child)
-    delete right_child;
-}
-
-/* Returns the optimal start index for the entire tree */
-int btree_node::get_node_optimal_start() {
-  return this->optimal_start;
-}
-
-/* Returns the optimal end index for the entire tree */
-int btree_node::get_node_optimal_end() {
-  return this->optimal_end;
+btree::~btree() {
 }
 
 /*
- * Binary search to find appropriate leaf (data bin) to insert value
+ * Marks leaf 'leaf' and all its ancestors as changed
  */
-static unsigned int find_leaf(std::vector<btree_node *> & leaves, double value) {
-  unsigned int lb = 0, ub = leaves.size()-1;
-
-  while(lb < ub) {
-    int M = (lb + ub)/2;
-    double cutoff = leaves[M]->right_cutoff;
-    
-    if(value <= cutoff) { // Match
-      if(M == 0)
-	return M;
-      if(leaves[M-1]->right_cutoff < value)
-	return M;
-      else 
-	ub = M-1;
-      continue;
+void btree::mark_dirty(int leaf) {
+  int levels = get_num_levels();
+  int i = leaf;
+  for(int h=0; h<levels; h++, i/=2) {
+    int k = level_start[h] + i;
+    if(dirty[k] && touched[k])
+      break;
+    dirty[k] = 1;
+    if(!touched[k]) {
+      touched[k] = 1;
+      touched_nodes.push_back(k);
     }
-    else
-      lb = M+1;
   }
-
-  return lb; 
 }
 
-void btree_node::insert_in_leaf_node(std::vector<btree_node *> & leaves, double value, double score) {
-  unsigned int index = find_leaf(leaves, value);
-  btree_node *btn = leaves[index];
-  btn->insert_entry(score);
+/*
+ * Clears the 'touched' and 'dirty' marks of all nodes which had data added since the last reset
+ */
+void btree::clear_touched() {
+  for(unsigned int gs=0; gs<touched_nodes.size(); gs++) {
+    int k = touched_nodes[gs];
+    touched[k] = dirty[k] = 0;
+  }
+  touched_nodes.clear();
 }
@@ -16,104 +16,81 @@
 /*
  * Binary tree data structure for representing all the values of a dimension at the leaves.
  * The tree has aggregated counts representing which contiguous block of indices (start - end) result in highest summing box (positives - negatives).
+ *
+ * Nodes are stored level by level in contiguous arrays, leaves first (level 0).
+ * Node 'i' of level 'h' has children 2i and 2i+1 of level h-1 (the right child may be missing) and parent i/2 of level h+1.
+ * Each field of a node is kept in its own array, indexed by node id = level_start[h] + i.
  */
-class btree_node {
+class btree {
  protected:
-  int optimal_start, optimal_end;  /* Optimal start - end range indices */
-  double optimal_sum;              /* Optimal sum within optimal range = (Pos - neg) */
-  double total_sum;                /* Total sum of all data at the node */
-  int first, last;                 /* Range of indices valid for a node */
-  double left_sum;                 /* Sum from first : optimal_end for a node */
-  double right_sum;                /* Sum from optimal_start : last for a node */
-  btree_node *left_child;          /* Pointer to left child (May be NULL) */ 
-  btree_node *right_child;         /* Pointer to right child (May be NULL) */
+  int num_leaves;
+  std::vector<int> level_start;    /* Id of first node of each level. Has an extra entry for the end of the last level */
+  std::vector<int> first, last;    /* Range of indices valid for a node */
+  std::vector<unsigned short> short_codes; /* Leaf of each row (position in train_rows) when leaves fit in 16 bits */
+  std::vector<unsigned int> codes;         /* Leaf of each row otherwise */
+  std::vector<char> dirty;         /* Data below a node changed since it was last updated */
+  std::vector<char> touched;       /* Data was added below a node since it was last reset */
+  std::vector<int> touched_nodes;  /* Ids of nodes with 'touched' set */
 
   /*
-   * Returns FALSE for
-   * 1) Leaf node
-   * 2) Total counts at node = 0
-   * Else returns TRUE
+   * Marks leaf 'leaf' and all its ancestors as changed
    */
-  bool valid_to_update() {
-    if(left_child == NULL)
-      return false;
-    
-    if(this->left_child->get_total() == 0) {
-      if(!this->right_child)
-	return false;
-      else if(this->right_child->get_total() == 0)
-	return false;
-    }
-    return true;
-  }
-
-  bool is_leaf() { return left_child == NULL; }
- public:
-  double right_cutoff;             /* Cutoff value corresponding to highest element in this bin */
-
-  /* Returns the optimal start index for the entire tree */
-  int get_node_optimal_start();
-  
-  /* Returns the optimal end index for the entire tree */
-  int get_node_optimal_end();
-  
-  /* Returns the optimal sum for the entire tree */
-  double get_node_optimal_sum();
+  void mark_dirty(int leaf);
 
-  virtual std::string get_name() = 0;
+  /*
+   * Clears the 'touched' and 'dirty' marks of all nodes which had data added since the last reset
+   */
+  void clear_touched();
 
+ public:
   /*
    * Creates the entire tree upfront for all values for the attribute att
    * iv - Subset of rows for which tree is being constructed (in sorted order by the values of attribute)
    * bin_size - No. of data points at each leaf (Maybe more if we have very close values around)
    */
-  static btree_node *construct_empty_tree(Datset &ds, int att, bool is_classifier, std::vector<int> &train_rows, std::vector<int> &iv,
-                                          int bin_size, std::vector<btree_node *> *leaves);
-  
+  btree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size);
+
+  virtual ~btree();
+
   /*
-   * Reset tree counts 
+   * Creates discrete_binary_tree or numeric_binary_tree for attribute att
    */
-  virtual void reset_node(bool exclude_leaves) = 0;
+  static btree *construct_empty_tree(Datset &ds, int att, bool is_classifier, std::vector<int> &train_rows, std::vector<int> &iv,
+                                     int bin_size);
 
-  virtual int get_total() = 0;
+  int get_num_leaves() { return num_leaves; }
 
-  virtual void update_node() = 0;
+  int get_num_nodes() { return level_start.back(); }
 
-  virtual void print_tree(Datset *ds, std::vector<int> &iv, int att) = 0;
+  int get_num_levels() { return level_start.size() - 1; }
 
-  /*
-   * Updates entire tree calling update_node() on non-leaf nodes to update their optimal counts, range
-   * After this function completes, the root node will have the optimal counts, range computed for the data contained in this tree
-   * Post-order traversal
-   */
-  void update_tree() {
-    if(left_child)
-      left_child->update_tree();
-    if(right_child)
-      right_child->update_tree();
-    
-    if(valid_to_update() == false)
-      return;
+  int get_level_start(int h) { return level_start[h]; }
 
-    update_node();
-  }
+  int get_level_size(int h) { return level_start[h+1] - level_start[h]; }
 
-  virtual ~btree_node();
+  /* Ids of children of node 'i' of level 'h' (-1 if missing) */
+  int get_left_child(int h, int i) { return (h > 0) ? level_start[h-1] + 2*i : -1; }
+  int get_right_child(int h, int i) { return (h > 0 && 2*i+1 < get_level_size(h-1)) ? level_start[h-1] + 2*i + 1 : -1; }
 
-  /*
-   * Constructor
-   */
-  btree_node(int first, int last, double end_value);
+  /* Id of the root node */
+  int get_root() { return get_num_nodes() - 1; }
 
-  /*
-   * Constructor for creating parent node from child nodes
-   * right_child may be NULL
-   */
-  btree_node(btree_node *left_child, btree_node *right_child);
+  /* Is node 'k' marked as changed? */
+  bool is_dirty(int k) { return dirty[k]; }
 
-  virtual void insert_entry(double score) = 0;
+  void clear_dirty(int k) { dirty[k] = 0; }
 
-  static void insert_in_leaf_node(std::vector<btree_node *> & leaves, double value, double score);
+  /* Ids of nodes which had data added since the last reset */
+  const std::vector<int> & get_touched_nodes() { return touched_nodes; }
+
+  int get_first(int k) { return first[k]; }
+  int get_last(int k) { return last[k]; }
+
+  /*
+   * Leaf (data bin) holding row at position 'p' of train_rows.
+   * Computed once when the tree is built, as the leaf a row lands in never changes during a search.
+   */
+  int get_leaf(int p) { return short_codes.empty() ? (int)codes[p] : (int)short_codes[p]; }
 };
 
 #endif
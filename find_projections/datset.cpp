@@ -7,6 +7,7 @@
  *    */
 
 #include "datset.hpp"
+#include <algorithm>
 
 Datset::Datset(PyObject *object) {
   PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
@@ -26,8 +27,121 @@ Datset::Datset(PyObject *object) {
   }
 
   output_class = NULL;
+  label_width = 4;
   output_regress = NULL;
   training_rows = NULL;
+  wrapped = false;
+  pthread_rwlock_init(&rwlock, NULL);
+  pthread_mutex_init(&sort_mutex, NULL);
+}
+
+static void raise_value_error(const char *message) {
+  PyErr_SetString(PyExc_ValueError, message);
+  p::throw_error_already_set();
+}
+
+/*
+ * Returns the values of a column, checking it is a contiguous 1-d array of 'rows' values of type 'type'
+ */
+static const char *column_error = "Each column should be a contiguous 1-d array of float64 (or float32) values, all of the same type";
+
+static void *column_data(PyObject *object, int rows, int type) {
+  if(!PyArray_Check(object))
+    raise_value_error(column_error);
+  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
+  if(PyArray_NDIM(array) != 1 || PyArray_TYPE(array) != type || !PyArray_IS_C_CONTIGUOUS(array))
+    raise_value_error(column_error);
+  if(PyArray_DIM(array, 0) != rows)
+    raise_value_error("All columns should have the same length");
+  return PyArray_DATA(array);
+}
+
+/*
+ * Wraps caller's data without copying it if 'wrap', otherwise copies it.
+ * 'object' is either a Fortran-ordered 2-d array or a list of 1-d arrays (one per column), of float64 or float32 values.
+ */
+Datset::Datset(PyObject *object, bool wrap) {
+  num_classes = -1;
+  darray = NULL;
+  output_class = NULL;
+  label_width = 4;
+  output_regress = NULL;
+  training_rows = NULL;
+  wrapped = wrap;
+  pthread_rwlock_init(&rwlock, NULL);
+  pthread_mutex_init(&sort_mutex, NULL);
+
+  if(PyList_Check(object) || PyTuple_Check(object)) {
+    cols = PySequence_Fast_GET_SIZE(object);
+    if(cols <= 0)
+      raise_value_error("Column list is empty");
+    if(!PyArray_Check(PySequence_Fast_GET_ITEM(object, 0)))
+      raise_value_error(column_error);
+    PyArrayObject *first = reinterpret_cast<PyArrayObject *>(PySequence_Fast_GET_ITEM(object, 0));
+    rows = PyArray_DIM(first, 0);
+    int type = (PyArray_TYPE(first) == NPY_FLOAT) ? NPY_FLOAT : NPY_DOUBLE;
+
+    for (int j = 0; j < cols; ++j) {
+      void *data = column_data(PySequence_Fast_GET_ITEM(object, j), rows, type);
+      if(type == NPY_FLOAT)
+        fcolumns.push_back(reinterpret_cast< float * >(data));
+      else
+        columns.push_back(reinterpret_cast< double * >(data));
+    }
+
+    /* References released in destructor */
+    for (int j = 0; j < cols; ++j) {
+      PyObject *column = PySequence_Fast_GET_ITEM(object, j);
+      Py_INCREF(column);
+      owners.push_back(column);
+    }
+  }
+  else {
+    if(!PyArray_Check(object))
+      raise_value_error("Data should be a Fortran-ordered 2-d array of float64 (or float32) values");
+    PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
+    int type = PyArray_TYPE(array);
+    if(PyArray_NDIM(array) != 2 || (type != NPY_DOUBLE && type != NPY_FLOAT) || !PyArray_IS_F_CONTIGUOUS(array))
+      raise_value_error("Data should be a Fortran-ordered 2-d array of float64 (or float32) values");
+    rows = PyArray_DIM(array, 0);
+    cols = PyArray_DIM(array, 1);
+
+    Py_INCREF(object);
+    owners.push_back(object);
+    if(type == NPY_FLOAT) {
+      float *base = reinterpret_cast< float * >( PyArray_DATA(array) );
+      fcolumns.resize(cols);
+      for (int j = 0; j < cols; ++j)
+        fcolumns[j] = base + (long)j * rows;
+    }
+    else {
+      double *base = reinterpret_cast< double * >( PyArray_DATA(array) );
+      columns.resize(cols);
+      for (int j = 0; j < cols; ++j)
+        columns[j] = base + (long)j * rows;
+    }
+  }
+
+  if(!wrap) {
+    /* Copy into storage owned by the Datset, dropping the references */
+    if(!fcolumns.empty()) {
+      fcopied.resize((long)rows * cols);
+      for (int j = 0; j < cols; ++j) {
+        std::copy(fcolumns[j], fcolumns[j] + rows, fcopied.data() + (long)j * rows);
+        fcolumns[j] = fcopied.data() + (long)j * rows;
+      }
+    }
+    else {
+      copied.resize((long)rows * cols);
+      for (int j = 0; j < cols; ++j) {
+        std::copy(columns[j], columns[j] + rows, copied.data() + (long)j * rows);
+        columns[j] = copied.data() + (long)j * rows;
+      }
+    }
+    for(unsigned int j=0; j<owners.size(); j++)
+      Py_DECREF(owners[j]);
+    owners.clear();
+  }
 }
 
 double Datset::get_default_value() {
@@ -61,16 +175,109 @@ double Datset::get_default_value() {
   return value;
 }
 
-double Datset::ds_real_ref(int i, int j) {
-  return (*darray)(i, j);
+typedef struct sort_struct {
+  Datset *ds;
+  int id, num_threads;
+}sort_struct;
+
+/*
+ * Orders rows by the values of one attribute, ties by row
+ */
+class value_order {
+private:
+  Datset &ds;
+  int att;
+public:
+  value_order(Datset &ds, int att) : ds(ds), att(att) {
+  }
+
+  bool operator()(int a, int b) {
+    return ds.ds_real_ref(a, att) < ds.ds_real_ref(b, att);
+  }
+};
+
+/*
+ * Sorts every num_threads-th attribute starting from 'id'
+ */
+static void *sort_routine(void *arg) {
+  sort_struct *ss = (sort_struct *)arg;
+  Datset *ds = ss->ds;
+  int rows = ds->get_rows();
+
+  for(int j=ss->id; j<ds->get_cols(); j+=ss->num_threads) {
+    int *order = ds->get_sorted_rows(j);
+    for(int i=0; i<rows; i++)
+      order[i] = i;
+    std::stable_sort(order, order + rows, value_order(*ds, j));
+  }
+  return NULL;
+}
+
+/*
+ * Sorts all attributes into 'sorted_columns'. Caller holds 'sort_mutex'.
+ */
+void Datset::sort_all(int num_threads) {
+  if(num_threads < 1)
+    num_threads = 1;
+  if(num_threads > cols)
+    num_threads = cols;
+
+  std::vector<sort_struct> args(num_threads);
+  std::vector<pthread_t> threads(num_threads);
+  for(int t=0; t<num_threads; t++) {
+    args[t].ds = this;
+    args[t].id = t;
+    args[t].num_threads = num_threads;
+  }
+  for(int t=1; t<num_threads; t++)
+    pthread_create(&threads[t], NULL, sort_routine, (void *)&args[t]);
+  sort_routine((void *)&args[0]);
+  for(int t=1; t<num_threads; t++)
+    pthread_join(threads[t], NULL);
+}
+
+void Datset::sort_columns(int num_threads) {
+  pthread_mutex_lock(&sort_mutex);
+  if(sorted_columns.empty() && cols > 0) {
+    sorted_rows.resize(cols);
+    for(int j=0; j<cols; j++) {
+      sorted_rows[j].resize(rows);
+      sorted_columns.push_back(sorted_rows[j].data());
+    }
+    sort_all(num_threads);
+  }
+  pthread_mutex_unlock(&sort_mutex);
 }
 
-double Datset::ds_output_ref(int i) {
-  double val = (is_classifier)?(*output_class)[i]:(*output_regress)[i];
-  return val;
+int *Datset::hold_sorted_rows(PyObject *object) {
+  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
+  if(!PyArray_Check(object) || PyArray_NDIM(array) != 2 || PyArray_TYPE(array) != NPY_INT || !PyArray_IS_F_CONTIGUOUS(array) ||
+     PyArray_DIM(array, 0) != rows || PyArray_DIM(array, 1) != cols)
+    raise_value_error("Sorted rows should be a Fortran-ordered 2-d int32 array of rows x columns");
+  Py_INCREF(object);
+  owners.push_back(object);
+  return reinterpret_cast< int * >( PyArray_DATA(array) );
+}
+
+void Datset::set_sorted_rows(int *base, bool is_sorted, int num_threads) {
+  pthread_mutex_lock(&sort_mutex);
+  std::vector<int *> shared(cols);
+  for(int j=0; j<cols; j++)
+    shared[j] = base + (long)j * rows;
+
+  if(!is_sorted && !sorted_columns.empty()) {
+    for(int j=0; j<cols; j++)
+      std::copy(sorted_columns[j], sorted_columns[j] + rows, shared[j]);
+  }
+  bool compute = !is_sorted && sorted_columns.empty();
+  sorted_columns = shared;
+  sorted_rows.clear();
+  if(compute && cols > 0)
+    sort_all(num_threads);
+  pthread_mutex_unlock(&sort_mutex);
 }
 
-void Datset::fill_datset_output_for_classification(PyObject *object) {
+void Datset::fill_datset_output_for_classification(std::vector<double> &values) {
   is_classifier = true;
 
   if(output_class)
@@ -80,18 +287,33 @@ void Datset::fill_datset_output_for_classification(PyObject *object) {
   output_class = NULL;
   output_regress = NULL;
 
-  output_class = new std::vector<int>(rows);
+  std::vector<int> v(rows);
+  for (int i = 0; i < rows; ++i)
+    v[i] = (int)values[i];
 
-  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
-  double *iter = reinterpret_cast< double * >( PyArray_GETPTR1(array, 0) );
-  for (int i = 0; i < rows; ++i) {
-    int val = (int)iter[i];
-    (*output_class)[i] = val;
- }
+  /* Narrowest type holding all the labels */
+  int min_label = 0, max_label = 0;
+  if(rows > 0) {
+    min_label = *std::min_element(v.begin(), v.end());
+    max_label = *std::max_element(v.begin(), v.end());
+  }
+  if(min_label >= 0 && max_label <= 0xFF)
+    label_width = 1;
+  else if(min_label >= 0 && max_label <= 0xFFFF)
+    label_width = 2;
+  else
+    label_width = 4;
 
-  std::vector<int> v(output_class->size());
-  for(unsigned int i =0; i<output_class->size(); i++)
-    v[i] = (int)output_class->at(i);
+  output_class = new std::vector<unsigned char>((long)rows * label_width);
+  unsigned char *labels = output_class->data();
+  for (int i = 0; i < rows; ++i) {
+    if(label_width == 1)
+      labels[i] = v[i];
+    else if(label_width == 2)
+      reinterpret_cast< unsigned short * >(labels)[i] = v[i];
+    else
+      reinterpret_cast< int * >(labels)[i] = v[i];
+  }
 
   // populate v with data
   std::sort(v.begin(), v.end());
@@ -99,23 +321,15 @@ void Datset::fill_datset_output_for_classification(PyObject *object) {
   this->num_classes = uniqueCount;
 }
 
-void Datset::set_training_rows(PyObject *object) {
+void Datset::set_training_rows(std::vector<int> &rows) {
   if(this->training_rows) {
       delete this->training_rows;
   }
 
-  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
-  int rows = PyArray_DIM(array, 0);
   this->training_rows = new std::vector<int>(rows);
-
-  double *iter = reinterpret_cast< double * >( PyArray_GETPTR1(array, 0) );
-  for (int i = 0; i < rows; ++i) {
-    int val = (int)iter[i];
-    (*training_rows)[i] = val;
-  }
 }
 
-void Datset::fill_datset_output_for_regression(PyObject *object) {
+void Datset::fill_datset_output_for_regression(std::vector<double> &values) {
   is_classifier = false;
 
   if(output_class)
@@ -126,13 +340,7 @@ void Datset::fill_datset_output_for_regression(PyObject *object) {
   output_regress = NULL;
   this->num_classes = -1;
 
-  output_regress = new std::vector<double>(rows);
-  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
-  double *iter = reinterpret_cast< double * >( PyArray_GETPTR1(array, 0) );
-  for (int i = 0; i < rows; ++i) {
-    double val = iter[i];
-    (*output_regress)[i] = val;
-  }
+  output_regress = new std::vector<double>(values.begin(), values.begin() + rows);
 }
 
 Datset::~Datset() {
@@ -148,4 +356,9 @@ Datset::~Datset() {
   if(training_rows)
     delete training_rows;
   training_rows = NULL;
+  for(unsigned int j=0; j<owners.size(); j++)
+    Py_DECREF(owners[j]);
+  owners.clear();
+  pthread_rwlock_destroy(&rwlock);
+  pthread_mutex_destroy(&sort_mutex);
 }
@@ -10,12 +10,18 @@
 #define DATSET_H_
 
 #define NPY_NO_DEPRECATED_API NPY_1_7_API_VERSION
+/* The NumPy C API table is imported once, by the module init in pyfind_projections.cpp */
+#define PY_ARRAY_UNIQUE_SYMBOL find_projections_ARRAY_API
+#ifndef FIND_PROJECTIONS_MODULE
+#define NO_IMPORT_ARRAY
+#endif
 
 #include <boost/python.hpp>
 #include <numpy/arrayobject.h>
 namespace p = boost::python;
 
 #include <boost/numeric/ublas/matrix.hpp>
+#include <pthread.h>
 
 using namespace boost::numeric::ublas;
 
@@ -26,26 +32,101 @@ using namespace boost::numeric::ublas;
  */
 class Datset {
  private:
-  matrix<double> *darray;
-  std::vector<int> *output_class;
+  matrix<double> *darray;          /* Row-major copy of the input (NULL when wrapping caller's buffer) */
+  std::vector<double *> columns;   /* Per-column pointers into caller's buffer (empty when copied or float32) */
+  std::vector<float *> fcolumns;   /* Per-column pointers into caller's float32 buffer (empty otherwise) */
+  std::vector<double> copied;      /* Column-major copy of the input when not wrapping it */
+  std::vector<float> fcopied;      /* Column-major copy of float32 input when not wrapping it */
+  bool wrapped;                    /* Input is read from caller's arrays rather than a copy */
+  std::vector<PyObject *> owners;  /* Python arrays kept alive while wrapped */
+  std::vector<unsigned char> *output_class;  /* Class labels, 'label_width' bytes each */
+  int label_width;                 /* 1 (uint8) when all labels are below 256, 2 (uint16) below 65536, else 4 (int) */
   std::vector<int> *training_rows;
   std::vector<double> *output_regress;
   int rows, cols, num_classes;
   bool is_classifier;
+  pthread_rwlock_t rwlock;         /* Read-locked by searches, write-locked when output / training rows change */
+  std::vector<std::vector<int> > sorted_rows;  /* Storage of 'sorted_columns' unless kept in a caller's array */
+  std::vector<int *> sorted_columns;  /* All rows in sorted order of each attribute (empty until first needed) */
+  pthread_mutex_t sort_mutex;      /* Guards computing 'sorted_columns' */
+
+  void sort_all(int num_threads);
 
  public:
   Datset();
   Datset(PyObject *array);
 
-  void fill_datset_output_for_classification(PyObject *array);
-  void fill_datset_output_for_regression(PyObject *array);
-  void set_training_rows(PyObject *array);
+  /*
+   * Wraps caller's data without copying it if 'wrap', otherwise copies it column by column.
+   * 'object' is either a Fortran-ordered 2-d array or a list of 1-d arrays (one per column), of float64 or float32 values.
+   * float32 data is kept as float32, halving memory per row.
+   * When wrapping, a reference is held on the arrays for the lifetime of the Datset.
+   */
+  Datset(PyObject *object, bool wrap);
+
+  /* Output of each row, copied from the caller's array (classes as float values) */
+  void fill_datset_output_for_classification(std::vector<double> &values);
+  void fill_datset_output_for_regression(std::vector<double> &values);
+  void set_training_rows(std::vector<int> &rows);
   std::vector<int> *get_training_rows() {
     return training_rows;
   }
 
-  double ds_real_ref(int i, int j);
-  double ds_output_ref(int i);
+  double ds_real_ref(int i, int j) {
+    if(darray)
+      return (*darray)(i, j);
+    if(!fcolumns.empty())
+      return fcolumns[j][i];
+    return columns[j][i];
+  }
+
+  /* Class label of row 'i' */
+  int ds_class_ref(int i) {
+    const unsigned char *labels = output_class->data();
+    if(label_width == 1)
+      return labels[i];
+    if(label_width == 2)
+      return reinterpret_cast<const unsigned short *>(labels)[i];
+    return reinterpret_cast<const int *>(labels)[i];
+  }
+
+  /*
+   * Sorts all rows by the values of each attribute, once for the lifetime of the Datset.
+   * Attributes are sorted in parallel using 'num_threads' threads. Ties keep row order.
+   */
+  void sort_columns(int num_threads);
+
+  /*
+   * Checks that 'object' is a Fortran-ordered 2-d int32 array of rows x cols for set_sorted_rows(), holding a reference
+   * on it for the lifetime of the Datset. Returns its data.
+   */
+  int *hold_sorted_rows(PyObject *object);
+
+  /*
+   * Keeps the sorted rows in 'base' (from hold_sorted_rows()), so several processes can share them.
+   * If 'is_sorted', 'base' already holds them (as filled by another Datset of the same data).
+   * Otherwise they are copied into it, or computed into it if not sorted yet.
+   */
+  void set_sorted_rows(int *base, bool is_sorted, int num_threads);
+
+  /* All rows in sorted order of attribute 'att'. sort_columns() must have been called */
+  int *get_sorted_rows(int att) {
+    return sorted_columns[att];
+  }
+
+  double ds_output_ref(int i) {
+    return is_classifier ? ds_class_ref(i) : (*output_regress)[i];
+  }
+
+  /* Bytes used for each class label */
+  int get_label_width() {
+    return label_width;
+  }
+
+  /* True if features are stored as float32 */
+  bool is_single_precision() {
+    return !fcolumns.empty();
+  }
   double get_default_value();
 
   int get_num_classes() {
@@ -59,7 +140,7 @@ class Datset {
   }
 
   bool is_valid() {
-    return (darray && (output_class || output_regress));
+    return ((darray || columns.size() || fcolumns.size()) && (output_class || output_regress));
   }
 
   int get_rows() {
@@ -68,6 +149,24 @@ class Datset {
   int get_cols() {
     return cols;
   }
+
+  bool is_wrapped() {
+    return wrapped;
+  }
+
+  /*
+   * Several searches may run concurrently on one Datset (with the GIL released), each holding a read lock.
+   * Changing the output or training rows takes the write lock, waiting for running searches to finish.
+   */
+  void read_lock() {
+    pthread_rwlock_rdlock(&rwlock);
+  }
+  void write_lock() {
+    pthread_rwlock_wrlock(&rwlock);
+  }
+  void unlock() {
+    pthread_rwlock_unlock(&rwlock);
+  }
 };
 
 #endif
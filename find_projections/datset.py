@@ -15,26 +15,87 @@ def validate_params(ds, binsize, support):
 
     return True
 
+def _load_labels(path):
+    if path.endswith('.npy'):
+        labels = np.load(path, mmap_mode='r')
+    else:
+        labels = np.fromfile(path, dtype=np.float64)
+    return np.ascontiguousarray(np.ravel(labels), dtype=float)
+
 class Datset:
 
      """
      Create Datset instance with numpy 2-d array of floats.
+     If copy is False, the data is wrapped without copying it. 'data' may then also be a list of 1-d arrays
+     (one per column). Data which is not already Fortran-ordered float64 is converted first.
+     If single is True (implies copy=False), the data is stored as float32, halving memory per row.
+     Values are then searched and reported at float32 precision.
+     Raises ValueError if the data is not floating point.
      """
-     def __init__(self, data):
+     def __init__(self, data, copy=True, single=False):
+         self.output = None
+         self.classification = None
+         dtype = np.float32 if single else float
+         if isinstance(data, (list, tuple)):
+             self.data = [np.ascontiguousarray(column, dtype=dtype) for column in data]
+             self.ds = libfind_projections.Datset(self.data, True)
+             return
+
          rows = data.shape[0]
          cols = data.shape[1]
 
-         if data.dtype not in np.sctypes['float']:
-             return None
+         if not np.issubdtype(data.dtype, np.floating):
+             raise ValueError("Data should be a 2-d array of floating point values")
+
+         if copy and not single:
+             self.data = data
+             self.ds = libfind_projections.Datset(data)
+         else:
+             self.data = np.asfortranarray(data, dtype=dtype)
+             self.ds = libfind_projections.Datset(self.data, True)
 
-         self.ds = libfind_projections.Datset(data)
+     """
+     Create Datset instance by memory-mapping features stored on disk. Values are read through the mapping
+     by sorting and tree building, so the features themselves are not copied into memory.
+     This is not an out-of-core search. Searches still keep in memory the sorted rows of each attribute (4 bytes per
+     value, for the lifetime of the Datset), the sorted training rows of each attribute (4 bytes per value) and the
+     leaf of each value (2 or 4 bytes), 10 to 12 bytes per value in all : 1.25 to 1.5 times the size of a float64
+     file, 2.5 to 3 times a float32 one. Multi-threaded classification searches also keep 4 bytes per value and class. The sorted rows can be kept in a file instead, by passing a memory-mapped
+     array (np.lib.format.open_memmap) to ds.set_sorted_rows().
+     'path' is either a .npy file holding a Fortran-ordered (column-major) 2-d float64 or float32 array, or a raw
+     binary file of column-major values of type 'dtype', for which 'shape' = (rows, cols) is required.
+     'labels_path' (optional) is a .npy or raw float64 file of output values, one per row.
+     'classification' tells whether the labels are discrete classes or numeric output.
+     """
+     @classmethod
+     def from_file(cls, path, labels_path=None, shape=None, classification=True, dtype=np.float64):
+         if shape is None:
+             data = np.load(path, mmap_mode='r')
+         else:
+             data = np.memmap(path, dtype=dtype, mode='r', shape=tuple(shape), order='F')
+         if data.ndim != 2 or data.dtype not in (np.float64, np.float32) or not data.flags['F_CONTIGUOUS']:
+             raise ValueError("Mapped data should be a column-major 2-d array of float64 or float32 values")
+
+         ds = cls(data, copy=False, single=(data.dtype == np.float32))
+         if labels_path is not None:
+             labels = _load_labels(labels_path)
+             if len(labels) != ds.getSize():
+                 raise ValueError("Labels file should hold one value per row")
+             if classification:
+                 ds.setOutputForClassification(labels)
+             else:
+                 ds.setOutputForRegression(labels)
+         return ds
 
      """
      Set output array for classification task
      """
      def setOutputForClassification(self, output):
          if ( np.issubdtype(output.dtype, np.floating ) ) :
+            output = np.ascontiguousarray(output, dtype=float)
             self.ds.fill_datset_output_for_classification(output)
+            self.output = output
+            self.classification = True
          else:
             raise Exception("Invalid classification data type")
 
@@ -43,7 +104,10 @@ class Datset:
      """
      def setOutputForRegression(self, output):
          if ( np.issubdtype(output.dtype, np.floating ) ) :
+            output = np.ascontiguousarray(output, dtype=float)
             self.ds.fill_datset_output_for_regression(output)
+            self.output = output
+            self.classification = False
          else:
             raise Exception("Invalid regressionion data type")
 
@@ -66,36 +130,4 @@ class Datset:
          return self.ds.get_default_value()
     
      def get_real_ref(self, i, j):
-         return self.ds.ds_real_ref(i, j)     
-   
-     def _point_within_line(self, row, att, start, end):
-         value = self.get_real_ref(row, att)
-         if value >= start and value <= end:
-             return True
-         return False
-
-     def _point_lies_in_projection(self, row, att1, start1, end1, att2, start2, end2):
-         a1 = self._point_within_line(row, att1, start1, end1)
-         a2 = self._point_within_line(row, att2, start2, end2)
-         final = a1 and a2
-         return final
-
-     def _helper(self, num, fmap, row):
-         index = 0
-         for pr in fmap:
-             if num != -1 and index > num:
-                 break
-             att1 = pr[0]
-             att2 = pr[1]
-             start1 = pr[2]
-             start2 = pr[3]
-             end1 = pr[4]
-             end2 = pr[5]
-             value = pr[6]
-
-             valid = self._point_lies_in_projection(row, att1, start1, end1, att2, start2, end2)
-             if valid is True:
-                 return (value, True)
-             index = index+1
-         return (0, False)
-  
+         return self.ds.ds_real_ref(i, j)
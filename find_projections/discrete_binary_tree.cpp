@@ -12,209 +12,225 @@
 /*
  * Constructor
  */
-discrete_binary_tree::discrete_binary_tree(int first, int last, double end_value, int arity) : btree_node(first, last, end_value) {
-  this->total_pos = this->total_neg = 0;
-  this->opt_pos = this->opt_neg = this->left_pos = this->left_neg = this->right_pos = this->right_neg = 0;
-  this->label_dyv.resize(arity);
-  this->total_sum = this->left_sum = this->right_sum = this->optimal_sum = 0;
+discrete_binary_tree::discrete_binary_tree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size) :
+  btree(ds, att, train_rows, iv, bin_size) {
+  this->arity = ds.get_num_classes();
+  label_counts.resize(num_leaves * arity);
+  leaf_total.resize(num_leaves);
 }
 
-std::string discrete_binary_tree::get_name() {
-  return std::string("discrete_binary_tree");
+/*
+ * Destructor
+ */
+discrete_binary_tree::~discrete_binary_tree() {
 }
 
 /*
- * Constructor for creating parent node from child nodes
- * right_child may be NULL
+ * Reset class distributions of the leaves which had data added since the last reset
  */
-discrete_binary_tree::discrete_binary_tree(btree_node *left_child, btree_node *right_child) : btree_node(left_child, right_child) {
-  this->total_pos = this->total_neg = 0;
-  this->opt_pos = this->opt_neg = this->left_pos = this->left_neg = this->right_pos = this->right_neg = 0;
-  this->total_sum = this->left_sum = this->right_sum = this->optimal_sum = 0;
+void discrete_binary_tree::reset_touched() {
+  for(unsigned int gs=0; gs<touched_nodes.size(); gs++) {
+    int k = touched_nodes[gs];
+    if(k >= num_leaves)
+      continue;
+    for(int l=0; l<arity; l++)
+      label_counts[k * arity + l] = 0;
+    leaf_total[k] = 0;
+  }
+  clear_touched();
 }
 
-std::vector<int> & discrete_binary_tree::get_label_dyv() {
-  return label_dyv;
+/*
+ * Constructor
+ */
+multi_class_tree::multi_class_tree(discrete_binary_tree *tree) : tree(tree), arity(tree->get_arity()), computed(false) {
+  int nodes = tree->get_num_nodes();
+  count.resize(nodes);
+
+  int size = nodes * arity;
+  optimal_sum.resize(size);
+  total_sum.resize(size);
+  left_sum.resize(size);
+  right_sum.resize(size);
+  optimal_start.resize(size);
+  optimal_end.resize(size);
+  opt_pos.resize(size);
+  opt_neg.resize(size);
+  total_pos.resize(size);
+  total_neg.resize(size);
+  left_pos.resize(size);
+  left_neg.resize(size);
+  right_pos.resize(size);
+  right_neg.resize(size);
 }
 
 /*
- * Reset tree counts 
+ * Sets node 'k' to empty counts
  */
-void discrete_binary_tree::reset_node(bool exclude_leaves) {
-  this->total_sum = 0;
-  this->optimal_sum = 0;
-  this->left_sum = this->right_sum = 0;
-  this->optimal_start = this->first;
-  this->optimal_end = this->last;
-
-  this->total_pos = this->total_neg = 0;
-  this->opt_pos = this->opt_neg = this->left_pos = this->left_neg = this->right_pos = this->right_neg = 0;
-
-  if(exclude_leaves == false) {
-    for(unsigned int j=0; j<label_dyv.size(); j++)
-      label_dyv[j] = 0;
+void multi_class_tree::reset_node(int k) {
+  int base = k * arity;
+  int size = classes.size();
+  int node_first = tree->get_first(k), node_last = tree->get_last(k);
+  for(int l=0; l<size; l++) {
+    int x = base + l;
+    optimal_sum[x] = total_sum[x] = left_sum[x] = right_sum[x] = 0;
+    optimal_start[x] = node_first;
+    optimal_end[x] = node_last;
+    opt_pos[x] = opt_neg[x] = total_pos[x] = total_neg[x] = 0;
+    left_pos[x] = left_neg[x] = right_pos[x] = right_neg[x] = 0;
   }
 }
 
 /*
- * Destructor
+ * Class counts of leaf 'k' : class +ve, everything else -ve
  */
-discrete_binary_tree::~discrete_binary_tree() {
+void multi_class_tree::update_leaf(int k) {
+  const int *vec = tree->get_label_counts(k);
+  int base = k * arity;
+  int size = classes.size();
+  int node_first = tree->get_first(k), node_last = tree->get_last(k);
+
+  count[k] = tree->get_leaf_total(k);
+  for(int l=0; l<size; l++) {
+    int x = base + l;
+    int pos = vec[classes[l]];
+    int neg = count[k] - pos;
+    int net = pos - neg;
+    optimal_sum[x] = total_sum[x] = left_sum[x] = right_sum[x] = net;
+    optimal_start[x] = node_first;
+    optimal_end[x] = node_last;
+    opt_pos[x] = total_pos[x] = left_pos[x] = right_pos[x] = pos;
+    opt_neg[x] = total_neg[x] = left_neg[x] = right_neg[x] = neg;
+  }
 }
 
 /*
- * Update a parent node.
+ * Update parent node 'k' with children 'left' and 'right' (-1 if missing) for all classes.
  * Vx (optimal_sum) = max(VLx, VRx, VLr + VRl)
  * Vl (left_sum) = max(VLl, VLtotal + VRl)
  * Vr (right_sum) = max(VRr, VRtotal + VLr)
  * Vtotal (total_sum) = VLtotal + VRtotal
+ * Ties are broken as in Helper::maximum_of_3(). Written without branches on the class so the loop over classes can be vectorized.
  */
-void discrete_binary_tree::update_node() {
-  double right_optimal, right_right, right_left, right_total;
+void multi_class_tree::update_node(int k, int left, int right) {
+  bool has_right = (right >= 0);
+  int base = k * arity;
 
-  right_optimal = right_right = right_left = right_total = 0;
+  count[k] = count[left] + (has_right ? count[right] : 0);
 
-  discrete_binary_tree *left = (discrete_binary_tree *)this->left_child;
-  discrete_binary_tree *right = (discrete_binary_tree *)this->right_child;
-
-  /* Right child counts */
-  if(right) {
-    right_optimal = right->optimal_sum;
-    right_total = right->total_sum;
-    right_left = right->left_sum;
-    right_right = right->right_sum;
-  }
-  
-  int path = Helper::maximum_of_3(left->optimal_sum, right_optimal, left->right_sum + right_left);
-
-  /* Update optimal start, end indices based on which option gave max sum */
-  switch(path) {
-  case 0: // Left optimal
-    this->optimal_sum = left->optimal_sum;
-    this->optimal_start = left->optimal_start;
-    this->optimal_end = left->optimal_end;
-    this->opt_pos = left->opt_pos;
-    this->opt_neg = left->opt_neg;
-    this->left_pos = left->left_pos;
-    this->left_neg = left->left_neg;
-    this->right_pos = left->right_pos;
-    this->right_neg = left->right_neg;
-    if(right) {
-      this->right_pos += right->total_pos;
-      this->right_neg += right->total_neg;
-    }
-    break;
-  case 1: // Right optimal
-    this->optimal_sum = right_optimal;
-    this->left_pos = left->total_pos;
-    this->left_neg = left->total_neg;
-    if(right) {
-      this->optimal_start = right->optimal_start;
-      this->optimal_end = right->optimal_end;
-      this->opt_pos = right->opt_pos;
-      this->opt_neg = right->opt_neg;
-      this->left_pos += right->left_pos;
-      this->left_neg += right->left_neg;
-      this->right_pos = right->right_pos;
-      this->right_neg = right->right_neg;
-    }
-    break;
-  case 2: // Left_right + right_left
-    this->optimal_sum = left->right_sum + right_left;
-    this->optimal_start = left->optimal_start;
-    this->opt_pos = left->right_pos;
-    this->opt_neg = left->right_neg;
-    this->left_pos = left->total_pos;
-    this->left_neg = left->total_neg;
-    this->right_pos = left->right_pos;
-    this->right_neg = left->right_neg;
-    if(right) {
-      this->optimal_end = right->optimal_end;
-      this->opt_pos += right->left_pos;
-      this->opt_neg += right->left_neg;
-      this->left_pos += right->left_pos;
-      this->left_neg += right->left_neg;
-      this->right_pos += right->total_pos;
-      this->right_neg += right->total_neg;
-    }
-    break;
-  }
-
-  // Updating left_sum
-  if(left->left_sum >= left->total_sum + right_left) {
-    this->left_sum = left->left_sum;
-  }
-  else {
-    this->left_sum = left->total_sum + right_left;
+  /* Nothing to update without data */
+  if(count[k] == 0) {
+    reset_node(k);
+    return;
   }
 
-  // Updating right_sum
-  if(right_right >= right_total + left->right_sum) {
-    this->right_sum = right_right;
+  int L = left * arity;
+  int R = right * arity;
+  int node_first = tree->get_first(k), node_last = tree->get_last(k);
+  int size = classes.size();
+  for(int l=0; l<size; l++) {
+    int x = base + l;
+
+    /* Right child counts (0 for missing child) */
+    int r_optimal = has_right ? optimal_sum[R+l] : 0;
+    int r_total = has_right ? total_sum[R+l] : 0;
+    int r_left = has_right ? left_sum[R+l] : 0;
+    int r_right = has_right ? right_sum[R+l] : 0;
+    int r_total_pos = has_right ? total_pos[R+l] : 0;
+    int r_total_neg = has_right ? total_neg[R+l] : 0;
+    int r_left_pos = has_right ? left_pos[R+l] : 0;
+    int r_left_neg = has_right ? left_neg[R+l] : 0;
+    int r_right_pos = has_right ? right_pos[R+l] : 0;
+    int r_right_neg = has_right ? right_neg[R+l] : 0;
+    int r_opt_pos = has_right ? opt_pos[R+l] : 0;
+    int r_opt_neg = has_right ? opt_neg[R+l] : 0;
+    int r_start = has_right ? optimal_start[R+l] : node_first;
+    int r_end = has_right ? optimal_end[R+l] : node_last;
+
+    /* Helper::maximum_of_3(VLx, VRx, VLr + VRl) */
+    int a = optimal_sum[L+l], b = r_optimal, c = right_sum[L+l] + r_left;
+    bool left_path = (a >= b) && (a >= c);
+    bool right_path = (a < b) && (b >= c);
+
+    optimal_sum[x] = left_path ? a : (right_path ? b : c);
+    optimal_start[x] = right_path ? r_start : optimal_start[L+l];
+    optimal_end[x] = left_path ? optimal_end[L+l] : r_end;
+    opt_pos[x] = left_path ? opt_pos[L+l] : (right_path ? r_opt_pos : right_pos[L+l] + r_left_pos);
+    opt_neg[x] = left_path ? opt_neg[L+l] : (right_path ? r_opt_neg : right_neg[L+l] + r_left_neg);
+    left_pos[x] = left_path ? left_pos[L+l] : total_pos[L+l] + r_left_pos;
+    left_neg[x] = left_path ? left_neg[L+l] : total_neg[L+l] + r_left_neg;
+    right_pos[x] = right_path ? r_right_pos : right_pos[L+l] + r_total_pos;
+    right_neg[x] = right_path ? r_right_neg : right_neg[L+l] + r_total_neg;
+
+    left_sum[x] = (left_sum[L+l] >= total_sum[L+l] + r_left) ? left_sum[L+l] : total_sum[L+l] + r_left;
+    right_sum[x] = (r_right >= r_total + right_sum[L+l]) ? r_right : r_total + right_sum[L+l];
+
+    total_sum[x] = total_sum[L+l] + r_total;
+    total_pos[x] = total_pos[L+l] + r_total_pos;
+    total_neg[x] = total_neg[L+l] + r_total_neg;
   }
-  else {
-    this->right_sum = right_total + left->right_sum;
-  }
-  
-  // Updating totals
-  this->total_sum = left->total_sum + right_total;
-  this->total_pos = left->total_pos;
-  this->total_neg = left->total_neg;
-  if(right) {
-    this->total_pos += right->total_pos;
-    this->total_neg += right->total_neg;
-  }
-
-  left->reset_node(true);
-  if(right)
-    right->reset_node(true);
 }
 
 /*
- * Print out tree contents
+ * Recomputes node 'i' of level 'h' and its descendants if leaves below it changed since the last update
  */
-void discrete_binary_tree::print_tree(Datset *ds, std::vector<int> &iv, int att) {
-  printf("%d-%d, (%d-%d), %d %d, %d %d(%d %d)\n", this->first, this->last, this->optimal_start, this->optimal_end, (int)this->optimal_sum,
-         (int)this->total_sum, this->total_pos, this->total_neg, this->opt_pos, this->opt_neg);
-  if(left_child)
-    ((discrete_binary_tree *)left_child)->print_tree(ds, iv, att);
-  if(right_child)
-    ((discrete_binary_tree *)right_child)->print_tree(ds, iv, att);
-}
+void multi_class_tree::update_dirty(int h, int i) {
+  int k = tree->get_level_start(h) + i;
+  if(!tree->is_dirty(k))
+    return;
+  tree->clear_dirty(k);
+
+  if(h == 0) {
+    update_leaf(k);
+    return;
+  }
 
-static int get_sum(const std::vector<int> & vec) {
-  int sum = 0;
-  for(unsigned int i=0; i<vec.size(); i++)
-    sum += vec[i];
-  return sum;
+  int left = tree->get_left_child(h, i);
+  int right = tree->get_right_child(h, i);
+  update_dirty(h-1, 2*i);
+  if(right >= 0)
+    update_dirty(h-1, 2*i+1);
+  update_node(k, left, right);
 }
 
 /*
- * Traverse through all leaf nodes (without traversing entire tree)
- * Change pos = counts for 'class' type.
- * Change neg = counts for other types.
+ * Computes optimal range for each of 'classes' from the class distributions currently at the leaves
+ * Only nodes above changed leaves are recomputed, unless the classes differ from the last update.
  */
-void discrete_binary_tree::set_leaves_pos(std::vector<btree_node *> & leaves, int class_label) {
-  int i=0, gsize = leaves.size();
-  for(i=0; i<gsize; i++) {
-    discrete_binary_tree *node = (discrete_binary_tree *)leaves[i];
-    const std::vector<int> & vec = node->get_label_dyv();
-    int pos = vec[class_label];
-    int neg = get_sum(vec) - pos;
-    int net = pos - neg;
-    node->total_sum = net;
-    node->optimal_sum = net;
-    node->left_sum = net;
-    node->right_sum = net;
-    node->total_pos = node->right_pos = node->left_pos = node->opt_pos = pos;
-    node->total_neg = node->right_neg = node->left_neg = node->opt_neg = neg;
+void multi_class_tree::update_tree(std::vector<int> &classes) {
+  int levels = tree->get_num_levels();
+
+  if(computed && classes == this->classes) {
+    update_dirty(levels-1, 0);
+    return;
   }
+
+  /* Level by level from the leaves, so children are always done before their parent */
+  this->classes = classes;
+  for(int h=0; h<levels; h++) {
+    int start = tree->get_level_start(h);
+    int size = tree->get_level_size(h);
+    for(int i=0; i<size; i++) {
+      int k = start + i;
+      tree->clear_dirty(k);
+      if(h == 0)
+        update_leaf(k);
+      else
+        update_node(k, tree->get_left_child(h, i), tree->get_right_child(h, i));
+    }
+  }
+  computed = true;
 }
 
 /*
- * Function to insert new value at the correct leaf node
+ * Resets counts of all nodes which had data added since the last reset, followed by the same for the tree
  */
-void discrete_binary_tree::insert_entry(double score) {
-  int label = (int)score;
-  (label_dyv[label])++;
+void multi_class_tree::reset_tree() {
+  const std::vector<int> & nodes = tree->get_touched_nodes();
+  for(unsigned int gs=0; gs<nodes.size(); gs++) {
+    int k = nodes[gs];
+    reset_node(k);
+    count[k] = 0;
+  }
+  tree->reset_touched();
 }
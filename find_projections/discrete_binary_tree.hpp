@@ -13,71 +13,97 @@
 
 /*
  * Binary tree data structure for representing all the values of a dimension at the leaves.
- * The tree has aggregated counts representing which contiguous block of indices (start - end) result in highest summing box (positives - negatives).
+ * Holds the class distribution of points in each leaf. Optimal ranges for the classes are computed by multi_class_tree.
  */
-class discrete_binary_tree : public btree_node {
+class discrete_binary_tree : public btree {
 private:
-  int total_pos, total_neg;        /* Total pos and neg labels at that node */
-  int opt_pos, opt_neg;            /* Total optimal pos and neg labels at that node */
-  int left_pos, left_neg;          /* Total pos and neg labels at that node for left optimal half */
-  int right_pos, right_neg;        /* Total pos and neg labels at that node for right optimal half */
-  std::vector<int> label_dyv;      /* NULL for non-leaf nodes. Contains class distribution of points in this leaf */
+  int arity;
+  std::vector<int> label_counts;   /* Class distribution of points in each leaf, at [leaf*arity + class] */
+  std::vector<int> leaf_total;     /* No. of points in each leaf */
  public:
-  std::vector<int> & get_label_dyv();
- 
-  std::string get_name();
-
-  int get_total() { return total_pos + total_neg; }
-
   /*
-   * Reset tree counts 
+   * Constructor
    */
-  void reset_node(bool exclude_leaves);
+  discrete_binary_tree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size);
 
-  int get_opt_pos() { return opt_pos; }
-  int get_opt_neg() { return opt_neg; }
+  ~discrete_binary_tree();
 
-  /*
-   * Update a parent node.
-   * Vx (optimal_sum) = max(VLx, VRx, VLr + VRl)
-   * Vl (left_sum) = max(VLl, VLtotal + VRl)
-   * Vr (right_sum) = max(VRr, VRtotal + VLr)
-   * Vtotal (total_sum) = VLtotal + VRtotal
-   */
-  void update_node();
+  int get_arity() { return arity; }
+
+  /* Class distribution of points in leaf 'leaf' */
+  const int *get_label_counts(int leaf) { return &label_counts[leaf * arity]; }
+
+  int get_leaf_total(int leaf) { return leaf_total[leaf]; }
 
   /*
-   * Constructor
+   * Adds rows at positions iv[start] to iv[end-1] of train_rows to the class distributions of their leaves
    */
-  discrete_binary_tree(int first, int last, double end_value, int arity);
+  void insert_rows(Datset &ds, std::vector<int> &train_rows, std::vector<int> &iv, int start, int end) {
+    for(int k=start; k<end; k++) {
+      int p = iv[k];
+      int leaf = get_leaf(p);
+      label_counts[leaf * arity + ds.ds_class_ref(train_rows[p])]++;
+      leaf_total[leaf]++;
+      mark_dirty(leaf);
+    }
+  }
 
   /*
-   * Constructor for creating parent node from child nodes
-   * right_child may be NULL
+   * Reset class distributions of the leaves which had data added since the last reset
    */
-  discrete_binary_tree(btree_node *left_child, btree_node *right_child);
+  void reset_touched();
+};
 
-  /*
- * Destructor
+/*
+ * Counts for all classes at once over the nodes of a discrete_binary_tree.
+ * Finds the highest summing range (class 'l' +ve, everything else -ve) for every class in a single pass over the tree.
+ * Values for the s-th class being evaluated at node 'k' are at [k*arity + s].
+ * Uses the dirty/touched marks of the tree to only recompute nodes above changed leaves.
  */
-  ~discrete_binary_tree();
+class multi_class_tree {
+private:
+  discrete_binary_tree *tree;
+  int arity;
+  bool computed;                                   /* False until all nodes are computed for 'classes' */
+  std::vector<int> classes;                        /* Classes being evaluated */
+  std::vector<int> count;                          /* Total data at the node */
+
+  /* Per class aggregates of each node */
+  std::vector<int> optimal_sum, total_sum, left_sum, right_sum;
+  std::vector<int> optimal_start, optimal_end;
+  std::vector<int> opt_pos, opt_neg, total_pos, total_neg;
+  std::vector<int> left_pos, left_neg, right_pos, right_neg;
 
+  void update_leaf(int k);
+  void update_node(int k, int left, int right);
+  void update_dirty(int h, int i);
+  void reset_node(int k);
+public:
   /*
-   * Traverse through all leaf nodes (without traversing entire tree)
-   * Change pos = counts for 'class' type.
-   * Change neg = counts for other types.
+   * Constructor
    */
-  static void set_leaves_pos(std::vector<btree_node *> & leaves, int class_label);
+  multi_class_tree(discrete_binary_tree *tree);
 
   /*
-   * Function to insert new value at the correct leaf node
+   * Computes optimal range for each of 'classes' from the class distributions currently at the leaves
+   * Results for classes[s] are then returned by the getters below for 's'
    */
-  void insert_entry(double score);
+  void update_tree(std::vector<int> &classes);
 
   /*
-   * Print out tree contents
+   * Resets counts of all nodes which had data added since the last reset, followed by the same for the tree
    */
-  void print_tree(Datset *ds, std::vector<int> &iv, int att);
+  void reset_tree();
+
+  int get_opt_pos(int s) { return opt_pos[root_offset() + s]; }
+  int get_opt_neg(int s) { return opt_neg[root_offset() + s]; }
+
+  /* Returns the optimal start, end index of classes[s] for the entire tree */
+  int get_node_optimal_start(int s) { return optimal_start[root_offset() + s]; }
+  int get_node_optimal_end(int s) { return optimal_end[root_offset() + s]; }
+
+private:
+  int root_offset() { return tree->get_root() * arity; }
 };
 
 #endif
@@ -10,7 +10,11 @@
 #define FMAP_H_
 
 #include "projection.hpp"
+#include "discrete_projection.hpp"
+#include "numeric_projection.hpp"
 #include <vector>
+#include <map>
+#include <algorithm>
 
 /*
  * Container for all the projection boxes found in a pair of attributes.
@@ -27,94 +31,327 @@ public:
   prlist() {}
 };
 
+/*
+ * One box of a search, for passing search results between processes. Laid out as feature_map.BOX_DTYPE.
+ * bounds - att1 start, att1 end, att2 start, att2 end
+ * metric - Class label (discrete output) or mean (numeric output)
+ * sum_sq_error - Sum of squared error (0 for discrete output)
+ * counts - Total data in the box, and of its class (-1 for numeric output)
+ */
+typedef struct search_record {
+  int att1, att2;
+  double bounds[4];
+  double metric, coverage, sum_sq_error;
+  int counts[2];
+}search_record;
+
+/*
+ * Score of a box when keeping only the best boxes of a search (higher is better)
+ */
+typedef double (*box_score)(projection *pr);
+
+/*
+ * Box kept by a feature_map in top-k mode.
+ * Ordered best first : higher score, then lower pair index, then earlier in its pair's list,
+ * so the boxes kept do not depend on the order threads finish their pairs in.
+ */
+typedef struct ranked_box {
+  double score;
+  int pair, position;
+  projection *pr;
+
+  bool operator<(const ranked_box &other) const {
+    if(score != other.score)
+      return score > other.score;
+    if(pair != other.pair)
+      return pair < other.pair;
+    return position < other.position;
+  }
+}ranked_box;
+
 /*
  * Container for all the projection boxes found in the data.
+ * Only attribute pairs with boxes take up space. In top-k mode only the 'top_k' best boxes by 'score' are kept,
+ * in a heap, and the others are deleted as they are added.
+ * Boxes are numbered in order of attribute pair (i, j), or best first in top-k mode.
  */
 class feature_map {
 private:
   int atts;
-  std::vector<prlist> table;
+  std::map<int, prlist> table;        /* Boxes of each attribute pair, by index i*atts + j */
+  prlist empty;
+  int num_projections;
+  int top_k;                          /* No. of boxes to keep (0 to keep all) */
+  box_score score;
+  std::vector<ranked_box> heap;       /* Top-k mode : best boxes so far, worst on top */
+  std::vector<projection *> order;    /* All boxes in order, made on first access */
+  pthread_mutex_t mutex;              /* Search threads add boxes concurrently */
+
+  /*
+   * Top-k mode : keeps boxes of 'list' better than the worst kept box, deleting the rest
+   */
+  void keep_best(int pair, prlist &list) {
+    for(int k=0; k<list.size(); k++) {
+      ranked_box box;
+      box.score = score(list.get(k));
+      box.pair = pair;
+      box.position = k;
+      box.pr = list.get(k);
+      if((int)heap.size() < top_k) {
+        heap.push_back(box);
+        std::push_heap(heap.begin(), heap.end());
+      }
+      else if(box < heap.front()) {
+        delete heap.front().pr;
+        std::pop_heap(heap.begin(), heap.end());
+        heap.back() = box;
+        std::push_heap(heap.begin(), heap.end());
+      }
+      else
+        delete box.pr;
+    }
+    num_projections = heap.size();
+  }
+
+  void mk_order() {
+    if((int)order.size() == num_projections)
+      return;
+    order.clear();
+    if(top_k > 0) {
+      std::vector<ranked_box> ranked = heap;
+      std::sort(ranked.begin(), ranked.end());
+      for(unsigned int k=0; k<ranked.size(); k++)
+        order.push_back(ranked[k].pr);
+    }
+    else {
+      for(std::map<int, prlist>::iterator it = table.begin(); it != table.end(); ++it) {
+        for(int k=0; k<it->second.size(); k++)
+          order.push_back(it->second.get(k));
+      }
+    }
+  }
 public:
-  feature_map(int atts) {
-    this->atts = atts;
-    int total = atts * atts;
-    table.resize(total);
+  /*
+   * top_k - Keep only the best 'top_k' boxes by 'score' (0 to keep all)
+   */
+  feature_map(int atts, int top_k = 0, box_score score = NULL) : atts(atts), num_projections(0), top_k(top_k), score(score) {
+    if(!score)
+      this->top_k = 0;
+    pthread_mutex_init(&mutex, NULL);
   }
   
-  feature_map() {
+  feature_map() : atts(0), num_projections(0), top_k(0), score(NULL) {
+    pthread_mutex_init(&mutex, NULL);
   }
 
   ~feature_map() { 
-    for(unsigned int j=0; j<table.size(); j++) {
-      prlist vec = table[j];
+    for(std::map<int, prlist>::iterator it = table.begin(); it != table.end(); ++it) {
+      prlist &vec = it->second;
       for(int i = vec.size()-1; i>=0; i--) {
 	projection *pr = vec.get(i);
 	delete pr;
       }
     }
+    for(unsigned int k=0; k<heap.size(); k++)
+      delete heap[k].pr;
+    pthread_mutex_destroy(&mutex);
   }
-    
+
+  /*
+   * Boxes of attribute pair (i, j). Always empty in top-k mode.
+   */
   prlist& getListOfProjections(int i, int j) {
-    int index = i*atts + j;
-    return table[index];
+    std::map<int, prlist>::iterator it = table.find(i*atts + j);
+    if(it == table.end())
+      return empty;
+    return it->second;
   }
   
+  /*
+   * Adds the boxes of attribute pair (i, j), taking ownership of them. Safe to call from several threads.
+   */
   void setProjections(int i, int j, prlist & pr_array) {
-    prlist *ptr = table.data();
+    if(pr_array.size() == 0)
+      return;
     int index = i *atts + j;
-    ptr[index] = pr_array;
+    pthread_mutex_lock(&mutex);
+    if(top_k > 0)
+      keep_best(index, pr_array);
+    else {
+      prlist &slot = table[index];
+      num_projections += pr_array.size() - slot.size();
+      slot = pr_array;
+    }
+    order.clear();
+    pthread_mutex_unlock(&mutex);
   }
 
   void print_projections() {
-    for(unsigned int j=0; j<table.size(); j++) {
-      prlist vec = table[j];
-      for(int i = 0; i<vec.size(); i++) {
-	projection *pr = vec.get(i);
-	pr->pprojection();
-      }
-    }
+    mk_order();
+    for(unsigned int i = 0; i<order.size(); i++)
+      order[i]->pprojection();
   }
 
   int get_num_projections() {
-    int sum = 0;
-    for(unsigned int j=0; j<table.size(); j++) {
-      prlist vec = table[j];
-      sum += vec.size();
-    }
-    return sum;
+    return num_projections;
   }
 
   projection *get_projection(int i) {
-    if(i < 0)
+    if(i < 0 || i >= num_projections)
       return NULL;
+    mk_order();
+    return order[i];
+  }
 
-    int sum = 0;
-    projection *pr = NULL;
-    for(unsigned int j=0; j<table.size(); j++) {
-      prlist vec = table[j];
-      if(vec.size() == 0)
-        continue;
-      if(i >= sum && i < sum + vec.size()) {
-        pr = vec.get(i-sum);
-        break;
+  /*
+   * Writes all boxes, in order, to 'out' (room for get_num_projections() records)
+   */
+  void fill_records(search_record *out) {
+    mk_order();
+    for(unsigned int k=0; k<order.size(); k++) {
+      projection *pr = order[k];
+      search_record &record = out[k];
+      record.att1 = pr->get_att1();
+      record.att2 = pr->get_att2();
+      record.bounds[0] = pr->get_att1_start();
+      record.bounds[1] = pr->get_att1_end();
+      record.bounds[2] = pr->get_att2_start();
+      record.bounds[3] = pr->get_att2_end();
+      record.metric = pr->get_projection_metric();
+      record.coverage = pr->get_coverage();
+      record.counts[0] = pr->get_total();
+
+      discrete_projection *dpr = dynamic_cast<discrete_projection *>(pr);
+      numeric_projection *npr = dynamic_cast<numeric_projection *>(pr);
+      record.counts[1] = dpr ? dpr->get_pos() : -1;
+      record.sum_sq_error = npr ? npr->get_sum_sq_error() : 0;
+    }
+  }
+
+  void print_projections_to_file(FILE *fp) {
+    mk_order();
+    for(unsigned int i = 0; i<order.size(); i++) {
+      if(i == 0)
+        order[i]->print_header_row(fp);
+      order[i]->pprojection_for_file(fp);
+    }
+  }
+};
+
+/*
+ * Layout of one box of a saved decision list. Matches feature_map.MODEL_DTYPE
+ * bounds - att1 start, att1 end, att2 start, att2 end
+ * counts - Total data in the box, and of its class (-1 for numeric output)
+ */
+typedef struct box_record {
+  int att1, att2;
+  double bounds[4];
+  double metric, coverage;
+  int counts[2];
+}box_record;
+
+/*
+ * Bounds and metrics of the boxes of a decision list, for scoring rows without the projection objects
+ */
+class decision_list {
+private:
+  std::vector<int> att1, att2;
+  std::vector<double> start1, end1, start2, end2, metric;
+
+  /*
+   * Checks that 'object' is a contiguous 1-d array of 'rows' values of type 'type'. Returns its data.
+   */
+  static void *result_data(PyObject *object, int rows, int type, const char *error) {
+    PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
+    if(!PyArray_Check(object) || PyArray_NDIM(array) != 1 || PyArray_TYPE(array) != type ||
+       !PyArray_IS_C_CONTIGUOUS(array) || !PyArray_ISWRITEABLE(array) || PyArray_DIM(array, 0) != rows) {
+      PyErr_SetString(PyExc_ValueError, error);
+      p::throw_error_already_set();
+    }
+    return PyArray_DATA(array);
+  }
+
+  void add(int a1, int a2, double s1, double e1, double s2, double e2, double m) {
+    att1.push_back(a1);
+    att2.push_back(a2);
+    start1.push_back(s1);
+    end1.push_back(e1);
+    start2.push_back(s2);
+    end2.push_back(e2);
+    metric.push_back(m);
+  }
+public:
+  /*
+   * Boxes of the first 'size' projections of 'vec'
+   */
+  decision_list(std::vector<projection *> &vec, int size) {
+    for(int k=0; k<size; k++) {
+      projection *pr = vec[k];
+      add(pr->get_att1(), pr->get_att2(), pr->get_att1_start(), pr->get_att1_end(),
+          pr->get_att2_start(), pr->get_att2_end(), pr->get_projection_metric());
+    }
+  }
+
+  /*
+   * Boxes of 'records', a contiguous 1-d NumPy array of box_record (feature_map.MODEL_DTYPE)
+   */
+  decision_list(PyObject *records) {
+    PyArrayObject *array = reinterpret_cast<PyArrayObject *>(records);
+    if(!PyArray_Check(records) || PyArray_NDIM(array) != 1 || !PyArray_IS_C_CONTIGUOUS(array) ||
+       PyArray_ITEMSIZE(array) != (int)sizeof(box_record)) {
+      PyErr_SetString(PyExc_ValueError, "Records should be a contiguous 1-d array of decision list boxes");
+      p::throw_error_already_set();
+    }
+
+    int size = PyArray_DIM(array, 0);
+    const box_record *box = reinterpret_cast< const box_record * >( PyArray_DATA(array) );
+    for(int k=0; k<size; k++, box++) {
+      if(box->att1 < 0 || box->att2 < 0) {
+        PyErr_SetString(PyExc_ValueError, "Decision list boxes should have attribute numbers of at least 0");
+        p::throw_error_already_set();
       }
-      sum += vec.size();
+      add(box->att1, box->att2, box->bounds[0], box->bounds[1], box->bounds[2], box->bounds[3], box->metric);
     }
+  }
 
-    return pr;
+  int get_num_projections() {
+    return att1.size();
   }
 
-  void print_projections_to_file(FILE *fp) {
-    bool first_printed = false;
-    for(unsigned int j=0; j<table.size(); j++) {
-      prlist vec = table[j];
-      for(int i = 0; i<vec.size(); i++) {
-	projection *pr = vec.get(i);
-	if(!first_printed) {
-	  pr->print_header_row(fp);
-	  first_printed = true;
-	}
-	pr->pprojection_for_file(fp);
+  /*
+   * Scores all rows of 'ds' against the decision list in a single call.
+   * Only the first 'num' boxes are used (all of them if num < 0).
+   * index (int32 array) - Position of the first box containing each row (-1 if none)
+   * value (float64 array) - Metric of that box (0 if none)
+   * Raises ValueError if the arrays do not hold one value per row, or a box uses an attribute 'ds' does not have.
+   */
+  void find_first_match(Datset &ds, int num, PyObject *index, PyObject *value) {
+    int rows = ds.get_rows();
+    int *index_ptr = reinterpret_cast< int * >( result_data(index, rows, NPY_INT,
+                                                            "Index should be a contiguous 1-d int32 array, one per row") );
+    double *value_ptr = reinterpret_cast< double * >( result_data(value, rows, NPY_DOUBLE,
+                                                                  "Value should be a contiguous 1-d float64 array, one per row") );
+    int size = (num < 0 || num > (int)att1.size()) ? att1.size() : num;
+    for(int k=0; k<size; k++) {
+      if(att1[k] >= ds.get_cols() || att2[k] >= ds.get_cols()) {
+        PyErr_SetString(PyExc_ValueError, "Decision list uses more attributes than the Datset has");
+        p::throw_error_already_set();
+      }
+    }
+
+    for(int i=0; i<rows; i++) {
+      index_ptr[i] = -1;
+      value_ptr[i] = 0;
+      for(int k=0; k<size; k++) {
+        double value1 = ds.ds_real_ref(i, att1[k]);
+        if(value1 < start1[k] || value1 > end1[k])
+          continue;
+        double value2 = ds.ds_real_ref(i, att2[k]);
+        if(value2 < start2[k] || value2 > end2[k])
+          continue;
+        index_ptr[i] = k;
+        value_ptr[i] = metric[k];
+        break;
       }
     }
   }
@@ -127,14 +364,23 @@ public:
 class projection_array {
 private:
   std::vector<projection *> vec;
+  bool partial;                    /* Search stopped before it ran out of boxes */
 public:
-  projection_array() {
+  projection_array() : partial(false) {
   }
   
-  projection_array(std::vector<projection *> & prvec) {
+  projection_array(std::vector<projection *> & prvec) : partial(false) {
     this->vec = prvec;
   } 
 
+  void set_partial(bool partial) {
+    this->partial = partial;
+  }
+
+  bool is_partial() {
+    return partial;
+  }
+
   ~projection_array() {
     for(int i = vec.size()-1; i>=0; i--) {
       projection *pr = vec[i];
@@ -163,6 +409,20 @@ public:
       return NULL;
     return vec[i];
   }
+
+  /*
+   * Scores all rows of 'ds' against the decision list in a single call.
+   * Only the first 'num' projections are used (all of them if num < 0).
+   * index (int32 array) - Position of the first projection containing each row (-1 if none)
+   * value (float64 array) - Projection metric of that projection (0 if none)
+   */
+  void find_first_match(Datset &ds, int num, PyObject *index, PyObject *value) {
+    int size = (num < 0 || num > (int)vec.size()) ? vec.size() : num;
+
+    /* Copy out the box bounds once so that the row loop makes no virtual calls */
+    decision_list boxes(vec, size);
+    boxes.find_first_match(ds, size, index, value);
+  }
 };
 
 #endif
@@ -1,4 +1,5 @@
 import libfind_projections
+import numpy as np
 
 class FeatureMap:
     """
@@ -20,3 +21,165 @@ class FeatureMap:
         if ( i <  0 ) :
             return None
         return self.fmap.get_projection(i)
+
+    """
+    True if the search learning this decision list stopped (on its timeout or round limit) before it ran out of boxes
+    """
+    def is_partial(self):
+        return self.fmap.is_partial()
+
+    """
+    Scores all rows of Datset 'ds' against the first 'num' projection boxes (all if num is -1) of a decision list.
+    Returns NumPy arrays holding the index of the first box containing each row (-1 if none) and that box's metric
+    """
+    def find_first_match(self, ds, num=-1):
+        rows = ds.getSize()
+        index = np.empty(rows, dtype=np.intc)
+        value = np.empty(rows, dtype=float)
+        self.fmap.find_first_match(ds.ds, num, index, value)
+        return index, value
+
+    """
+    Returns the first 'num' projection boxes (all if num is -1) as a NumPy structured array of MODEL_DTYPE
+    """
+    def to_records(self, num=-1):
+        size = self.get_num_projections()
+        if num >= 0:
+            size = min(num, size)
+        records = np.zeros(size, dtype=MODEL_DTYPE)
+        for i in range(size):
+            pr = self.get_projection(i)
+            pos = pr.get_pos() if hasattr(pr, 'get_pos') else -1
+            records[i] = (pr.get_att1(), pr.get_att2(),
+                          (pr.get_att1_start(), pr.get_att1_end(), pr.get_att2_start(), pr.get_att2_end()),
+                          pr.get_projection_metric(), pr.get_coverage(), (pr.get_total(), pos))
+        return records
+
+# One box of a search result, as passed between search processes. Laid out as search_record in feature_map.hpp.
+# metric - Class label (discrete output) or mean (numeric output), sse - Sum of squared error (numeric output)
+BOX_DTYPE = np.dtype([('att1', '<i4'), ('att2', '<i4'), ('bounds', '<f8', (4,)), ('metric', '<f8'),
+                      ('coverage', '<f8'), ('sse', '<f8'), ('counts', '<i4', (2,))])
+
+# Orders for keeping only the best boxes of search_projections(), as passed to the native search
+# purity - Lower confidence bound of purity (discrete output), support - No. of data points,
+# sse - Lowest sum of squared error (numeric output)
+RANK_BY = {'purity': 0, 'support': 1, 'sse': 2}
+
+# Version of the saved decision list format, stored in its header
+MODEL_VERSION = 1
+
+MODEL_MAGIC = b'FPDL'
+
+# Header of a saved decision list, followed by 'num_boxes' records of MODEL_DTYPE
+HEADER_DTYPE = np.dtype([('magic', 'S4'), ('version', '<u4'), ('num_boxes', '<u8'), ('default_value', '<f8')])
+
+# One box of a decision list, in order. Laid out as box_record in feature_map.hpp.
+# bounds - att1 start, att1 end, att2 start, att2 end
+# counts - Total data in the box, and of its class (-1 for numeric output)
+MODEL_DTYPE = np.dtype([('att1', '<i4'), ('att2', '<i4'), ('bounds', '<f8', (4,)), ('metric', '<f8'),
+                        ('coverage', '<f8'), ('counts', '<i4', (2,))])
+
+class DecisionList:
+    """
+    Fitted decision list of projection boxes, held as a NumPy structured array of MODEL_DTYPE.
+    Rows are scored by a native predictor built directly from the records, so a loaded or unpickled
+    model predicts without rebuilding the projection objects.
+    """
+    def __init__(self, records, default_value=None):
+        records = np.ascontiguousarray(records)
+        if records.dtype != MODEL_DTYPE or records.ndim != 1:
+            raise ValueError("Records should be a 1-d array of MODEL_DTYPE")
+        self.records = records
+        self.default_value = default_value
+        self.dlist = libfind_projections.decision_list(records)
+
+    """
+    Decision list of the first 'num' boxes (all if num is -1) of FeatureMap 'fmap'
+    """
+    @classmethod
+    def from_feature_map(cls, fmap, num=-1, default_value=None):
+        return cls(fmap.to_records(num), default_value)
+
+    """
+    Decision list of boxes given as (att1, att2, start1, start2, end1, end2, metric) tuples
+    """
+    @classmethod
+    def from_tuples(cls, boxes, default_value=None):
+        records = np.zeros(len(boxes), dtype=MODEL_DTYPE)
+        for i, (att1, att2, start1, start2, end1, end2, metric) in enumerate(boxes):
+            records[i] = (att1, att2, (start1, end1, start2, end2), metric, 0, (0, -1))
+        return cls(records, default_value)
+
+    """
+    Returns the total number of projection boxes in the decision list
+    """
+    def get_num_projections(self):
+        return len(self.records)
+
+    """
+    Scores all rows of Datset 'ds' against the first 'num' boxes (all if num is -1).
+    Returns NumPy arrays holding the index of the first box containing each row (-1 if none) and that box's metric
+    """
+    def find_first_match(self, ds, num=-1):
+        rows = ds.getSize()
+        index = np.empty(rows, dtype=np.intc)
+        value = np.empty(rows, dtype=float)
+        self.dlist.find_first_match(ds.ds, num, index, value)
+        return index, value
+
+    def _header(self):
+        header = np.zeros(1, dtype=HEADER_DTYPE)
+        header[0] = (MODEL_MAGIC, MODEL_VERSION, len(self.records),
+                     np.nan if self.default_value is None else self.default_value)
+        return header
+
+    """
+    Returns the decision list in the saved model format
+    """
+    def to_bytes(self):
+        return self._header().tobytes() + self.records.tobytes()
+
+    """
+    Saves the decision list to file 'path'
+    """
+    def save(self, path):
+        with open(path, 'wb') as f:
+            f.write(self._header().tobytes())
+            f.write(self.records.tobytes())
+
+    """
+    Decision list from bytes in the saved model format
+    """
+    @classmethod
+    def from_bytes(cls, buf):
+        num, default_value = _check_header(np.frombuffer(buf, dtype=HEADER_DTYPE, count=1)[0])
+        records = np.frombuffer(buf, dtype=MODEL_DTYPE, count=num, offset=HEADER_DTYPE.itemsize)
+        return cls(records, default_value)
+
+    """
+    Loads a decision list saved to file 'path'. The boxes are memory-mapped unless mmap is False.
+    """
+    @classmethod
+    def load(cls, path, mmap=True):
+        if not mmap:
+            with open(path, 'rb') as f:
+                return cls.from_bytes(f.read())
+
+        num, default_value = _check_header(np.fromfile(path, dtype=HEADER_DTYPE, count=1)[0])
+        if num == 0:
+            return cls(np.zeros(0, dtype=MODEL_DTYPE), default_value)
+        records = np.memmap(path, dtype=MODEL_DTYPE, mode='r', offset=HEADER_DTYPE.itemsize, shape=(num,))
+        return cls(records, default_value)
+
+    def __reduce__(self):
+        return (DecisionList.from_bytes, (self.to_bytes(),))
+
+def _check_header(header):
+    if header['magic'] != MODEL_MAGIC:
+        raise ValueError("Not a saved decision list")
+    if header['version'] > MODEL_VERSION:
+        raise ValueError("Unsupported decision list format version %d" % header['version'])
+    default_value = float(header['default_value'])
+    if np.isnan(default_value):
+        default_value = None
+    return int(header['num_boxes']), default_value
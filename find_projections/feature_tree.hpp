@@ -10,17 +10,79 @@
 #define FTREE_H_
 
 #include "binary_tree.hpp"
+#include "helper.hpp"
 #include <vector>
 
-class indices {
+/*
+ * Enumerates the valid row subsets (m, n) of the sorted values 'iv' of attribute 'att' one at a time.
+ * Subsets start and end every 'bin_size' rows, in increasing order of 'm' and then 'n'.
+ * Duplicates are put in same bin
+ */
+class range_iterator {
 private:
+  Datset &ds;
+  std::vector<int> &iv;
+  std::vector<int> &train_rows;
+  int att, bin_size, rows;
   int m, n;
+  double start_value;
+
+  double value(int k) { return ds.ds_real_ref(train_rows[iv[k]], att); }
+
+  /*
+   * Moves start 'm' past values duplicating the end of the previous bin
+   */
+  void start_bin() {
+    start_value = value(m);
+    double last_bin_value = -1;
+    if(m-1 >= 0)
+      last_bin_value = value(m-1);
+    while(m-1 >= 0 && m < rows-1) {
+      if(start_value - last_bin_value < MIN_DOUBLE) {
+        m++;
+        start_value = value(m);
+      }
+      else
+        break;
+    }
+    n = m;
+  }
 public:
-  indices(int m, int n) : m(m), n(n) {
+  range_iterator(Datset &ds, std::vector<int> &iv, std::vector<int> &train_rows, int att, int bin_size) :
+    ds(ds), iv(iv), train_rows(train_rows), att(att), bin_size(bin_size), rows(iv.size()), m(0), n(0) {
+    if(rows > 0)
+      start_bin();
   }
 
-  int getm() { return m;}
-  int getn() { return n;}
+  /*
+   * Sets the next row subset in 'pm', 'pn'. Returns false when there are no more
+   */
+  bool next(int *pm, int *pn) {
+    while(m < rows) {
+      for(n+=bin_size; n<rows; n+=bin_size) {
+        double end_value = value(n);
+        if(end_value - start_value < MIN_DOUBLE)
+          continue;
+
+        /* Try to advance index for duplicates/very very close values */
+        for(int ns=n+1; ns<rows; ns++) {
+          if(value(ns) - end_value < MIN_DOUBLE)
+            n++;
+          else
+            break;
+        }
+
+        *pm = m;
+        *pn = n;
+        return true;
+      }
+
+      m += bin_size;
+      if(m < rows)
+        start_bin();
+    }
+    return false;
+  }
 };
 
 /*
@@ -29,50 +91,36 @@ public:
 class feature_tree {
 private:
   int atts;
-  std::vector<btree_node *> table;
-  std::vector<std::vector<btree_node *> *> leaves;
-  std::vector<std::vector<indices> *> indices_vec;
+  std::vector<btree *> table;
 public:
   feature_tree(int atts) {
     this->atts = atts;
     table.resize(atts);
-    leaves.resize(atts);
-    indices_vec.resize(atts);
   }
   
   ~feature_tree() { 
     for(unsigned int j=0; j<table.size(); j++) {
-      btree_node *btn = table[j];
+      btree *btn = table[j];
       delete btn;
-      delete leaves[j];
-      delete indices_vec[j];
     }
   }
+
+  /*
+   * Deletes binary tree for attribute 'i'
+   */
+  void release(int i) {
+    delete table[i];
+    table[i] = NULL;
+  }
     
-  btree_node *getTree(int i) {
+  btree *getTree(int i) {
     return table[i];
   }
   
-  void setTree(int i, btree_node *btn) {
-    btree_node **ptr = table.data();
+  void setTree(int i, btree *btn) {
+    btree **ptr = table.data();
     ptr[i] = btn;
   }
-
-  std::vector<btree_node *> *getLeaves(int i) {
-    return leaves[i];
-  }
-   
-  void setLeaves(int i, std::vector<btree_node *> *leaves) {
-    this->leaves[i] = leaves;
-  }
-
-  std::vector<indices> *getIndices(int i) {
-    return indices_vec[i];
-  }
-   
-  void setIndices(int i, std::vector<indices> *indices_vec) {
-    this->indices_vec[i] = indices_vec;
-  }
 };
 
 #endif
@@ -1,5 +1,6 @@
 #include "helper.hpp"
 #include <algorithm>
+#include <chrono>
 
 struct object {
   double val;
@@ -18,7 +19,7 @@ std::vector<int> *sort_indexes(const std::vector<double> &v) {
     idx[i].index = i;
   }
 
-  std::sort(idx.begin(), idx.end(), cmp);
+  std::stable_sort(idx.begin(), idx.end(), cmp);
   
   std::vector<int> *indices = new std::vector<int>(v.size());
   for(unsigned int i=0; i<v.size(); i++) 
@@ -37,25 +38,35 @@ void vector_copy(std::vector<int> &a, std::vector<int> &b) {
 /*
  * Sort all dataset attributes except for label.
  * Store indices of sorted values
+ * Filters the sorted order of all rows cached in 'ds' down to 'train_rows', O(rows) per attribute.
+ * Tied values keep row order, and repeats of a row keep their order in 'train_rows'.
  */
-indices_array *Helper::mk_indices_array_sorted_values(Datset &ds, std::vector<int> &train_rows) {
+indices_array *Helper::mk_indices_array_sorted_values(Datset &ds, std::vector<int> &train_rows, int num_threads) {
   int i, k, atts, rows;
 
   atts = ds.get_cols();
   rows = train_rows.size();
+  ds.sort_columns(num_threads);
+
+  /* Positions of each row in 'train_rows' as linked lists (a row may appear more than once) */
+  std::vector<int> head(ds.get_rows(), -1);
+  std::vector<int> next(rows);
+  for(k=rows-1; k>=0; k--) {
+    int row = train_rows[k];
+    next[k] = head[row];
+    head[row] = k;
+  }
   
   indices_array *ia = new indices_array(atts);
 
-  std::vector<double> d(rows);
-
   for(i=0; i<atts; i++) {
-    for(k=0; k<rows; k++) {
-      int row = train_rows[k];
-      double value = ds.ds_real_ref(row, i);
-      d[k] = value;
+    int *order = ds.get_sorted_rows(i);
+    std::vector<int> *iv = new std::vector<int>();
+    iv->reserve(rows);
+    for(int r=0; r<ds.get_rows(); r++) {
+      for(k=head[order[r]]; k>=0; k=next[k])
+        iv->push_back(k);
     }
-    std::vector<int> *iv = sort_indexes(d);
-
     ia->set_indices(i, iv);
   }
 
@@ -69,7 +80,7 @@ void Helper::sort_indices_based_on_values(Datset &ds, int att, std::vector<int>
     idx[i].index = iv[i];
   }
 
-  std::sort(idx.begin(), idx.end(), cmp);
+  std::stable_sort(idx.begin(), idx.end(), cmp);
 
   for(unsigned int i=0; i<iv.size(); i++) {
     iv[i] = idx[i].index;
@@ -83,14 +94,58 @@ std::vector<int> *Helper::get_vector_subset(std::vector<int> &v, int start, int
   return newvec;
 }
 
-std::vector<int> *Helper::intersection(std::vector<int> &v1, std::vector<int> &v2)
-{
-  std::vector<int> *v3 = new std::vector<int>();
-  
-  sort(v1.begin(), v1.end());
-  sort(v2.begin(), v2.end());
-  
-  std::set_intersection(v1.begin(),v1.end(),v2.begin(),v2.end(), back_inserter(*v3));
-  
-  return v3;
+/*
+ * Keeps only the positions also in 'other'
+ */
+void row_set::intersect(const row_set &other) {
+  unsigned int size = bits.size();
+  for(unsigned int w=0; w<size; w++)
+    bits[w] &= other.bits[w];
+}
+
+/*
+ * No. of positions in the set
+ */
+int row_set::count() const {
+  int total = 0;
+  for(unsigned int w=0; w<bits.size(); w++)
+    total += __builtin_popcountll(bits[w]);
+  return total;
+}
+
+/*
+ * Positions in the set in ascending order
+ */
+std::vector<int> *row_set::to_vector() const {
+  std::vector<int> *vec = new std::vector<int>();
+  vec->reserve(count());
+
+  for(unsigned int w=0; w<bits.size(); w++) {
+    uint64_t word = bits[w];
+    while(word) {
+      int bit = __builtin_ctzll(word);
+      vec->push_back(w * 64 + bit);
+      word &= word - 1;
+    }
+  }
+  return vec;
+}
+
+/*
+ * Copies 'v' into 'out' dropping positions in the set. Order of 'v' is kept
+ */
+void row_set::filter_out(const std::vector<int> &v, std::vector<int> &out) const {
+  unsigned int size = v.size();
+  int k = 0;
+  out.resize(size);
+  for(unsigned int j=0; j<size; j++) {
+    int val = v[j];
+    out[k] = val;
+    k += !contains(val);
+  }
+  out.resize(k);
+}
+
+double Helper::wall_time() {
+  return std::chrono::duration<double>(std::chrono::steady_clock::now().time_since_epoch()).count();
 }
@@ -10,6 +10,7 @@
 #define HELPER_H_
 
 #include <vector>
+#include <stdint.h>
 #include "datset.hpp"
 
 #define MIN_DOUBLE 1E-6
@@ -35,6 +36,44 @@ public:
   }
 };
 
+/*
+ * Set of row positions in [0, size), one bit per position.
+ * Used for intersecting the rows of projections and filtering covered rows out of sorted indices.
+ */
+class row_set {
+private:
+  std::vector<uint64_t> bits;
+public:
+  row_set(int size) : bits((size + 63)/64, 0) {
+  }
+
+  void insert(int k) {
+    bits[k >> 6] |= (uint64_t)1 << (k & 63);
+  }
+
+  /* Inserts v[start] .. v[end-1] */
+  void insert(std::vector<int> &v, int start, int end) {
+    for(int k=start; k<end; k++)
+      insert(v[k]);
+  }
+
+  bool contains(int k) const {
+    return (bits[k >> 6] >> (k & 63)) & 1;
+  }
+
+  /* Keeps only the positions also in 'other' */
+  void intersect(const row_set &other);
+
+  /* No. of positions in the set */
+  int count() const;
+
+  /* Positions in the set in ascending order */
+  std::vector<int> *to_vector() const;
+
+  /* Copies 'v' into 'out' dropping positions in the set. Order of 'v' is kept */
+  void filter_out(const std::vector<int> &v, std::vector<int> &out) const;
+};
+
 class Helper {
 public:
   static int minimum_of_3(double a, double b, double c) {
@@ -52,8 +91,9 @@ public:
   /*
    * Sort all dataset attributes except for label.
    * Store indices of sorted values
+   * The sort order of all rows is computed once per Datset (using num_threads threads) and filtered for 'train_rows'
    */
-  static indices_array *mk_indices_array_sorted_values(Datset &ds, std::vector<int> &train_rows);
+  static indices_array *mk_indices_array_sorted_values(Datset &ds, std::vector<int> &train_rows, int num_threads);
 
   /*
    * Retrieve the start-end optimal range from the binary tree built for attribute 'att'.
@@ -63,7 +103,10 @@ public:
 
   static std::vector<int> *get_vector_subset(std::vector<int> &v, int start, int end);
 
-  static std::vector<int> *intersection(std::vector<int> &v1, std::vector<int> &v2);
+  /*
+   * Wall-clock time in seconds from an arbitrary starting point, for timing phases
+   */
+  static double wall_time();
 };
 
 #endif
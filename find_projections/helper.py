@@ -8,6 +8,9 @@
 # Copyright (c) 2018 Carnegie Mellon University
 ##
 
+import concurrent.futures
+import time
+
 import d3m.metadata
 import numpy as np
 import pandas as pd
@@ -24,87 +27,131 @@ def _add_target_semantic_types(metadata) -> metadata_base.DataMetadata:
 
     return metadata
 
-def find_optimal_coverage(obj, ds, idf, odf, primitive, name, random_seed=None) -> int:
-    rows = ds.getSize()
-    rowset = [i for i in range(rows)]
+def _prefix_scores(first, metric, predictions, targets, num, name):
+    """
+    Accuracy (MSE for regression) and coverage of the hybrid model for every decision-list prefix 1..num.
+    first/metric - Index and metric of the first box containing each validation row (-1 if none)
+    predictions - Blackbox predictions used for rows not covered by the prefix
+    A row is predicted by box first[i] for all prefixes longer than first[i], so all prefixes come from cumulative sums.
+    """
+    rows = len(first)
+    predictions = np.asarray(predictions, dtype=float).ravel()
+    targets = np.asarray(targets).ravel()
+    covered = first >= 0
+
+    if name == 'CLASSIFICATION':
+        blackbox_score = (predictions == targets).astype(float)
+        box_score = (metric == targets).astype(float)
+    else:
+        blackbox_score = (predictions - targets) ** 2
+        box_score = (metric - targets) ** 2
+
+    # Change in score and coverage from each box taking over its rows
+    gain = np.bincount(first[covered], weights=(box_score - blackbox_score)[covered], minlength=num)[:num]
+    counts = np.bincount(first[covered], minlength=num)[:num]
+
+    scores = (blackbox_score.sum() + np.cumsum(gain)) / max(rows, 1)
+    coverages = np.cumsum(counts) / max(rows, 1)
+    return scores.tolist(), coverages.tolist()
+
+def mk_blackbox(primitive):
+    """
+    Returns a new instance of blackbox 'primitive' (or 'primitive' itself if it is already an instance)
+    """
+    if isinstance(primitive, d3m.primitive_interfaces.base.PrimitiveBaseMeta):  # is a class
+        primitive_hyperparams = primitive.metadata.query()['primitive_code']['class_type_arguments']['Hyperparams']
+        custom_hyperparams = dict()
+        custom_hyperparams['n_estimators'] = 100
+        return primitive(hyperparams=primitive_hyperparams(primitive_hyperparams.defaults(), **custom_hyperparams))
+    return primitive
+
+def mk_deadline(timeout):
+    """
+    Returns the time.monotonic() at which 'timeout' seconds from now are up (None if 'timeout' is None)
+    """
+    if timeout is None:
+        return None
+    return time.monotonic() + timeout
+
+def time_left(deadline):
+    """
+    Returns the seconds left until 'deadline' from mk_deadline(), never negative (None if 'deadline' is None)
+    """
+    if deadline is None:
+        return None
+    return max(0.0, deadline - time.monotonic())
+
+def _run_bootstrap(obj, ds, idf, odf, primitive, name, seed, num_threads, deadline=None, iterations=None):
+    """
+    Learns the decision list and the blackbox on a random 80% of the rows, and scores every decision-list prefix
+    on the other 20%. All randomness comes from 'seed'.
+    The search stops at 'deadline' (from mk_deadline()) or after 'iterations' greedy rounds.
+    Returns baseline (blackbox only) accuracy, accuracies and coverages of the prefixes
+    """
+    from sklearn import metrics
 
-    bootstraps = 2
+    rows = ds.getSize()
+    random_generator = np.random.default_rng(seed)
+    rowset = random_generator.permutation(rows)
+    train_ids = rowset[0:int(rows*0.8)]
+    validation_ids = rowset[int(rows*0.8):]
+
+    fmap = obj.find_easy_explain_data(rows=train_ids, seed=int(random_generator.integers(2**31 - 1)),
+                                      num_threads=num_threads, timeout=time_left(deadline), iterations=iterations)
+
+    inputs = container.DataFrame(idf.iloc[train_ids,:], generate_metadata=False)
+    inputs.metadata = metadata_base.DataMetadata().generate(value=inputs)
+    outputs = odf.iloc[train_ids,:]
+    testdata = container.DataFrame(idf.iloc[validation_ids,:], generate_metadata=False)
+    testdata.metadata = metadata_base.DataMetadata().generate(value=testdata)
+    to = odf.iloc[validation_ids,:]
+
+    prim_instance = mk_blackbox(primitive)
+    prim_instance.set_training_data(inputs=inputs, outputs=outputs)
+    prim_instance.fit()
+    predictions = prim_instance.produce(inputs=testdata).value.values
+
+    if name == 'CLASSIFICATION':
+        baseline_accuracy = metrics.accuracy_score(to, predictions)
+    else:
+        baseline_accuracy = metrics.mean_squared_error(to, predictions)
+
+    num = fmap.get_num_projections()
+    (first, metric) = fmap.find_first_match(ds, num)
+    (accuracies, coverages) = _prefix_scores(first[validation_ids], metric[validation_ids], predictions, to, num, name)
+    return baseline_accuracy, accuracies, coverages
+
+def find_optimal_coverage(obj, ds, idf, odf, primitive, name, random_seed=None, bootstraps=2, num_threads=1,
+                          deadline=None, iterations=None) -> int:
+    """
+    Finds the largest coverage of the decision list for which the hybrid model is no worse than the blackbox alone.
+    Bootstraps run on a pool of 'num_threads' threads (the native search releases the GIL), each with its own seed
+    derived from 'random_seed' so that results do not depend on scheduling.
+    Searches stop at 'deadline' (from mk_deadline()) or after 'iterations' greedy rounds. Blackbox fits are not limited.
+    """
     print(primitive)
-    primitive_hyperparams = primitive.metadata.query()['primitive_code']['class_type_arguments']['Hyperparams']
-    custom_hyperparams = dict()
-    custom_hyperparams['n_estimators'] = 100
-
-    baseline_accuracies = []
-    global_dlist_accuracies = []
-    global_dlist_coverages = []
-    maxlen = 0
-         
-    from sklearn import metrics
     from scipy import stats
-    random_generator = np.random.default_rng(seed=random_seed)
 
-    if isinstance(primitive, d3m.primitive_interfaces.base.PrimitiveBaseMeta):  # is a class
-        prim_instance = primitive(hyperparams=primitive_hyperparams(primitive_hyperparams.defaults(), **custom_hyperparams))
-    else:  # is an instance
-        prim_instance = primitive
     idfnew = pd.DataFrame(data=idf.values, columns=idf.columns.values.tolist())
+    seeds = np.random.SeedSequence(random_seed).spawn(bootstraps)
+
+    # A blackbox passed as an instance can't be fit concurrently
+    workers = max(1, min(num_threads, bootstraps))
+    if not isinstance(primitive, d3m.primitive_interfaces.base.PrimitiveBaseMeta):
+        workers = 1
+    search_threads = max(1, num_threads // workers)
 
     # Do bootstrap experiments
-    for b in range(bootstraps):
-        random_generator.shuffle(rowset)
-        train_ids = rowset[0:int(rows*0.8)]
-        validation_ids = rowset[int(rows*0.8):]
-         
-        ds.ds.set_training_rows(np.ascontiguousarray(train_ids, dtype=float))
-        fmap = obj.find_easy_explain_data()
-
-        inputs = container.DataFrame(idfnew.iloc[train_ids,:], generate_metadata=False)
-        inputs.metadata = metadata_base.DataMetadata().generate(value=inputs)
-        outputs = odf.iloc[train_ids,:]
-        testdata = container.DataFrame(idfnew.iloc[validation_ids,:], generate_metadata=False)
-        testdata.metadata = metadata_base.DataMetadata().generate(value=testdata)
-        to = odf.iloc[validation_ids,:]
-
-        prim_instance.set_training_data(inputs=inputs, outputs=outputs)
-        prim_instance.fit()
-        predictions = prim_instance.produce(inputs=testdata).value.values
-
-        if name is 'CLASSIFICATION':
-            baseline_accuracy = metrics.accuracy_score(to, predictions)
-        else:
-            baseline_accuracy = metrics.mean_squared_error(to, predictions)
-        baseline_accuracies.append(baseline_accuracy)
-
-        num = fmap.get_num_projections()
-        if num > maxlen:
-            maxlen = num
-        
-        global_accuracies = []
-        global_coverages = []
-        for k in range(1,num+1):
-            predictedTargets = np.zeros(len(validation_ids))
-            coverage = 0
-            for i in range(len(validation_ids)):
-                row = validation_ids[i]
-                predicted = False
-                for j in range(k):
-                    pr = fmap.get_projection(j)
-                    if pr.point_lies_in_projection(ds.ds, row) is True:
-                        predictedTargets[i] = pr.get_projection_metric()
-                        predicted = True
-                        coverage = coverage + 1
-                        break
-                if predicted == False:
-                    predictedTargets[i] = predictions[i]
-            coverage = (float)(coverage) / (float)(len(validation_ids))
-            if name is 'CLASSIFICATION':
-                hybrid_accuracy = metrics.accuracy_score(to, predictedTargets)
-            else:
-                hybrid_accuracy = metrics.mean_squared_error(to, predictedTargets)
-            global_accuracies.append(hybrid_accuracy)
-            global_coverages.append(coverage)
-        global_dlist_accuracies.append(global_accuracies)
-        global_dlist_coverages.append(global_coverages)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_bootstrap, obj, ds, idfnew, odf, primitive, name, seed, search_threads,
+                                   deadline, iterations)
+                   for seed in seeds]
+        results = [future.result() for future in futures]
+
+    baseline_accuracies = [result[0] for result in results]
+    global_dlist_accuracies = [result[1] for result in results]
+    global_dlist_coverages = [result[2] for result in results]
+    maxlen = max([len(acc) for acc in global_dlist_accuracies])
     # boostrapping done
 
     mean, var, std = stats.bayes_mvs(baseline_accuracies, 0.95)
@@ -12,41 +12,49 @@
 /*
  * Constructor
  */
-numeric_binary_tree::numeric_binary_tree(int first, int last, double end_value) : btree_node(first, last, end_value) {
-  this->mean = this->left_mean = this->right_mean = this->optimal_mean = 0;
-  this->leftn = this->rightn = this->total = this->optimaln = 0;
-  this->total_sum = this->left_sum = this->right_sum = this->optimal_sum = 1E32;
+numeric_binary_tree::numeric_binary_tree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size) :
+  btree(ds, att, train_rows, iv, bin_size) {
+  int nodes = get_num_nodes();
+
+  total.resize(nodes);
+  leftn.resize(nodes);
+  rightn.resize(nodes);
+  optimaln.resize(nodes);
+  mean.resize(nodes);
+  left_mean.resize(nodes);
+  right_mean.resize(nodes);
+  optimal_mean.resize(nodes);
+  total_sum.resize(nodes);
+  left_sum.resize(nodes);
+  right_sum.resize(nodes);
+  optimal_sum.resize(nodes);
+  optimal_start.resize(nodes);
+  optimal_end.resize(nodes);
+
+  for(int k=0; k<nodes; k++)
+    reset_node(k);
   this->mode = 0;
 }
 
-std::string numeric_binary_tree::get_name() {
-  return std::string("numeric_binary_tree");
-}
-
 /*
- * Constructor for creating parent node from child nodes
- * right_child may be NULL
+ * Reset counts of node 'k'
  */
-numeric_binary_tree::numeric_binary_tree(btree_node *left_child, btree_node *right_child) : btree_node(left_child, right_child) {
-  this->mean = this->left_mean = this->right_mean = this->optimal_mean = 0;
-  this->leftn = this->rightn = this->total = this->optimaln = 0;
-  this->total_sum = this->left_sum = this->right_sum = this->optimal_sum = 1E32;
-  this->mode = 0;
+void numeric_binary_tree::reset_node(int k) {
+  total_sum[k] = left_sum[k] = right_sum[k] = optimal_sum[k] = 1E32;
+  optimal_start[k] = first[k];
+  optimal_end[k] = last[k];
+
+  mean[k] = left_mean[k] = right_mean[k] = optimal_mean[k] = 0;
+  leftn[k] = rightn[k] = total[k] = optimaln[k] = 0;
 }
 
 /*
- * Reset tree counts 
+ * Reset counts of all nodes (including leaves) which had data added since the last reset
  */
-void numeric_binary_tree::reset_node(bool exclude_leaves) {
-  if(exclude_leaves && is_leaf())
-    return;
-
-  this->total_sum = this->left_sum = this->right_sum = this->optimal_sum = 1E32;
-  this->optimal_start = this->first;
-  this->optimal_end = this->last;
-
-  this->mean = this->left_mean = this->right_mean = this->optimal_mean = 0;
-  this->leftn = this->rightn = this->total = this->optimaln = 0;
+void numeric_binary_tree::reset_touched() {
+  for(unsigned int gs=0; gs<touched_nodes.size(); gs++)
+    reset_node(touched_nodes[gs]);
+  clear_touched();
 }
 
 /*
@@ -90,37 +98,37 @@ static double get_confidence_band(double mean, double sum_sq_error, int n) {
 /*
  * Returns the path with lowest (tightest) confidence band of 1 std error.
  */
-int numeric_binary_tree::get_optimal_path(numeric_binary_tree *left, numeric_binary_tree *right) {
-  double right_optimal, right_right, right_left, right_total, right_left_mean;
-  int right_leftn, right_rightn;
+int numeric_binary_tree::get_optimal_path(int left, int right) {
+  double right_optimal, right_left, right_left_mean;
+  int right_leftn;
 
   double left_optimal = 1E32;
-  if(left->total > 1)
-    left_optimal = left->optimal_sum;
+  if(total[left] > 1)
+    left_optimal = optimal_sum[left];
 
-  right_optimal = right_right = right_left = right_total = 1E32;
-  right_left_mean = right_leftn = right_rightn = 0;
+  right_optimal = right_left = 1E32;
+  right_left_mean = right_leftn = 0;
 
   /* Right child counts */
-  if(right) {
-    if(right->total > 1)
-      right_optimal = right->optimal_sum;
-    right_left = right->left_sum;
-    right_leftn = right->leftn;
-    right_left_mean = right->left_mean;
+  if(right >= 0) {
+    if(total[right] > 1)
+      right_optimal = optimal_sum[right];
+    right_left = left_sum[right];
+    right_leftn = leftn[right];
+    right_left_mean = left_mean[right];
   }
 
-  double left_right_right_left_sum = get_aggregate_sum_sq_error(left->right_sum, right_left, left->right_mean, right_left_mean, left->rightn, right_leftn);
-  double left_right_agg_mean = get_aggregate_mean(left->right_mean, right_left_mean, left->rightn, right_leftn);
+  double left_right_right_left_sum = get_aggregate_sum_sq_error(right_sum[left], right_left, right_mean[left], right_left_mean, rightn[left], right_leftn);
+  double left_right_agg_mean = get_aggregate_mean(right_mean[left], right_left_mean, rightn[left], right_leftn);
 
-  double left_band = get_confidence_band(left->optimal_mean, left_optimal, left->optimaln);
+  double left_band = get_confidence_band(optimal_mean[left], left_optimal, optimaln[left]);
   double right_band = 1E32;
   double left_right_band = 1E32;
-  if(right) {
-    right_band = get_confidence_band(right->optimal_mean, right_optimal, right->optimaln);
-    left_right_band = get_confidence_band(left_right_agg_mean, left_right_right_left_sum, left->rightn + right_leftn);
+  if(right >= 0) {
+    right_band = get_confidence_band(optimal_mean[right], right_optimal, optimaln[right]);
+    left_right_band = get_confidence_band(left_right_agg_mean, left_right_right_left_sum, rightn[left] + right_leftn);
   }
-  
+
   int minimum_index = Helper::minimum_of_3(left_band, right_band, left_right_band);
   return minimum_index;
 }
@@ -131,50 +139,50 @@ int numeric_binary_tree::get_optimal_path(numeric_binary_tree *left, numeric_bin
  * Else (Looking for low mean boxes
  *  - Returns the path with lowest higher bound for the mean
  */
-int numeric_binary_tree::get_optimal_mean_path(numeric_binary_tree *left, numeric_binary_tree *right, bool is_high) {
-  double right_optimal, right_right, right_left, right_total, right_left_mean;
-  int right_leftn, right_rightn;
+int numeric_binary_tree::get_optimal_mean_path(int left, int right, bool is_high) {
+  double right_optimal, right_left, right_left_mean;
+  int right_leftn;
 
   double left_optimal = 1E32;
-  if(left->total > 1)
-    left_optimal = left->optimal_sum;
+  if(total[left] > 1)
+    left_optimal = optimal_sum[left];
 
-  right_optimal = right_right = right_left = right_total = 1E32;
-  right_left_mean = right_leftn = right_rightn = 0;
+  right_optimal = right_left = 1E32;
+  right_left_mean = right_leftn = 0;
 
   /* Right child counts */
-  if(right) {
-    if(right->total > 1)
-      right_optimal = right->optimal_sum;
-    right_left = right->left_sum;
-    right_leftn = right->leftn;
-    right_left_mean = right->left_mean;
+  if(right >= 0) {
+    if(total[right] > 1)
+      right_optimal = optimal_sum[right];
+    right_left = left_sum[right];
+    right_leftn = leftn[right];
+    right_left_mean = left_mean[right];
   }
 
-  double left_right_right_left_sum = get_aggregate_sum_sq_error(left->right_sum, right_left, left->right_mean, right_left_mean, left->rightn, right_leftn);
-  double left_right_agg_mean = get_aggregate_mean(left->right_mean, right_left_mean, left->rightn, right_leftn);
+  double left_right_right_left_sum = get_aggregate_sum_sq_error(right_sum[left], right_left, right_mean[left], right_left_mean, rightn[left], right_leftn);
+  double left_right_agg_mean = get_aggregate_mean(right_mean[left], right_left_mean, rightn[left], right_leftn);
 
-  double left_band = get_confidence_band(left->optimal_mean, left_optimal, left->optimaln);
+  double left_band = get_confidence_band(optimal_mean[left], left_optimal, optimaln[left]);
   double right_band = 1E32;
   double left_right_band = 1E32;
   double right_optimal_mean = 0;
-  if(right) {
-    right_band = get_confidence_band(right->optimal_mean, right_optimal, right->optimaln);
-    left_right_band = get_confidence_band(left_right_agg_mean, left_right_right_left_sum, left->rightn + right_leftn);
-    right_optimal_mean = right->optimal_mean;
+  if(right >= 0) {
+    right_band = get_confidence_band(optimal_mean[right], right_optimal, optimaln[right]);
+    left_right_band = get_confidence_band(left_right_agg_mean, left_right_right_left_sum, rightn[left] + right_leftn);
+    right_optimal_mean = optimal_mean[right];
   }
-  
+
   int index = 0;
   if(is_high == true)
-    index = Helper::maximum_of_3(left->optimal_mean-left_band, right_optimal_mean-right_band, left_right_agg_mean-left_right_band);
+    index = Helper::maximum_of_3(optimal_mean[left]-left_band, right_optimal_mean-right_band, left_right_agg_mean-left_right_band);
   else
-    index = Helper::minimum_of_3(left->optimal_mean+left_band, right_optimal_mean+right_band, left_right_agg_mean+left_right_band);
+    index = Helper::minimum_of_3(optimal_mean[left]+left_band, right_optimal_mean+right_band, left_right_agg_mean+left_right_band);
 
   return index;
 }
 
 /*
- * Update a parent node.
+ * Update parent node 'k' with children 'left' and 'right' (-1 if missing). Node 'k' must be reset.
  * Vx (optimal_sum) = min(VLx, VRx, VLr + VRl)
  * Vtotal (total_sum) = VLtotal + VRtotal
  * Modes are -
@@ -182,34 +190,31 @@ int numeric_binary_tree::get_optimal_mean_path(numeric_binary_tree *left, numeri
  * 1 : High mean
  * 2 : Low mean
  */
-void numeric_binary_tree::update_node() {
+void numeric_binary_tree::update_node(int k, int left, int right) {
   double left_optimal;
-  double right_optimal, right_right, right_left, right_total, right_left_mean, right_mean;
+  double right_optimal, right_right, right_left, right_total, right_left_mean, right_mean_value;
   int right_leftn, right_rightn, rightt;
 
-  numeric_binary_tree *left = (numeric_binary_tree *)this->left_child;
-  numeric_binary_tree *right = (numeric_binary_tree *)this->right_child;
-
   left_optimal = 1E32;
   right_optimal = right_right = right_left = right_total = 1E32;
-  right_left_mean = right_mean = 0;
+  right_left_mean = right_mean_value = 0;
   right_leftn = right_rightn = rightt = 0;
-  
-  if(left->total > 1)
-    left_optimal = left->optimal_sum;
+
+  if(total[left] > 1)
+    left_optimal = optimal_sum[left];
 
   /* Right child counts */
-  if(right) {
-    if(right->total > 1)
-      right_optimal = right->optimal_sum;
-    right_total = right->total_sum;
-    right_left = right->left_sum;
-    right_right = right->right_sum;
-    right_leftn = right->leftn;
-    right_rightn = right->rightn;
-    right_left_mean = right->left_mean;
-    rightt = right->total;
-    right_mean = right->mean;
+  if(right >= 0) {
+    if(total[right] > 1)
+      right_optimal = optimal_sum[right];
+    right_total = total_sum[right];
+    right_left = left_sum[right];
+    right_right = right_sum[right];
+    right_leftn = leftn[right];
+    right_rightn = rightn[right];
+    right_left_mean = left_mean[right];
+    rightt = total[right];
+    right_mean_value = mean[right];
   }
 
   int path = 0;
@@ -228,111 +233,126 @@ void numeric_binary_tree::update_node() {
   /* Update optimal start, end indices based on which option gave min sum */
 
   switch(path) {
-  case 0: 
+  case 0:
     { // Left
-      this->optimal_start = left->optimal_start;
-      this->optimal_end = left->optimal_end;
-      this->optimal_mean = left->optimal_mean;
-      this->optimaln = left->optimaln;
-      this->optimal_sum = left_optimal;
-      this->left_sum = left->left_sum;
-      this->left_mean = left->left_mean;
-      this->leftn = left->leftn;
-      double right_total_left_right_mean = get_aggregate_mean(right_mean, left->right_mean, rightt, left->rightn);
-      double right_total_left_right_sum = get_aggregate_sum_sq_error(right_total, left->right_sum, right_mean, left->right_mean, rightt, left->rightn);
-      this->right_sum = right_total_left_right_sum;
-      this->right_mean = right_total_left_right_mean;
-      this->rightn = rightt + left->rightn;
+      optimal_start[k] = optimal_start[left];
+      optimal_end[k] = optimal_end[left];
+      optimal_mean[k] = optimal_mean[left];
+      optimaln[k] = optimaln[left];
+      optimal_sum[k] = left_optimal;
+      left_sum[k] = left_sum[left];
+      left_mean[k] = left_mean[left];
+      leftn[k] = leftn[left];
+      double right_total_left_right_mean = get_aggregate_mean(right_mean_value, right_mean[left], rightt, rightn[left]);
+      double right_total_left_right_sum = get_aggregate_sum_sq_error(right_total, right_sum[left], right_mean_value, right_mean[left], rightt, rightn[left]);
+      right_sum[k] = right_total_left_right_sum;
+      right_mean[k] = right_total_left_right_mean;
+      rightn[k] = rightt + rightn[left];
     }
     break;
   case 1: // Right
-    if(right) {
-      this->optimal_start = right->optimal_start;
-      this->optimal_end = right->optimal_end;
-      this->optimal_mean = right->optimal_mean;
-      this->optimaln = right->optimaln;
-      this->optimal_sum = right_optimal;
-      double left_total_right_left_mean = get_aggregate_mean(left->mean, right_left_mean, left->total, right_leftn);
-      double left_total_right_left_sum = get_aggregate_sum_sq_error(left->total_sum, right_left, left->mean, right_left_mean, left->total, right_leftn);
-      this->left_sum = left_total_right_left_sum;
-      this->left_mean = left_total_right_left_mean;
-      this->leftn = left->total + right_leftn;
-      this->right_sum = right_right;
-      this->right_mean = right->right_mean;
-      this->rightn = right->rightn;
+    if(right >= 0) {
+      optimal_start[k] = optimal_start[right];
+      optimal_end[k] = optimal_end[right];
+      optimal_mean[k] = optimal_mean[right];
+      optimaln[k] = optimaln[right];
+      optimal_sum[k] = right_optimal;
+      double left_total_right_left_mean = get_aggregate_mean(mean[left], right_left_mean, total[left], right_leftn);
+      double left_total_right_left_sum = get_aggregate_sum_sq_error(total_sum[left], right_left, mean[left], right_left_mean, total[left], right_leftn);
+      left_sum[k] = left_total_right_left_sum;
+      left_mean[k] = left_total_right_left_mean;
+      leftn[k] = total[left] + right_leftn;
+      right_sum[k] = right_right;
+      right_mean[k] = right_mean[right];
+      rightn[k] = rightn[right];
     }
     break;
   case 2: // Left_right + right_left
     {
-      this->optimal_start = left->optimal_start;
-      if(right)
-	this->optimal_end = right->optimal_end;
-      
-      double left_right_right_left_sum = get_aggregate_sum_sq_error(left->right_sum, right_left, left->right_mean, right_left_mean, left->rightn, right_leftn);
-      double left_right_agg_mean = get_aggregate_mean(left->right_mean, right_left_mean, left->rightn, right_leftn);
-      this->optimal_mean = left_right_agg_mean;
-      this->optimaln = left->rightn + right_leftn;
-      this->optimal_sum = left_right_right_left_sum;
-      
-      double left_total_right_left_mean = get_aggregate_mean(left->mean, right_left_mean, left->total, right_leftn);
-      double left_total_right_left_sum = get_aggregate_sum_sq_error(left->total_sum, right_left, left->mean, right_left_mean, left->total, right_leftn);
-      this->left_sum = left_total_right_left_sum;
-      this->left_mean = left_total_right_left_mean;
-      this->leftn = left->total + right_leftn;
-      
-      double right_total_left_right_mean = get_aggregate_mean(right_mean, left->right_mean, rightt, left->rightn);
-      double right_total_left_right_sum = get_aggregate_sum_sq_error(right_total, left->right_sum, right_mean, left->right_mean, rightt, left->rightn);
-      this->right_sum = right_total_left_right_sum;
-      this->right_mean = right_total_left_right_mean;
-      this->rightn = rightt + left->rightn;
+      optimal_start[k] = optimal_start[left];
+      if(right >= 0)
+	optimal_end[k] = optimal_end[right];
+
+      double left_right_right_left_sum = get_aggregate_sum_sq_error(right_sum[left], right_left, right_mean[left], right_left_mean, rightn[left], right_leftn);
+      double left_right_agg_mean = get_aggregate_mean(right_mean[left], right_left_mean, rightn[left], right_leftn);
+      optimal_mean[k] = left_right_agg_mean;
+      optimaln[k] = rightn[left] + right_leftn;
+      optimal_sum[k] = left_right_right_left_sum;
+
+      double left_total_right_left_mean = get_aggregate_mean(mean[left], right_left_mean, total[left], right_leftn);
+      double left_total_right_left_sum = get_aggregate_sum_sq_error(total_sum[left], right_left, mean[left], right_left_mean, total[left], right_leftn);
+      left_sum[k] = left_total_right_left_sum;
+      left_mean[k] = left_total_right_left_mean;
+      leftn[k] = total[left] + right_leftn;
+
+      double right_total_left_right_mean = get_aggregate_mean(right_mean_value, right_mean[left], rightt, rightn[left]);
+      double right_total_left_right_sum = get_aggregate_sum_sq_error(right_total, right_sum[left], right_mean_value, right_mean[left], rightt, rightn[left]);
+      right_sum[k] = right_total_left_right_sum;
+      right_mean[k] = right_total_left_right_mean;
+      rightn[k] = rightt + rightn[left];
     }
     break;
   }
-  
-  // Updating totals
-  this->total_sum = get_aggregate_sum_sq_error(left->total_sum, right_total, left->mean, right_mean, left->total, rightt);
-  this->mean = get_aggregate_mean(left->mean, right_mean, left->total, rightt);
-  this->total = left->total + (right ? right->total : 0);
 
-  left->reset_node(true);
-  if(right)
-    right->reset_node(true);
+  // Updating totals
+  total_sum[k] = get_aggregate_sum_sq_error(total_sum[left], right_total, mean[left], right_mean_value, total[left], rightt);
+  mean[k] = get_aggregate_mean(mean[left], right_mean_value, total[left], rightt);
+  total[k] = total[left] + rightt;
 }
 
 /*
- * Function to insert new value
- * Incrementally updates mean and sum-of-squared-error
+ * Recomputes node 'i' of level 'h' and its descendants if leaves below it changed since the last update
+ * Post-order traversal
  */
-void numeric_binary_tree::insert_entry(double score) {
-  if(this->total == 0)
-    this->total_sum = 0;
-  double mean = this->mean + (score - this->mean)/(this->total + 1);
-  double sum_sq_error = this->total_sum + (score - mean)*(score - this->mean);
-  this->total++;
-  
-  this->mean = mean;
-  this->left_mean = mean;
-  this->right_mean = mean;
-  this->optimal_mean = mean;
-  
-  this->total_sum = sum_sq_error;
-  this->left_sum = sum_sq_error;
-  this->right_sum = sum_sq_error;
-  this->optimal_sum = sum_sq_error;
-  
-  this->leftn++;
-  this->rightn++;
-  this->optimaln++;
+void numeric_binary_tree::update_dirty(int h, int i) {
+  int k = level_start[h] + i;
+  if(!dirty[k])
+    return;
+  dirty[k] = 0;
+
+  /* Leaves are updated on insert */
+  if(h == 0)
+    return;
+
+  int left = get_left_child(h, i);
+  int right = get_right_child(h, i);
+  update_dirty(h-1, 2*i);
+  if(right >= 0)
+    update_dirty(h-1, 2*i+1);
+
+  /* Nothing to update without data */
+  if(total[left] == 0 && (right < 0 || total[right] == 0))
+    return;
+
+  reset_node(k);
+  update_node(k, left, right);
 }
 
 /*
- * Print out tree contents for debugging purposes
+ * Adds output value 'score' to leaf 'k'
+ * Incrementally updates mean and sum-of-squared-error
  */
-void numeric_binary_tree::print_tree(Datset *ds, std::vector<int> &iv, int att) {
-  printf("%d-%d, (%d-%d), %e, %e, %d, %d, %f,%d,%d\n", this->first, this->last, this->optimal_start, this->optimal_end, this->optimal_sum,
-         this->total_sum, this->total, this->optimaln, this->optimal_mean, this->leftn, this->rightn);
-  if(left_child)
-    left_child->print_tree(ds, iv, att);
-  if(right_child)
-    right_child->print_tree(ds, iv, att);
+void numeric_binary_tree::insert_leaf(int k, double score) {
+
+  if(total[k] == 0)
+    total_sum[k] = 0;
+  double new_mean = mean[k] + (score - mean[k])/(total[k] + 1);
+  double sum_sq_error = total_sum[k] + (score - new_mean)*(score - mean[k]);
+  total[k]++;
+
+  mean[k] = new_mean;
+  left_mean[k] = new_mean;
+  right_mean[k] = new_mean;
+  optimal_mean[k] = new_mean;
+
+  total_sum[k] = sum_sq_error;
+  left_sum[k] = sum_sq_error;
+  right_sum[k] = sum_sq_error;
+  optimal_sum[k] = sum_sq_error;
+
+  leftn[k]++;
+  rightn[k]++;
+  optimaln[k]++;
+
+  mark_dirty(k);
 }
@@ -14,74 +14,87 @@
 /*
  * Binary tree for finding low variance(low stderror) regions
  */
-class numeric_binary_tree : public btree_node {
+class numeric_binary_tree : public btree {
 private:
   int mode;
-  int total;
-  double mean, left_mean, right_mean, optimal_mean;
-  int leftn, rightn, optimaln;
-  static int get_optimal_path(numeric_binary_tree *left, numeric_binary_tree *right);
-  static int get_optimal_mean_path(numeric_binary_tree *left, numeric_binary_tree *right, bool is_high);
- public:
-  int get_optimal_total() { return optimaln; }
-  int get_total() { return total; }
-  double get_mean() { return optimal_mean; }
+
+  /* Aggregates of each node */
+  std::vector<int> total, leftn, rightn, optimaln;
+  std::vector<double> mean, left_mean, right_mean, optimal_mean;
+  std::vector<double> total_sum, left_sum, right_sum, optimal_sum;
+  std::vector<int> optimal_start, optimal_end;
+
+  int get_optimal_path(int left, int right);
+  int get_optimal_mean_path(int left, int right, bool is_high);
 
   /*
-   * 0 : Low variance
-   * 1 : High mean
-   * 2 : Low mean
+   * Reset counts of node 'k'
    */
-  void set_mode(int mode) {
-    this->mode = mode;
-    if(left_child) 
-      ((numeric_binary_tree *)left_child)->set_mode(mode);
-    if(right_child) 
-      ((numeric_binary_tree *)right_child)->set_mode(mode);
-  }
+  void reset_node(int k);
 
-  std::string get_name();
-  
   /*
-   * Reset tree counts 
+   * Update parent node 'k' with children 'left' and 'right' (-1 if missing)
    */
-  void reset_tree(bool exclude_leaves);
-  
-  void reset_node(bool exclude_leaves);
+  void update_node(int k, int left, int right);
+
+  void update_dirty(int h, int i);
 
   /*
-   * Destructor
+   * Adds output value 'score' to leaf 'k'
+   * Incrementally updates mean and sum-of-squared-error
    */
-  ~numeric_binary_tree();
-
+  void insert_leaf(int k, double score);
+ public:
   /*
    * Constructor
    */
-  numeric_binary_tree(int first, int last, double end_value);
-  
+  numeric_binary_tree(Datset &ds, int att, std::vector<int> &train_rows, std::vector<int> &iv, int bin_size);
+
+  /*
+   * Destructor
+   */
+  ~numeric_binary_tree();
+
+  int get_optimal_total() { return optimaln[get_root()]; }
+  double get_mean() { return optimal_mean[get_root()]; }
+
+  /* Returns the optimal sum, start and end index for the entire tree */
+  double get_node_optimal_sum() { return optimal_sum[get_root()]; }
+  int get_node_optimal_start() { return optimal_start[get_root()]; }
+  int get_node_optimal_end() { return optimal_end[get_root()]; }
+
   /*
-   * Constructor for creating parent node from child nodes
-   * right_child may be NULL
+   * 0 : Low variance
+   * 1 : High mean
+   * 2 : Low mean
    */
-  numeric_binary_tree(btree_node *left_child, btree_node *right_child);
+  void set_mode(int mode) {
+    this->mode = mode;
+  }
 
   /*
-   * Update a parent node.
-   * Vx (optimal_sum) = min(VLx, VRx, VLr + VRl)
-   * Vtotal (total_sum) = VLtotal + VRtotal
+   * Reset counts of all nodes (including leaves) which had data added since the last reset
    */
-  void update_node();
+  void reset_touched();
 
   /*
-   * Function to insert new value
-   * Incrementally updates mean and sum-of-squared-error
+   * Updates tree calling update_node() on non-leaf nodes to update their optimal counts, range
+   * After this function completes, the root node will have the optimal counts, range computed for the data contained in this tree
+   * Only nodes above leaves changed since the last update are visited
    */
-  void insert_entry(double score);
+  void update_tree() {
+    update_dirty(get_num_levels()-1, 0);
+  }
 
   /*
-   * Print out tree contents for debugging purposes
+   * Adds rows at positions iv[start] to iv[end-1] of train_rows to their leaves, in that order
    */
-  void print_tree(Datset *ds, std::vector<int> &iv, int att);
+  void insert_rows(Datset &ds, std::vector<int> &train_rows, std::vector<int> &iv, int start, int end) {
+    for(int k=start; k<end; k++) {
+      int p = iv[k];
+      insert_leaf(get_leaf(p), ds.ds_output_ref(train_rows[p]));
+    }
+  }
 };
 
 #endif
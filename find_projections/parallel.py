@@ -0,0 +1,124 @@
+"""
+Multi-process search_projections.
+The features, output and presorted rows are written once to memory-mapped files (in /dev/shm where available),
+which every worker process maps into its own Datset without copying. Workers search disjoint chunks of attribute
+pairs and return their boxes as BOX_DTYPE records, merged into one feature_map by the native search object.
+A worker crash fails the search with RuntimeError but leaves the calling process intact.
+Workers are spawned, so scripts calling it need the usual `if __name__ == '__main__':` guard.
+"""
+import concurrent.futures
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+import libfind_projections
+
+from . import datset, feature_map
+
+logger = logging.getLogger(__name__)
+
+# Pair chunks per worker process : smaller chunks balance uneven pairs at the cost of more records to merge
+CHUNKS_PER_PROCESS = 4
+
+# Datset of this worker process, mapped once by _attach()
+_worker = {}
+
+def _shared_dir():
+    if os.path.isdir('/dev/shm') and os.access('/dev/shm', os.W_OK):
+        return '/dev/shm'
+    return None
+
+"""
+ Process initializer : maps the shared features, output and presorted rows of the search
+"""
+def _attach(paths, classification):
+    ds = datset.Datset.from_file(paths['data'], labels_path=paths['output'], classification=classification)
+    ds.ds.set_sorted_rows(np.load(paths['sorted'], mmap_mode='r'), True)
+    _worker['ds'] = ds
+
+"""
+ Searches one chunk of attribute pairs, returning its boxes as BOX_DTYPE records and the search stats
+"""
+def _search_pairs(pairs, bin_size, support, purity, mode, num_threads, top_k, rank_by, screen_purity):
+    search = libfind_projections.search()
+    search.set_verbose(False)
+    fmap = search.search_projections(_worker['ds'].ds, bin_size, support, purity, mode, num_threads,
+                                     top_k=top_k, rank_by=rank_by, screen_purity=screen_purity, pairs=pairs)
+    if fmap is None:
+        return None
+    records = np.zeros(fmap.get_num_projections(), dtype=feature_map.BOX_DTYPE)
+    fmap.fill_records(records)
+    return records, search.get_stats()
+
+"""
+ Runs search_projections of 'search_obj' over 'processes' worker processes
+ Parameters
+ ----------
+ search_obj : libfind_projections.search whose get_stats() will describe the whole search
+ ds : datset.Datset with its output set
+ bin_size, support, purity, mode, top_k, rank_by, screen_purity : As for search_obj.search_projections()
+ processes : No. of worker processes
+ num_threads : Threads of each worker process
+ directory : Directory for the shared files (/dev/shm where available, else the default temporary directory)
+
+ Returns
+ -------
+ Native feature_map of all the boxes found, in the order of a single-process search (None if parameters are invalid)
+"""
+def search_projections(search_obj, ds, bin_size, support, purity, mode, processes, num_threads=1, top_k=0,
+                       rank_by=0, screen_purity=0.0, directory=None):
+    if ds.output is None:
+        raise ValueError("Datset output should be set before a multi-process search")
+    begin = time.perf_counter()
+    if isinstance(ds.data, (list, tuple)):
+        dtype = ds.data[0].dtype
+        shape = (len(ds.data[0]), len(ds.data))
+    else:
+        dtype = np.float32 if ds.data.dtype == np.float32 else np.float64
+        shape = ds.data.shape
+    rows, cols = shape
+
+    folder = tempfile.mkdtemp(prefix='find_projections_', dir=directory or _shared_dir())
+    paths = {name: os.path.join(folder, name + '.npy') for name in ('data', 'output', 'sorted')}
+    try:
+        data = np.lib.format.open_memmap(paths['data'], mode='w+', dtype=dtype, shape=shape, fortran_order=True)
+        if isinstance(ds.data, (list, tuple)):
+            for j, column in enumerate(ds.data):
+                data[:, j] = column
+        else:
+            data[:] = ds.data
+        output = np.lib.format.open_memmap(paths['output'], mode='w+', dtype=np.float64, shape=(rows,))
+        output[:] = np.ravel(ds.output)
+        sorted_rows = np.lib.format.open_memmap(paths['sorted'], mode='w+', dtype=np.intc, shape=shape,
+                                                fortran_order=True)
+        # Sorted by a temporary Datset of the shared features, leaving the caller's Datset as it was
+        sorter = libfind_projections.Datset(data, True)
+        sorter.set_sorted_rows(sorted_rows, False, processes * num_threads)
+        del sorter
+        for array in (data, output, sorted_rows):
+            array.flush()
+        del data, output, sorted_rows
+
+        pairs = np.array([i * cols + j for i in range(cols) for j in range(i + 1, cols)], dtype=float)
+        chunks = [chunk for chunk in np.array_split(pairs, processes * CHUNKS_PER_PROCESS) if len(chunk)]
+        context = multiprocessing.get_context('spawn')
+        try:
+            with concurrent.futures.ProcessPoolExecutor(processes, mp_context=context, initializer=_attach,
+                                                        initargs=(paths, ds.classification)) as pool:
+                futures = [pool.submit(_search_pairs, chunk, bin_size, support, purity, mode, num_threads, top_k,
+                                       rank_by, screen_purity) for chunk in chunks]
+                parts = [future.result() for future in futures]
+        except concurrent.futures.process.BrokenProcessPool as e:
+            raise RuntimeError("A search process died, no boxes were returned") from e
+    finally:
+        shutil.rmtree(folder, ignore_errors=True)
+
+    if any(part is None for part in parts):
+        return None
+    logger.info("Searched %d attribute pairs in %d chunks over %d processes", len(pairs), len(chunks), processes)
+    return search_obj.merge_projections(ds.ds, parts, top_k=top_k, rank_by=rank_by,
+                                        elapsed=time.perf_counter() - begin)
@@ -50,41 +50,35 @@ projection::projection() {
 }
 
 /*
- * Retrieve the start-end optimal range from the binary tree built for attribute 'att'.
- * Also retrieves the number of positives and negatives in the box
+ * Creates numeric projection from -
+ * att1's row subset (start-end) of ivatt1
+ * att2's row subset (opt_first-opt_last) of ivatt2
  */
-static void get_optimal_xrange(std::vector<int> &iv, double *start, double *end, btree_node *node, Datset &ds,  std::vector<int> &train_rows, int att) {
-  int opt_first = node->get_node_optimal_start();
-  int opt_last = node->get_node_optimal_end();
+numeric_projection *projection::mk_numeric_projection(Datset &ds, std::vector<int> &train_rows,
+                                                      std::vector<int> &ivatt1, int start, int end,
+                                                      std::vector<int> &ivatt2, int opt_first, int opt_last, int att1, int att2) {
+  double start_value = ds.ds_real_ref(train_rows[ivatt1[start]], att1);
+  double end_value = ds.ds_real_ref(train_rows[ivatt1[end]], att1);
+  double start2 = ds.ds_real_ref(train_rows[ivatt2[opt_first]], att2);
+  double end2 = ds.ds_real_ref(train_rows[ivatt2[opt_last]], att2);
 
-  *start = ds.ds_real_ref(train_rows[iv[opt_first]], att);
-  *end = ds.ds_real_ref(train_rows[iv[opt_last]], att);
+  return new numeric_projection(att1, att2, start_value, end_value, start2, end2);
 }
 
 /*
- * Creates projection from -
+ * Creates discrete projection from -
  * att1's row subset (start-end) of ivatt1
- * att2's row subset selected in binary tree 'node' of ivatt2
- * node - Binary tree containing optimal range of att2
+ * att2's row subset (opt_first-opt_last) of ivatt2
  */
-projection *projection::mk_projection_from_tree(btree_node *node, Datset &ds, std::vector<int> &train_rows, 
-						std::vector<int> &ivatt1, int start, int end,
-						std::vector<int> &ivatt2, int att1, int att2) {
-  double start2, end2;
-  
-  get_optimal_xrange(ivatt2, &start2, &end2, node, ds, train_rows, att2);
-
+discrete_projection *projection::mk_discrete_projection(Datset &ds, std::vector<int> &train_rows,
+                                                        std::vector<int> &ivatt1, int start, int end,
+                                                        std::vector<int> &ivatt2, int opt_first, int opt_last, int att1, int att2) {
   double start_value = ds.ds_real_ref(train_rows[ivatt1[start]], att1);
   double end_value = ds.ds_real_ref(train_rows[ivatt1[end]], att1);
+  double start2 = ds.ds_real_ref(train_rows[ivatt2[opt_first]], att2);
+  double end2 = ds.ds_real_ref(train_rows[ivatt2[opt_last]], att2);
 
-  projection *pr = NULL;
-  string name = node->get_name();
-  if(name == "discrete_binary_tree")
-    pr = new discrete_projection(att1, att2, start_value, end_value, start2, end2);
-  else
-    pr = new numeric_projection(att1, att2, start_value, end_value, start2, end2);
-
-  return pr;
+  return new discrete_projection(att1, att2, start_value, end_value, start2, end2);
 }
 
 /*
@@ -189,18 +183,19 @@ void projection::mk_projection_indices(Datset &ds, std::vector<int> &train_rows,
   std::vector<int> &ivatt1 = ia.get_indices(f1att);
   std::vector<int> &ivatt2 = ia.get_indices(f2att);
 
+  /* Rows within both the att1 range and the att2 range */
   int start_row1 = find_index(ivatt1, ds, train_rows, att1_start, att1, true);
   int end_row1 = find_index(ivatt1, ds, train_rows, att1_end, att1, false);
-  std::vector<int> *iv1 = Helper::get_vector_subset(ivatt1, start_row1, end_row1+1);
+  row_set rows1(train_rows.size());
+  rows1.insert(ivatt1, start_row1, end_row1+1);
 
   int start_row2 = find_index(ivatt2, ds, train_rows, att2_start, att2, true);
   int end_row2 = find_index(ivatt2, ds, train_rows, att2_end, att2, false);
-  std::vector<int> *iv2 = Helper::get_vector_subset(ivatt2, start_row2, end_row2+1);
-
-  std::vector<int> *indices = Helper::intersection(*iv1, *iv2);
+  row_set rows2(train_rows.size());
+  rows2.insert(ivatt2, start_row2, end_row2+1);
 
-  delete iv1;
-  delete iv2;
+  rows1.intersect(rows2);
+  std::vector<int> *indices = rows1.to_vector();
 
   this->indices = indices;
 }
@@ -9,9 +9,12 @@
 #ifndef PROJECT_H_
 #define PROJECT_H_
 
-#include "binary_tree.hpp"
+#include "datset.hpp"
 #include "helper.hpp"
 
+class discrete_projection;
+class numeric_projection;
+
 /*
  * Represents 2-d subset of data, bounded like a rectangular box.
  */
@@ -96,14 +99,22 @@ class projection {
   virtual double get_projection_metric() = 0;
 
   /*
-   * Creates projection from -
+   * Creates numeric projection from -
+   * att1's row subset (start-end) of ivatt1
+   * att2's row subset (opt_first-opt_last) of ivatt2
+   */
+  static numeric_projection *mk_numeric_projection(Datset &ds, std::vector<int> &train_rows,
+                                                   std::vector<int> &ivatt1, int start, int end,
+                                                   std::vector<int> &ivatt2, int opt_first, int opt_last, int att1, int att2);
+
+  /*
+   * Creates discrete projection from -
    * att1's row subset (start-end) of ivatt1
-   * att2's row subset selected in binary tree 'node' of ivatt2
-   * node - Binary tree containing optimal range of att2
+   * att2's row subset (opt_first-opt_last) of ivatt2
    */
-  static projection *mk_projection_from_tree(btree_node *node, Datset &ds, std::vector<int> &train_rows, 
-					     std::vector<int> &ivatt1, int start, int end,
-					     std::vector<int> &ivatt2, int att1, int att2);
+  static discrete_projection *mk_discrete_projection(Datset &ds, std::vector<int> &train_rows,
+                                                     std::vector<int> &ivatt1, int start, int end,
+                                                     std::vector<int> &ivatt2, int opt_first, int opt_last, int att1, int att2);
 
   virtual const int get_total() = 0;
 
@@ -1,5 +1,6 @@
 #include <boost/python.hpp>
 
+#define FIND_PROJECTIONS_MODULE
 #include "datset.hpp"
 #include "search.hpp"
 #include "discrete_projection.hpp"
@@ -45,6 +46,266 @@ public:
   }
 };
 
+/*
+ * Releases the GIL for the lifetime of the object, letting other Python threads run during long native calls.
+ * Nothing inside its scope may touch Python objects.
+ */
+class release_gil {
+private:
+  PyThreadState *state;
+public:
+  release_gil() { state = PyEval_SaveThread(); }
+  ~release_gil() { PyEval_RestoreThread(state); }
+};
+
+/*
+ * Holds a read (search) or write (update) lock on a Datset for the lifetime of the object
+ */
+class datset_lock {
+private:
+  Datset &ds;
+public:
+  datset_lock(Datset &ds, bool write) : ds(ds) {
+    if(write)
+      ds.write_lock();
+    else
+      ds.read_lock();
+  }
+  ~datset_lock() { ds.unlock(); }
+};
+
+/*
+ * Values of 'object', an array (or sequence) of 'size' values (-1 for any number) as float64, copied while holding the GIL
+ */
+static std::vector<double> double_values(PyObject *object, int size) {
+  /* New reference, converted to a contiguous float64 array unless already one */
+  p::handle<> converted(PyArray_ContiguousFromAny(object, NPY_DOUBLE, 0, 0));
+  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(converted.get());
+  if(size >= 0 && PyArray_SIZE(array) != size) {
+    PyErr_SetString(PyExc_ValueError, "Values should hold one value per row");
+    p::throw_error_already_set();
+  }
+  double *data = reinterpret_cast< double * >( PyArray_DATA(array) );
+  return std::vector<double>(data, data + PyArray_SIZE(array));
+}
+
+/*
+ * Values of 'object', an array of row or attribute pair numbers, as ints
+ */
+static std::vector<int> int_values(p::object object) {
+  std::vector<double> values = double_values(object.ptr(), -1);
+  std::vector<int> result(values.size());
+  for (unsigned int i = 0; i < values.size(); ++i)
+    result[i] = (int)values[i];
+  return result;
+}
+
+/*
+ * Checks that 'object' is a contiguous 1-d array of 'size' search records (feature_map.BOX_DTYPE). Returns its data.
+ */
+static search_record *record_data(PyObject *object, int size) {
+  PyArrayObject *array = reinterpret_cast<PyArrayObject *>(object);
+  if(!PyArray_Check(object) || PyArray_NDIM(array) != 1 || !PyArray_IS_C_CONTIGUOUS(array) || (size >= 0 && PyArray_DIM(array, 0) != size) ||
+     (PyArray_DIM(array, 0) > 0 && PyArray_STRIDE(array, 0) != (int)sizeof(search_record))) {
+    PyErr_SetString(PyExc_ValueError, "Records should be a contiguous 1-d array of search boxes, one per box");
+    p::throw_error_already_set();
+  }
+  return reinterpret_cast< search_record * >( PyArray_DATA(array) );
+}
+
+/*
+ * top_k - Keep only the best 'top_k' boxes, in order of 'rank_by' (0 to keep all)
+ * screen_purity - Skip attribute pairs where neither attribute alone reaches this purity (0 to evaluate all pairs).
+ *                 Values above the largest class proportion can miss boxes.
+ * sample_size, candidates, seed - Approximate search : Search on all rows only the 'candidates' attribute pairs with the
+ *                                 best boxes on a stratified sample of 'sample_size' rows (0 for exact search)
+ * pairs - None, or 1-d float64 array of the attribute pairs to search, as i * attributes + j with i < j
+ */
+static feature_map *search_projections(search &s, Datset &ds, int bin_size, int support, double purity_threshold, int mode,
+                                       int num_threads, int top_k, int rank_by, double screen_purity,
+                                       int sample_size, int candidates, int seed, p::object pairs) {
+  std::vector<int> subset;
+  bool has_pairs = !pairs.is_none();
+  if(has_pairs)
+    subset = int_values(pairs);
+
+  release_gil nogil;
+  datset_lock lock(ds, false);
+  return s.search_projections(ds, bin_size, support, purity_threshold, mode, num_threads, top_k, rank_by, screen_purity,
+                              sample_size, candidates, seed, has_pairs ? &subset : NULL);
+}
+
+/*
+ * Merges the boxes of searches of disjoint sets of attribute pairs (search_projections() with 'pairs').
+ * parts - List of (records, stats) of each search : its boxes from feature_map.fill_records() and its get_stats() dict
+ * elapsed - Wall-clock seconds spent before merging, added to total_time
+ * Stats become the sums of the parts' counters and phase times, with 'thread_busy' the busy time of each part.
+ */
+static feature_map *merge_projections(search &s, Datset &ds, p::list parts, int top_k, int rank_by, double elapsed) {
+  int size = p::len(parts);
+  std::vector<search_record *> records(size);
+  std::vector<int> sizes(size);
+  for(int k=0; k<size; k++) {
+    PyObject *array = p::object(parts[k][0]).ptr();
+    records[k] = record_data(array, -1);
+    sizes[k] = PyArray_DIM(reinterpret_cast<PyArrayObject *>(array), 0);
+  }
+
+  search_stats stats;
+  stats.total_time = elapsed;
+  stats.thread_busy.clear();
+  for(int k=0; k<size; k++) {
+    p::dict part = p::extract<p::dict>(parts[k][1]);
+    stats.sort_time += p::extract<double>(part["sort_time"]);
+    stats.tree_time += p::extract<double>(part["tree_time"]);
+    stats.evaluation_time += p::extract<double>(part["evaluation_time"]);
+    stats.counters.pairs += p::extract<long>(part["pairs_evaluated"]);
+    stats.counters.ranges += p::extract<long>(part["ranges_evaluated"]);
+    stats.counters.tree_updates += p::extract<long>(part["tree_updates"]);
+    stats.counters.pruned += p::extract<long>(part["pruned_evaluations"]);
+    stats.counters.screened += p::extract<long>(part["pairs_screened"]);
+    stats.counters.boxes_found += p::extract<long>(part["boxes_found"]);
+    stats.counters.boxes_replaced += p::extract<long>(part["boxes_replaced"]);
+    stats.counters.boxes_rejected += p::extract<long>(part["boxes_rejected"]);
+
+    double busy = 0;
+    p::list part_busy = p::extract<p::list>(part["thread_busy"]);
+    for(int t=0; t<p::len(part_busy); t++)
+      busy += p::extract<double>(part_busy[t]);
+    stats.thread_busy.push_back(busy);
+  }
+
+  release_gil nogil;
+  datset_lock lock(ds, false);
+  return s.merge_projections(ds, records, sizes, top_k, rank_by, stats);
+}
+
+/*
+ * Writes all boxes of 'fmap', in order, to 'records' : a 1-d array of feature_map.BOX_DTYPE, one per box
+ */
+static void fill_records(feature_map &fmap, PyObject *records) {
+  search_record *out = record_data(records, fmap.get_num_projections());
+  fmap.fill_records(out);
+}
+
+/*
+ * array - Fortran-ordered 2-d int32 array (rows x columns) to keep the sorted rows of each attribute in,
+ *         e.g. in shared memory so several processes can use them
+ * is_sorted - 'array' already holds them (filled by another Datset of the same data). Otherwise they are written to it.
+ */
+static void set_sorted_rows(Datset &ds, PyObject *array, bool is_sorted, int num_threads) {
+  int *base = ds.hold_sorted_rows(array);
+  release_gil nogil;
+  datset_lock lock(ds, true);
+  ds.set_sorted_rows(base, is_sorted, num_threads);
+}
+
+/*
+ * rows - None, or 1-d float64 array of rows to learn from instead of the Datset's training rows
+ * timeout, max_rounds - Wall-clock seconds and greedy rounds after which to stop (negative for no limit)
+ * screen_purity - As for search_projections()
+ */
+static projection_array *find_easy_explain_data(search &s, Datset &ds, double val_prop, int bin_size, int support,
+                                                double purity_threshold, int mode, int num_threads, bool lazy,
+                                                p::object rows, int seed, double timeout, int max_rounds,
+                                                double screen_purity) {
+  std::vector<int> subset;
+  bool has_rows = !rows.is_none();
+  if(has_rows)
+    subset = int_values(rows);
+
+  release_gil nogil;
+  datset_lock lock(ds, false);
+  return s.find_easy_explain_data(ds, val_prop, bin_size, support, purity_threshold, mode, num_threads, lazy,
+                                  has_rows ? &subset : NULL, seed, timeout, max_rounds, screen_purity);
+}
+
+/*
+ * Counters and phase times (wall-clock seconds) of the last search to return as a dict.
+ * 'rounds' has the times of each greedy round, 'thread_busy' the time each search thread spent on attribute pairs.
+ * 'approximate' has the sample and candidate settings of an approximate search (None if exact).
+ */
+static p::dict get_stats(search &s) {
+  search_stats stats = s.get_stats();
+  p::dict result;
+
+  result["total_time"] = stats.total_time;
+  result["sort_time"] = stats.sort_time;
+  result["tree_time"] = stats.tree_time;
+  result["evaluation_time"] = stats.evaluation_time;
+  result["validation_time"] = stats.validation_time;
+  result["removal_time"] = stats.removal_time;
+
+  result["pairs_evaluated"] = stats.counters.pairs;
+  result["ranges_evaluated"] = stats.counters.ranges;
+  result["tree_updates"] = stats.counters.tree_updates;
+  result["pruned_evaluations"] = stats.counters.pruned;
+  result["pairs_screened"] = stats.counters.screened;
+  result["boxes_found"] = stats.counters.boxes_found;
+  result["boxes_replaced"] = stats.counters.boxes_replaced;
+  result["boxes_rejected"] = stats.counters.boxes_rejected;
+  result["validation_rejected"] = stats.validation_rejected;
+  result["greedy_rounds"] = stats.rounds.size();
+  result["partial"] = stats.partial;
+
+  p::list rounds;
+  for(unsigned int k=0; k<stats.rounds.size(); k++) {
+    round_stats &round = stats.rounds[k];
+    p::dict r;
+    r["tree_time"] = round.tree_time;
+    r["evaluation_time"] = round.evaluation_time;
+    r["validation_time"] = round.validation_time;
+    r["removal_time"] = round.removal_time;
+    r["pairs_evaluated"] = round.pairs;
+    rounds.append(r);
+  }
+  result["rounds"] = rounds;
+
+  p::list busy;
+  for(unsigned int k=0; k<stats.thread_busy.size(); k++)
+    busy.append(stats.thread_busy[k]);
+  result["thread_busy"] = busy;
+
+  p::object approximate;
+  if(stats.sample_rows > 0) {
+    p::dict a;
+    a["sample_rows"] = stats.sample_rows;
+    a["sample_binsize"] = stats.sample_bin_size;
+    a["sample_support"] = stats.sample_support;
+    a["candidates"] = stats.candidate_budget;
+    a["sample_pairs_evaluated"] = stats.sample_pairs;
+    a["sample_time"] = stats.sample_time;
+    approximate = a;
+  }
+  result["approximate"] = approximate;
+
+  return result;
+}
+
+/*
+ * The values are copied while holding the GIL. It is then released while waiting for running searches to finish.
+ */
+static void fill_datset_output_for_classification(Datset &ds, PyObject *array) {
+  std::vector<double> values = double_values(array, ds.get_rows());
+  release_gil nogil;
+  datset_lock lock(ds, true);
+  ds.fill_datset_output_for_classification(values);
+}
+
+static void fill_datset_output_for_regression(Datset &ds, PyObject *array) {
+  std::vector<double> values = double_values(array, ds.get_rows());
+  release_gil nogil;
+  datset_lock lock(ds, true);
+  ds.fill_datset_output_for_regression(values);
+}
+
+static void set_training_rows(Datset &ds, p::object array) {
+  std::vector<int> rows = int_values(array);
+  release_gil nogil;
+  datset_lock lock(ds, true);
+  ds.set_training_rows(rows);
+}
+
 /*
  * Python class and method declarations
  */
@@ -53,20 +314,42 @@ BOOST_PYTHON_MODULE(libfind_projections) {
 
   Py_Initialize();
   //np::initialize();
+  if(_import_array() < 0)
+    p::throw_error_already_set();
 
   class_<Datset>("Datset", init<PyObject *>())
-  .def("fill_datset_output_for_classification", &Datset::fill_datset_output_for_classification)
-  .def("fill_datset_output_for_regression", &Datset::fill_datset_output_for_regression)
-  .def("set_training_rows", &Datset::set_training_rows)
+  .def(init<PyObject *, bool>())
+  .def("fill_datset_output_for_classification", &fill_datset_output_for_classification)
+  .def("fill_datset_output_for_regression", &fill_datset_output_for_regression)
+  .def("set_training_rows", &set_training_rows)
   .def("is_valid", &Datset::is_valid)
   .def("get_size", &Datset::get_rows)
   .def("get_default_value", &Datset::get_default_value)
   .def("ds_real_ref", &Datset::ds_real_ref)
+  .def("is_wrapped", &Datset::is_wrapped)
+  .def("is_single_precision", &Datset::is_single_precision)
+  .def("get_label_width", &Datset::get_label_width)
+  .def("set_sorted_rows", &set_sorted_rows, (arg("self"), arg("array"), arg("is_sorted")=false, arg("num_threads")=1))
   ;
 
   class_<search>("search")
-    .def("search_projections", &search::search_projections, return_value_policy<manage_new_object>())
-    .def("find_easy_explain_data", &search::find_easy_explain_data, return_value_policy<manage_new_object>())
+    .def("search_projections", &search_projections,
+         (arg("self"), arg("ds"), arg("bin_size"), arg("support"), arg("purity"), arg("mode"), arg("num_threads"),
+          arg("top_k")=0, arg("rank_by")=0, arg("screen_purity")=0.0, arg("sample_size")=0, arg("candidates")=100,
+          arg("seed")=-1, arg("pairs")=object()),
+         return_value_policy<manage_new_object>())
+    .def("merge_projections", &merge_projections,
+         (arg("self"), arg("ds"), arg("parts"), arg("top_k")=0, arg("rank_by")=0, arg("elapsed")=0.0),
+         return_value_policy<manage_new_object>())
+    .def("get_pruned_evaluations", &search::get_pruned_evaluations)
+    .def("get_stats", &get_stats)
+    .def("set_logger", &search::set_logger)
+    .def("set_verbose", &search::set_verbose)
+    .def("find_easy_explain_data", &find_easy_explain_data,
+         (arg("self"), arg("ds"), arg("val_prop"), arg("bin_size"), arg("support"), arg("purity"), arg("mode"), arg("num_threads"),
+          arg("lazy")=false, arg("rows")=object(), arg("seed")=-1, arg("timeout")=-1.0, arg("max_rounds")=-1,
+          arg("screen_purity")=0.0),
+         return_value_policy<manage_new_object>())
     ;
 
   class_<projection_wrap, boost::noncopyable>("projection")
@@ -97,10 +380,18 @@ BOOST_PYTHON_MODULE(libfind_projections) {
   class_<feature_map>("feature_map")
     .def("get_num_projections", &feature_map::get_num_projections)
     .def("get_projection", &feature_map::get_projection, return_value_policy<reference_existing_object>())
+    .def("fill_records", &fill_records)
     ;
 
   class_<projection_array>("projection_array")
     .def("get_num_projections", &projection_array::get_num_projections)
     .def("get_projection", &projection_array::get_projection, return_value_policy<reference_existing_object>())
+    .def("find_first_match", &projection_array::find_first_match)
+    .def("is_partial", &projection_array::is_partial)
+    ;
+
+  class_<decision_list>("decision_list", init<PyObject *>())
+    .def("get_num_projections", &decision_list::get_num_projections)
+    .def("find_first_match", &decision_list::find_first_match)
     ;
 }
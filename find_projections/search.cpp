@@ -20,42 +20,125 @@
 #include "numeric_projection.hpp"
 
 #include <vector>
-#include <set>
+#include <deque>
+#include <queue>
+#include <cfloat>
+#include <random>
+#include <cstdarg>
+#include <atomic>
 
-static indices_array *remove_projection(indices_array &ia, projection *pr);
+static indices_array *remove_projection(indices_array &ia, projection *pr, int num_rows);
+static box_score rank_score(int rank_by, bool is_numeric_problem);
 
-static bool validate_params(Datset &ds, int bin_size,int support, double purity_threshold, int num_threads, int mode) {
+/*
+ * Wall-clock deadline and greedy round limit of a search.
+ * The deadline is checked between attribute pairs (by every search thread) and between greedy rounds.
+ */
+class search_limits {
+private:
+  double deadline;                 /* Helper::wall_time() to stop at (negative for none) */
+  int max_rounds;                  /* Negative for none */
+  std::atomic<bool> expired;       /* Set once a check finds the deadline passed */
+public:
+  search_limits(double timeout, int max_rounds) : max_rounds(max_rounds), expired(false) {
+    deadline = (timeout >= 0) ? Helper::wall_time() + timeout : -1;
+  }
+
+  /*
+   * Checks the clock. True once the deadline has passed.
+   */
+  bool timed_out() {
+    if(!expired && deadline >= 0 && Helper::wall_time() >= deadline)
+      expired = true;
+    return expired;
+  }
+
+  /*
+   * True if an earlier timed_out() found the deadline passed, i.e. some work was skipped
+   */
+  bool has_expired() { return expired; }
+
+  bool rounds_done(int rounds) { return max_rounds >= 0 && rounds >= max_rounds; }
+};
+
+search_stats search::get_stats() {
+  pthread_mutex_lock(&stats_mutex);
+  search_stats copy = last_stats;
+  pthread_mutex_unlock(&stats_mutex);
+  return copy;
+}
+
+void search::set_stats(search_stats &call_stats) {
+  pthread_mutex_lock(&stats_mutex);
+  last_stats = call_stats;
+  pthread_mutex_unlock(&stats_mutex);
+}
+
+/*
+ * Copies the stats of a call to its search object when the call returns, on every return path
+ */
+class stats_publisher {
+private:
+  search &s;
+  search_stats &stats;
+public:
+  stats_publisher(search &s, search_stats &stats) : s(s), stats(stats) {}
+  ~stats_publisher() { s.set_stats(stats); }
+};
+
+/*
+ * Prints/logs a message formatted as by printf. May be called without holding the GIL.
+ */
+void search::log(const char *format, ...) {
+  char message[1024];
+  va_list args;
+  va_start(args, format);
+  vsnprintf(message, sizeof(message), format, args);
+  va_end(args);
+
+  /* 'verbose' and 'logger' are set from Python, so are only read holding the GIL */
+  PyGILState_STATE state = PyGILState_Ensure();
+  if(verbose && logger.is_none())
+    printf("%s\n", message);
+  else if(verbose) {
+    try {
+      logger(std::string(message));
+    }
+    catch(p::error_already_set &) {
+      PyErr_Print();
+    }
+  }
+  PyGILState_Release(state);
+}
+
+bool search::validate_params(Datset &ds, int bin_size,int support, double purity_threshold, int num_threads, int mode) {
   #ifdef DEBUG
   printf("binsize = %d, support =  %d, purity =  %f, num_threads = %d, mode = %d\n", bin_size, support, purity_threshold, num_threads, mode);
   #endif
   
   if(ds.is_valid() == false) {
-    printf("Invalid dataset / label column\n");
+    log("Invalid dataset / label column");
     return false;
   }
 
   int size = ds.get_rows();
   if(bin_size <= 0 || bin_size > size) {
-    printf("binsize should be a positive integer and less than your data size!\n");
+    log("binsize should be a positive integer and less than your data size!");
     return false;
   }
   if(support <= 0 || support > size) {
-    printf("support should be a positive integer and less than your data size!\n");
+    log("support should be a positive integer and less than your data size!");
     return false;
   }
 
   if(purity_threshold <= 0.0 || purity_threshold > 1.0) {
-    printf("purity should be a double between 0.0 - 1.0\n");
+    log("purity should be a double between 0.0 - 1.0");
     return false;
   }
 
   return true;
 }
 
-static bool is_power_of_two(int n) {
-  return !(n & (n-1));
-}
-
 static double compute_mean(Datset &ds, std::vector<int> &train_rows, std::vector<int> &indices) {
   double truemean = 0.0;
   for(unsigned int i=0; i<indices.size(); i++) {
@@ -69,38 +152,21 @@ static double compute_mean(Datset &ds, std::vector<int> &train_rows, std::vector
 }
 
 /*
- * Reset class distribution vectors at the leaf nodes
+ * Reset counts (class distribution vectors at the leaf nodes) of the part of the tree which had data added
  */
-static void reset_leaves_vector(std::vector<btree_node *> & leaves) {
-  unsigned int i=0, gsize = leaves.size();
-  for(i=0; i<gsize; i++) {
-    btree_node *node = leaves[i];
-    node->reset_node(false);
-  }
+static void reset_tree(numeric_binary_tree *ntree, multi_class_tree *mct) {
+  if(mct)
+    mct->reset_tree();
+  else
+    ntree->reset_touched();
 }
 
-static void process_projection_from_tree(std::vector<projection *> & pr_array, btree_node *node, Datset &ds, std::vector<int> &train_rows,
-                     int i, std::vector<int> &ivatt1,
-                     int j, std::vector<int> &ivatt2,
-                     int m, int n,
-                     int class_label, int pos, int neg) {
-  projection *pr = projection::mk_projection_from_tree(node, ds, train_rows, ivatt1, m, n,
-                               ivatt2, i, j);
-
-  if(class_label >= 0) { // Discrete projection
-    discrete_projection *dp = (discrete_projection *)pr;
-    dp->set_class(class_label);
-    dp->set_pos(pos);
-    dp->set_neg(neg);
-  }
-  else { // Numeric projection
-    numeric_projection *dp = (numeric_projection *)pr;
-    numeric_binary_tree *nbt = (numeric_binary_tree *)node;
-    dp->set_sum_sq_error(nbt->get_node_optimal_sum());
-    dp->set_total(nbt->get_optimal_total());
-    dp->set_mean(nbt->get_mean());
-  }
-  
+/*
+ * Adds 'pr' to 'pr_array' unless it overlaps with a better box already in it.
+ * Overlapping boxes which are worse are replaced by 'pr'.
+ */
+static void add_projection(std::vector<projection *> & pr_array, projection *pr, search_counters *counters) {
+  counters->boxes_found++;
   int gs, gensize = pr_array.size();
   bool overlap = false;
   bool better = false;
@@ -115,6 +181,7 @@ static void process_projection_from_tree(std::vector<projection *> & pr_array, b
         pr_array[gs] = pr;
         delete qr;
         better = true;
+        counters->boxes_replaced++;
       }
     }
   }
@@ -123,64 +190,165 @@ static void process_projection_from_tree(std::vector<projection *> & pr_array, b
     pr_array.push_back(pr);
   }
   else {
-    if(!better)
+    if(!better) {
       delete pr;
+      counters->boxes_rejected++;
+    }
   }
 }
 
+static void process_projection_from_tree(std::vector<projection *> & pr_array, numeric_binary_tree *ntree, Datset &ds, std::vector<int> &train_rows,
+                     int i, std::vector<int> &ivatt1,
+                     int j, std::vector<int> &ivatt2,
+                     int m, int n, search_counters *counters) {
+  numeric_projection *np = projection::mk_numeric_projection(ds, train_rows, ivatt1, m, n,
+                                   ivatt2, ntree->get_node_optimal_start(), ntree->get_node_optimal_end(), i, j);
+  np->set_sum_sq_error(ntree->get_node_optimal_sum());
+  np->set_total(ntree->get_optimal_total());
+  np->set_mean(ntree->get_mean());
+
+  add_projection(pr_array, np, counters);
+}
+
 /*
- * Function to create valid row subsets for feature 'i'.
- * Duplicates are put in same bin
+ * Same as process_projection_from_tree() for the optimal range of class 'class_label' (s-th class evaluated) in a multi_class_tree
  */
-static std::vector<indices> *mk_feature_indices(std::vector<int> &ivatt1, Datset &ds, std::vector<int> &train_rows, int bin_size, int i) {
-  int rows = ivatt1.size();
-  std::vector<indices> *vec = new std::vector<indices>();
+static void process_projection_from_multi_class_tree(std::vector<projection *> & pr_array, multi_class_tree &mct, Datset &ds,
+                     std::vector<int> &train_rows,
+                     int i, std::vector<int> &ivatt1,
+                     int j, std::vector<int> &ivatt2,
+                     int m, int n,
+                     int s, int class_label, int pos, int neg, search_counters *counters) {
+  discrete_projection *dp = projection::mk_discrete_projection(ds, train_rows, ivatt1, m, n,
+                                   ivatt2, mct.get_node_optimal_start(s), mct.get_node_optimal_end(s), i, j);
+  dp->set_class(class_label);
+  dp->set_pos(pos);
+  dp->set_neg(neg);
+
+  add_projection(pr_array, dp, counters);
+}
 
-  int size = rows/bin_size;
-  vec->reserve(size * size);
+/*
+ * Per-class prefix counts along the sorted order 'ivatt1' of attribute 'i'.
+ * counts[k*arity + l] = No. of rows of class 'l' among the first 'k' rows
+ */
+static void mk_class_prefix_counts(std::vector<int> &ivatt1, Datset &ds, std::vector<int> &train_rows, std::vector<int> &counts) {
+  int rows = ivatt1.size();
+  int arity = ds.get_num_classes();
+
+  counts.assign((rows+1) * arity, 0);
+  for(int k=0; k<rows; k++) {
+    int label = (int)ds.ds_output_ref(train_rows[ivatt1[k]]);
+    for(int l=0; l<arity; l++)
+      counts[(k+1)*arity + l] = counts[k*arity + l];
+    counts[(k+1)*arity + label]++;
+  }
+}
 
-  /* Loop through all possible contiguous block of rows
-   * Here rows mean the sorted values for a single dimension f1att
-   */
-  for(int m=0; m<rows; m+=bin_size) {
-    double start_value = ds.ds_real_ref(train_rows[ivatt1[m]], i);
-    double last_bin_value = -1;
-    if(m-1 >= 0)
-      last_bin_value = ds.ds_real_ref(train_rows[ivatt1[m-1]], i);
-    while(m-1 >= 0 && m < rows-1) {
-      if(start_value - last_bin_value < MIN_DOUBLE) {
-        m++;
-        start_value = ds.ds_real_ref(train_rows[ivatt1[m]], i);
+/*
+ * Attribute pairs to evaluate, the others being skipped.
+ * Assigned pairs : Pairs of this search (as one part of a multi-process search). Others are skipped without counting.
+ * Candidate pairs : Only these pairs (of an approximate search) are evaluated.
+ * Screening by 1-D bounds (discrete output) :
+ * An attribute passes if some range of its sorted rows holding at least 'support' rows has a class proportion
+ * of at least 'screen_purity'. Pairs where neither attribute passes are not evaluated.
+ * A 2-D box can be purer than any range of either of its attributes, so results are exact only if no such box is
+ * wanted. No screen of single attributes is exact in general : the range of a box along one attribute also holds the
+ * rows of other classes outside the box. A 'screen_purity' no higher than the largest class proportion passes every
+ * attribute, so is exact. Above it pairs with boxes can be screened out, and above the search purity they usually are.
+ */
+class pair_screen {
+private:
+  int atts;
+  std::vector<bool> assigned;      /* Per pair (i*atts + j), empty for all pairs */
+  std::vector<bool> candidates;    /* Per pair, empty for all pairs */
+  std::vector<bool> passed;        /* Per attribute, empty if not screening */
+
+  void mk_mask(std::vector<int> &pairs, std::vector<bool> &mask) {
+    mask.assign(atts * atts, false);
+    for(unsigned int k=0; k<pairs.size(); k++)
+      mask[pairs[k]] = true;
+  }
+public:
+  pair_screen(int atts) : atts(atts) {}
+
+  void assign(std::vector<int> &pairs) { mk_mask(pairs, assigned); }
+  void keep_only(std::vector<int> &pairs) { mk_mask(pairs, candidates); }
+
+  void screen_by_purity(Datset &ds, indices_array &ia, std::vector<int> &train_rows, int bin_size, int support,
+                        double screen_purity) {
+    int arity = ds.get_num_classes();
+    std::vector<int> counts;
+    passed.assign(atts, false);
+
+    for(int a=0; a<atts && support > 0; a++) {
+      std::vector<int> &iv = ia.get_indices(a);
+      mk_class_prefix_counts(iv, ds, train_rows, counts);
+      range_iterator ranges(ds, iv, train_rows, a, bin_size);
+      int m, n;
+      while(!passed[a] && ranges.next(&m, &n)) {
+        int size = n-m+1;
+        if(size < support)
+          continue;
+        for(int l=0; l<arity; l++) {
+          int count = counts[(n+1)*arity + l] - counts[m*arity + l];
+          if((double)count/(double)size >= screen_purity) {
+            passed[a] = true;
+            break;
+          }
+        }
       }
-      else
-        break;
     }
-    
-    for(int n=m+bin_size; n<rows; n+=bin_size) {
-      double end_value;
-      int ns;
-      
-      if(n >= rows)
-        n = rows-1;
-      end_value = ds.ds_real_ref(train_rows[ivatt1[n]], i);
-      
-      if(end_value - start_value < MIN_DOUBLE)
-        continue;
-      
-      /* Try to advance index for duplicates/very very close values */
-      for(ns=n+1; ns<rows; ns++) {
-        double value = ds.ds_real_ref(train_rows[ivatt1[ns]], i);
-        if(value - end_value < MIN_DOUBLE)
-          n++;
-        else
-          break;
-      }
-      
-      vec->push_back(indices(m, n));
+  }
+
+  bool is_assigned(int i, int j) {
+    return assigned.empty() || assigned[i*atts + j];
+  }
+
+  bool keep(int i, int j) {
+    if(!candidates.empty() && !candidates[i*atts + j])
+      return false;
+    return passed.empty() || passed[i] || passed[j];
+  }
+
+  /*
+   * True if some pair (i, j) with j > i is to be evaluated
+   */
+  bool has_pairs(int i) {
+    for(int j=i+1; j<atts; j++) {
+      if(is_assigned(i, j) && keep(i, j))
+        return true;
     }
+    return false;
   }
+};
+
+/*
+ * Screen of attribute pairs at 'screen_purity' (0, or numeric output, for none) restricted to 'pairs' (NULL for all).
+ * NULL if all pairs are to be evaluated.
+ */
+static pair_screen *mk_pair_screen(Datset &ds, indices_array &ia, std::vector<int> &train_rows, int bin_size, int support,
+                                   double screen_purity, std::vector<int> *pairs = NULL) {
+  bool screening = screen_purity > 0 && ds.is_classification();
+  if(!screening && !pairs)
+    return NULL;
+  pair_screen *screen = new pair_screen(ds.get_cols());
+  if(screening)
+    screen->screen_by_purity(ds, ia, train_rows, bin_size, support, screen_purity);
+  if(pairs)
+    screen->assign(*pairs);
+  return screen;
+}
 
-  return vec;
+/*
+ * Can a box of class 'l' within sorted rows [m, n] of attribute 'i' meet the support and purity criteria?
+ * The box holds at most the 'count' rows of class 'l' in [m, n] and at least 'support' rows,
+ * so its purity can't be above count/support.
+ */
+static inline bool is_class_feasible(int count, int support, double purity_threshold) {
+  if(support <= 0)
+    return true;
+  return ((double)count/(double)support >= purity_threshold);
 }
 
 /*
@@ -188,66 +356,96 @@ static std::vector<indices> *mk_feature_indices(std::vector<int> &ivatt1, Datset
  * Returns all projection-boxes (non-overlapping) for all classes which meet the criteria
  * support = Min. no. of data points to be contained in a projection-box
  * purity_threshold = Min purity of each projection found
+ * counters = Work done is added to these
+ * class_counts = Prefix counts of 'ivatt1' from mk_class_prefix_counts() (discrete output), NULL to make them here.
+ *                Callers evaluating several pairs of 'i' pass them in, so they are made once per attribute.
  */
 static std::vector<projection *> evaluate_attribute_pair(std::vector<int> &ivatt1, std::vector<int> &ivatt2, feature_tree *ftree, Datset &ds, std::vector<int> &train_rows, int bin_size,
-                             int i, int j, int support, double purity_threshold, int exclude_class, int tree_mode) {
+                             int i, int j, int support, double purity_threshold, int exclude_class, int tree_mode,
+                             search_counters *counters, std::vector<int> *class_counts = NULL) {
   /* For tracking best boxes for this projection */
   std::vector<projection *> pr_array;
 
   pr_array.reserve(10);
 
   bool is_classifier = ds.is_classification();
+  int arity = is_classifier ? ds.get_num_classes() : 0;
+
+  /* Classes that can still meet the criteria in the current range */
+  std::vector<int> own_counts;
+  if(is_classifier && !class_counts)
+    mk_class_prefix_counts(ivatt1, ds, train_rows, own_counts);
+  std::vector<int> &counts = class_counts ? *class_counts : own_counts;
+  std::vector<int> feasible;
+  feasible.reserve(arity);
 
   /* Get binary tree for 'j' dimension */
-  btree_node *node = ftree->getTree(j);
-  std::vector<btree_node *> *leaves = ftree->getLeaves(j);
+  discrete_binary_tree *dtree = NULL;
+  numeric_binary_tree *ntree = NULL;
+  if(is_classifier)
+    dtree = (discrete_binary_tree *)ftree->getTree(j);
+  else
+    ntree = (numeric_binary_tree *)ftree->getTree(j);
+
+  /* Per-class counts of the tree, for evaluating all classes at once */
+  multi_class_tree *mct = NULL;
+  if(is_classifier)
+    mct = new multi_class_tree(dtree);
 
   /* Loop through all possible contiguous block of rows
    * Here rows mean the sorted values for a single dimension 'i'
    */
-  std::vector<indices> *vec = ftree->getIndices(i);
+  range_iterator ranges(ds, ivatt1, train_rows, i, bin_size);
   int orig_m = -1;
   int k = 0;
-  for(unsigned int gs = 0; gs < vec->size(); gs++) {
-    indices & index = vec->at(gs);
-
-    int m = index.getm();
+  int m, n;
+  long num_ranges = 0, tree_updates = 0, pruned = 0;
+  while(ranges.next(&m, &n)) {
+    num_ranges++;
     if(m != orig_m) {
-      orig_m = m;
-      if(gs > 0) {
+      if(orig_m >= 0) {
         k = 0;
-        reset_leaves_vector(*leaves);
+        reset_tree(ntree, mct);
       }
+      orig_m = m;
     }
     
-    int n = index.getn();
     int size = n-m+1;
     if(size < support) 
       continue;
 
-    /* Add all the values for dimension 'j' incrementally into the tree */
-    for(; k<size; k++) {
-      int row = train_rows[ivatt1[k+m]];
-      double value = ds.ds_real_ref(row, j);
-      double score = ds.ds_output_ref(row);
-      btree_node::insert_in_leaf_node(*leaves, value, score);
-    } 
-
+    /* Skip the range when no class can meet the criteria. Rows not added now get added for the next range */
     if(is_classifier) {
-      /* Evaluate best box for each class - Make it +ve, everything else -ve */
-      int arity = ds.get_num_classes();
+      feasible.clear();
       for(int l=0; l<arity; l++) {
         if(l == exclude_class)
           continue;
-        int pos=0, neg=0;
-        
-        discrete_binary_tree::set_leaves_pos(*leaves, l);
-        
-        node->update_tree();
-        
-        discrete_binary_tree *dbt = (discrete_binary_tree *)node;
-        pos = dbt->get_opt_pos();
-        neg = dbt->get_opt_neg();
+        int count = counts[(n+1)*arity + l] - counts[m*arity + l];
+        if(is_class_feasible(count, support, purity_threshold))
+          feasible.push_back(l);
+        else
+          pruned++;
+      }
+      if(feasible.empty())
+        continue;
+    }
+
+    /* Add all the values for dimension 'j' incrementally into the tree */
+    if(is_classifier)
+      dtree->insert_rows(ds, train_rows, ivatt1, m+k, m+size);
+    else
+      ntree->insert_rows(ds, train_rows, ivatt1, m+k, m+size);
+    k = size;
+    tree_updates++;
+
+    if(is_classifier) {
+      /* Evaluate best box for each class - Make it +ve, everything else -ve. All classes in one pass */
+      mct->update_tree(feasible);
+
+      for(unsigned int s=0; s<feasible.size(); s++) {
+        int l = feasible[s];
+        int pos = mct->get_opt_pos(s);
+        int neg = mct->get_opt_neg(s);
         
         double purity = 0.0;
         if(pos + neg > 0)
@@ -255,39 +453,88 @@ static std::vector<projection *> evaluate_attribute_pair(std::vector<int> &ivatt
         bool match_box = ((pos+neg >= support) && (purity >= purity_threshold));
         /* Box found meeting selection criteria */
         if(match_box) 
-          process_projection_from_tree(pr_array, node, ds, train_rows, i, ivatt1, j, ivatt2, m, n,
-                                       l, pos, neg);
-        
-        node->reset_node(true);
+          process_projection_from_multi_class_tree(pr_array, *mct, ds, train_rows, i, ivatt1, j, ivatt2, m, n,
+                                                   s, l, pos, neg, counters);
       } /* Ends for loop for 'l' class */
     }
     else {
-      node->update_tree();
+      ntree->update_tree();
       
-      numeric_binary_tree *nbt = (numeric_binary_tree *)node;
-      int total = nbt->get_optimal_total();
+      int total = ntree->get_optimal_total();
       bool match_box = total >= support;
       bool mean_proper = true;
 
       if(tree_mode == 1)
-        mean_proper = nbt->get_mean() > purity_threshold;
+        mean_proper = ntree->get_mean() > purity_threshold;
       else if(tree_mode == 2)
-        mean_proper = nbt->get_mean() < purity_threshold;
+        mean_proper = ntree->get_mean() < purity_threshold;
 
       /* Box found meeting selection criteria */
       if(match_box && mean_proper) 
-        process_projection_from_tree(pr_array, node, ds, train_rows, i, ivatt1, j, ivatt2, m, n, -1, -1, -1);
-      
-      node->reset_node(true);
+        process_projection_from_tree(pr_array, ntree, ds, train_rows, i, ivatt1, j, ivatt2, m, n, counters);
     } /* Ends else block */
-  } /* Ends for loop for 'gs' */
+  } /* Ends loop over row ranges */
 
-  reset_leaves_vector(*leaves);
+  reset_tree(ntree, mct);
+  if(mct)
+    delete mct;
+
+  counters->pairs++;
+  counters->ranges += num_ranges;
+  counters->tree_updates += tree_updates;
+  counters->pruned += pruned;
 
   return pr_array;
 }
 
-static pthread_mutex_t attribute_mutex = PTHREAD_MUTEX_INITIALIZER;
+/*
+ * Constructs binary tree for attribute 'i' in 'ftree'
+ */
+static void mk_feature_tree_for_att(feature_tree *ftree, Datset &ds, indices_array &ia, std::vector<int> &train_rows, int bin_size,
+                                    int tree_mode, int i) {
+  bool is_classifier = ds.is_classification();
+  std::vector<int> &ivatt2 = ia.get_indices(i);
+
+  /* Construct binary tree for 'i' dimension */
+  btree *node = btree::construct_empty_tree(ds, i, is_classifier, train_rows, ivatt2, bin_size);
+  ftree->setTree(i, node);
+
+  if(!is_classifier) {
+    numeric_binary_tree *nbt = (numeric_binary_tree *)node;
+    if(tree_mode >=0 && tree_mode <= 2)
+      nbt->set_mode(tree_mode);
+  }
+}
+
+static feature_tree *create_feature_tree(Datset &ds, indices_array &ia, std::vector<int> &train_rows, int bin_size, int tree_mode) {
+  int atts = ds.get_cols();
+
+  feature_tree *ftree = new feature_tree(atts);
+
+  /* Loop through all attributes */
+  for(int i=0; i<atts; i++) {
+    mk_feature_tree_for_att(ftree, ds, ia, train_rows, bin_size, tree_mode, i);
+  }
+
+  return ftree;
+}
+
+/*
+ * Unit of work for the threaded search : attribute pairs (i, j) for i in [i_start, i_end)
+ */
+typedef struct pair_chunk {
+  int j;
+  int i_start, i_end;
+}pair_chunk;
+
+/*
+ * Chunks queued for one thread.
+ * The owner takes chunks from the front, idle threads steal from the back.
+ */
+typedef struct work_queue {
+  pthread_mutex_t mutex;
+  std::deque<pair_chunk> chunks;
+}work_queue;
 
 typedef struct thread_struct {
   Datset *ds;
@@ -295,94 +542,152 @@ typedef struct thread_struct {
   int support;
   int bin_size;
   double purity;
-  std::vector<int> atts_used;
-  std::vector<int> train_rows;
+  std::vector<int> *train_rows;
   int mode;
   feature_map *table;
   feature_tree *ftree;
+  std::vector<work_queue> *queues;
+  search_limits *limits;           /* NULL for no limits */
+  pair_screen *screen;             /* NULL to evaluate all pairs */
+  std::vector<std::vector<int> > *class_counts; /* Prefix counts of each attribute, shared by all threads (discrete output) */
+  int id;
+  search_counters counters;        /* Work done by this thread */
+  double busy;                     /* Time spent by this thread on attribute pairs */
 }thread_struct;
 
+/*
+ * Splits all attribute pairs into chunks of roughly equal estimated cost.
+ * Cost of a pair (i, j) ~ No. of row ranges of 'i' (~ leaves^2/2) * No. of leaves in tree of 'j'.
+ * Chunks are dealt round-robin to the thread queues.
+ */
+static void mk_pair_chunks(feature_tree *ftree, int atts, std::vector<work_queue> &queues) {
+  int num_threads = queues.size();
+  std::vector<double> range_cost(atts);
+  double total = 0;
+
+  for(int i=0; i<atts; i++) {
+    double bins = ftree->getTree(i)->get_num_leaves();
+    range_cost[i] = bins * (bins + 1)/2 + 1;
+  }
+  for(int j=1; j<atts; j++) {
+    double leaf_cost = ftree->getTree(j)->get_num_leaves();
+    for(int i=0; i<j; i++)
+      total += range_cost[i] * leaf_cost;
+  }
+
+  /* Several chunks per thread leave room for stealing at the end of the run */
+  double target = total / (num_threads * 16);
+  int next_queue = 0;
+
+  for(int j=atts-1; j>0; j--) {
+    double leaf_cost = ftree->getTree(j)->get_num_leaves();
+    int i_end = j;
+    double cost = 0;
+    for(int i=j-1; i>=0; i--) {
+      cost += range_cost[i] * leaf_cost;
+      if(cost >= target || i == 0) {
+        pair_chunk chunk;
+        chunk.j = j;
+        chunk.i_start = i;
+        chunk.i_end = i_end;
+        queues[next_queue].chunks.push_back(chunk);
+        next_queue = (next_queue + 1) % num_threads;
+        i_end = i;
+        cost = 0;
+      }
+    }
+  }
+}
+
+/*
+ * Takes next chunk from own queue, else steals one from another thread's queue.
+ * Returns false when all queues are empty.
+ */
+static bool get_next_chunk(std::vector<work_queue> &queues, int id, pair_chunk *chunk) {
+  int num_threads = queues.size();
+
+  for(int k=0; k<num_threads; k++) {
+    work_queue &queue = queues[(id + k) % num_threads];
+    bool found = false;
+
+    pthread_mutex_lock(&queue.mutex);
+    if(!queue.chunks.empty()) {
+      found = true;
+      if(k == 0) {
+        *chunk = queue.chunks.front();
+        queue.chunks.pop_front();
+      }
+      else {
+        *chunk = queue.chunks.back();
+        queue.chunks.pop_back();
+      }
+    }
+    pthread_mutex_unlock(&queue.mutex);
+
+    if(found)
+      return true;
+  }
+
+  return false;
+}
+
 void *thread_routine (void *arg) {
   thread_struct *ts = (thread_struct *)arg;
   Datset *ds = ts->ds;
   indices_array *ia = ts->ia;
   feature_map *table = ts->table;
   int bin_size = ts->bin_size;
-  std::vector<int> &atts_used = ts->atts_used;
-  std::vector<int> &train_rows = ts->train_rows;
-  int i, j, support = ts->support;
+  std::vector<int> &train_rows = *(ts->train_rows);
+  int support = ts->support;
   double purity = ts->purity;
-  int atts = ds->get_cols();
   int mode = ts->mode;
-  feature_tree *ftree = ts->ftree;
+  double begin_time = Helper::wall_time();
 
-  if(ds->is_classification() == false)
-    purity = compute_mean(*ds, train_rows, ia->get_indices(0));
+  /* Scratch tree of this thread. Holds one 'j' attribute at a time */
+  feature_tree *scratch = new feature_tree(ds->get_cols());
+  int loaded = -1;
 
-  /* Loop through all pairs of attributes */
-  for(j=atts-1; j>0; j--) {
-    // Synchronized block - Pick an unused attribute
-    pthread_mutex_lock(&attribute_mutex);
-    while(j > 0 && atts_used[j] != 0) {
-      j--;
-    }
-    if(j > 0)
-      atts_used[j] = 1;
-    pthread_mutex_unlock(&attribute_mutex);
-
-    if(j == 0)
+  pair_chunk chunk;
+  search_limits *limits = ts->limits;
+  while(get_next_chunk(*(ts->queues), ts->id, &chunk)) {
+    if(limits && limits->timed_out())
       break;
+    int j = chunk.j;
+    if(j != loaded) {
+      if(loaded >= 0)
+        scratch->release(loaded);
+      mk_feature_tree_for_att(scratch, *ds, *ia, train_rows, bin_size, mode, j);
+      loaded = j;
+    }
 
     int f2att = j; /* X-axis */
     std::vector<int> &ivatt2 = ia->get_indices(f2att);
 
-    for(i=j-1; i>=0; i--) {
+    for(int i=chunk.i_end-1; i>=chunk.i_start; i--) {
+      if(limits && limits->timed_out())
+        break;
+      if(ts->screen && !ts->screen->is_assigned(i, j))
+        continue;
+      if(ts->screen && !ts->screen->keep(i, j)) {
+        ts->counters.screened++;
+        continue;
+      }
       int f1att = i; /* Y-axis */
       std::vector<int> &ivatt1 = ia->get_indices(f1att);
 
       /* For tracking best boxes for this projection */
-      std::vector<projection *> pr_array = evaluate_attribute_pair(ivatt1, ivatt2, ftree,
-                                   *ds, train_rows, bin_size, i, j, support, purity, -1, mode);
+      std::vector<int> *counts = ds->is_classification() ? &(*ts->class_counts)[i] : NULL;
+      std::vector<projection *> pr_array = evaluate_attribute_pair(ivatt1, ivatt2, scratch,
+                                   *ds, train_rows, bin_size, i, j, support, purity, -1, mode, &ts->counters, counts);
 
       prlist prl(pr_array);
       table->setProjections(i, j, prl);
     }
-
-    printf("Finished all projections containing feature %d\n", j);
-  }
-  
-  return NULL;
-}
-
-static feature_tree *create_feature_tree(Datset &ds, indices_array &ia, std::vector<int> &train_rows, int bin_size, int tree_mode) {
-  int atts = ds.get_cols();
-
-  feature_tree *ftree = new feature_tree(atts);
-  bool is_classifier = ds.is_classification();
-
-  /* Loop through all attributes */
-  for(int i=0; i<atts; i++) {
-    std::vector<btree_node *> *leaves = new std::vector<btree_node *>();
-    int f2att = i; /* X-axis */
-    std::vector<int> &ivatt2 = ia.get_indices(f2att);
-
-    /* Construct binary tree for 'f2att' dimension */
-    btree_node *node = btree_node::construct_empty_tree(ds, i, is_classifier, train_rows, ivatt2, bin_size, leaves);
-    ftree->setTree(i, node);
-
-    if(!is_classifier) {
-      numeric_binary_tree *nbt = (numeric_binary_tree *)node;
-      if(tree_mode >=0 && tree_mode <= 2)
-        nbt->set_mode(tree_mode);
-    }
-    
-    ftree->setLeaves(i, leaves);
-
-    std::vector<indices> *vec = mk_feature_indices(ivatt2, ds, train_rows, bin_size, i);
-    ftree->setIndices(i, vec);
   }
 
-  return ftree;
+  delete scratch;
+  ts->busy = Helper::wall_time() - begin_time;
+  return NULL;
 }
 
 /*
@@ -391,40 +696,77 @@ static feature_tree *create_feature_tree(Datset &ds, indices_array &ia, std::vec
  * bin_size : Size of data points in each tree leaf
  * support = Min. no. of data points to be contained in a projection-box
  * purity_threshold = Min purity of each projection found
+ * stats = Work done and time spent by each thread are added to these
+ * limits = Pairs left when the deadline passes are not evaluated (NULL for no limits)
+ * top_k, score = Keep only the best 'top_k' boxes by 'score' (0 to keep all)
+ * screen = Attribute pairs to evaluate (NULL for all pairs)
+ * Attribute pairs are split into chunks, queued per thread, with idle threads stealing from busy ones.
+ * For discrete output the class prefix counts of all attributes are kept during the search, (rows+1) * classes ints each.
  */
 feature_map *search_for_max_subrectangles_threaded(Datset &ds, feature_tree *ftree, std::vector<int> &train_rows, int bin_size,
-                           int support, double purity_threshold, int num_threads, int mode, indices_array &ia) {
+                           int support, double purity_threshold, int num_threads, int mode, indices_array &ia,
+                           search_stats *stats, search_limits *limits = NULL, int top_k = 0, box_score score = NULL,
+                           pair_screen *screen = NULL) {
   int i, atts;
 
   atts = ds.get_cols();
 
-  feature_map *table = new feature_map(atts);
+  feature_map *table = new feature_map(atts, top_k, score);
 
-  std::vector<pthread_t> thread_id(num_threads);
+  if(ds.is_classification() == false)
+    purity_threshold = compute_mean(ds, train_rows, ia.get_indices(0));
 
-  thread_struct args;
-  args.ds = &ds;
-  args.ia = &ia;
-  args.bin_size = bin_size;
-  args.table = table;
-  args.train_rows = train_rows;
-  args.support = support;
-  args.purity = purity_threshold;
-  args.mode = mode;
-  args.ftree = ftree;
+  std::vector<work_queue> queues(num_threads);
+  for(i=0; i<num_threads; i++)
+    pthread_mutex_init(&queues[i].mutex, NULL);
+  mk_pair_chunks(ftree, atts, queues);
+
+  /* Threads take the pairs of an attribute in different chunks, so its class counts are made once for all of them */
+  std::vector<std::vector<int> > class_counts(atts);
+  if(ds.is_classification()) {
+    for(i=0; i<atts-1; i++) {
+      if(!screen || screen->has_pairs(i))
+        mk_class_prefix_counts(ia.get_indices(i), ds, train_rows, class_counts[i]);
+    }
+  }
 
-  std::vector<int> atts_used(atts);
-  args.atts_used = atts_used;
+  std::vector<pthread_t> thread_id(num_threads);
+  std::vector<thread_struct> args(num_threads);
 
   for(i=0; i<num_threads; i++) {
-    pthread_create(&thread_id[i], NULL, thread_routine, &args);
+    args[i].ds = &ds;
+    args[i].ia = &ia;
+    args[i].bin_size = bin_size;
+    args[i].table = table;
+    args[i].train_rows = &train_rows;
+    args[i].support = support;
+    args[i].purity = purity_threshold;
+    args[i].mode = mode;
+    args[i].ftree = ftree;
+    args[i].queues = &queues;
+    args[i].limits = limits;
+    args[i].screen = screen;
+    args[i].class_counts = &class_counts;
+    args[i].id = i;
+    args[i].counters = search_counters();
+    args[i].busy = 0;
+    pthread_create(&thread_id[i], NULL, thread_routine, &args[i]);
   }
 
   for (i=0; i<num_threads; i++) {
     void *thread_result;
     pthread_join(thread_id[i], &thread_result);
+    stats->counters.add(args[i].counters);
   }
 
+  if((int)stats->thread_busy.size() < num_threads)
+    stats->thread_busy.resize(num_threads, 0);
+  for(i=0; i<num_threads; i++)
+    stats->thread_busy[i] += args[i].busy;
+
+  for(i=0; i<num_threads; i++)
+    pthread_mutex_destroy(&queues[i].mutex);
+
   return table;
 }
 
@@ -433,12 +775,19 @@ feature_map *search_for_max_subrectangles_threaded(Datset &ds, feature_tree *ftr
  * bin_size : Size of data points in each tree leaf
  * support = Min. no. of data points to be contained in a projection-box
  * purity_threshold = Min purity of each projection found
+ * stats = Work done and time spent are added to these
+ * limits = Pairs left when the deadline passes are not evaluated (NULL for no limits)
+ * top_k, score = Keep only the best 'top_k' boxes by 'score' (0 to keep all)
+ * screen = Attribute pairs to evaluate (NULL for all pairs)
  */
 feature_map *search_for_max_subrectangles(Datset &ds, feature_tree *ftree, std::vector<int> &train_rows,
-                      int bin_size, int support, double purity_threshold, int mode, indices_array &ia) {
+                      int bin_size, int support, double purity_threshold, int mode, indices_array &ia,
+                      search_stats *stats, search_limits *limits = NULL, int top_k = 0, box_score score = NULL,
+                      pair_screen *screen = NULL) {
   int atts = ds.get_cols();
+  double begin_time = Helper::wall_time();
 
-  feature_map *table = new feature_map(atts);
+  feature_map *table = new feature_map(atts, top_k, score);
 
   if(ds.is_classification() == false)
     purity_threshold = compute_mean(ds, train_rows, ia.get_indices(0));
@@ -447,59 +796,310 @@ feature_map *search_for_max_subrectangles(Datset &ds, feature_tree *ftree, std::
   for(int i=0; i<atts-1; i++) {
     int f1att = i; /* Y-axis */
     std::vector<int> &ivatt1 = ia.get_indices(f1att);
+
+    /* Class counts along 'i', made for its first pair evaluated and shared by the rest */
+    std::vector<int> counts;
     
     for(int j=i+1; j<atts; j++) {
+      if(limits && limits->timed_out())
+        break;
+      if(screen && !screen->is_assigned(i, j))
+        continue;
+      if(screen && !screen->keep(i, j)) {
+        stats->counters.screened++;
+        continue;
+      }
       int f2att = j; /* X-axis */
       std::vector<int> &ivatt2 = ia.get_indices(f2att);
       
+      if(ds.is_classification() && counts.empty())
+        mk_class_prefix_counts(ivatt1, ds, train_rows, counts);
+
       /* For tracking best boxes for this projection */
       std::vector<projection *> array = evaluate_attribute_pair(ivatt1, ivatt2, ftree,
-                                ds, train_rows, bin_size, i, j, support, purity_threshold, -1, mode);
+                                ds, train_rows, bin_size, i, j, support, purity_threshold, -1, mode, &stats->counters,
+                                ds.is_classification() ? &counts : NULL);
       prlist prl(array);
       table->setProjections(i, j, prl);
     } /* Ends for loop for 'j' att */
-
-    //if(is_power_of_two(i))
-    //  printf("Finished all projections containing feature number %d\n", i);
   } /* Ends for loop for 'i' att*/
 
+  stats->thread_busy[0] += Helper::wall_time() - begin_time;
   return table;
 }
 
+/*
+ * Orders rows by output value
+ */
+class output_order {
+private:
+  Datset &ds;
+public:
+  output_order(Datset &ds) : ds(ds) {
+  }
+
+  bool operator()(int a, int b) {
+    return ds.ds_output_ref(a) < ds.ds_output_ref(b);
+  }
+};
+
+/*
+ * Stratified sample of 'sample_size' of 'rows', in increasing order.
+ * Rows are ordered by output (ties at random) and one row is drawn from each of 'sample_size' equal strata,
+ * so the sample keeps the class proportions (or the spread of the numeric output).
+ * seed - Seed for drawing the rows (negative to use the global rand() state)
+ */
+static std::vector<int> mk_stratified_sample(Datset &ds, std::vector<int> &rows, int sample_size, int seed) {
+  std::mt19937 generator(seed >= 0 ? seed : rand());
+  std::vector<int> order(rows);
+  std::shuffle(order.begin(), order.end(), generator);
+  std::stable_sort(order.begin(), order.end(), output_order(ds));
+
+  long size = order.size();
+  std::vector<int> sample(sample_size);
+  for(int k=0; k<sample_size; k++) {
+    long start = k * size / sample_size;
+    long end = (k+1) * size / sample_size;
+    sample[k] = order[start + generator() % (end - start)];
+  }
+  std::sort(sample.begin(), sample.end());
+  return sample;
+}
+
+/*
+ * First stage of the approximate search : Searches all attribute pairs on 'sample' rows with 'bin_size' and 'support'
+ * as given for the sample, and adds to 'candidate_pairs' (i*atts + j) the 'candidates' pairs whose best box scores
+ * highest by 'score', best first. Pairs without a box on the sample come last, so if 'candidates' covers all the pairs
+ * searched, all of them are searched on all rows.
+ * Only 'pairs' are searched (NULL for all pairs). Work done is added to 'sample_stats'.
+ */
+static void find_candidate_pairs(Datset &ds, std::vector<int> &sample, int bin_size, int support, double purity, int mode,
+                                 int num_threads, double screen_purity, std::vector<int> *pairs, int candidates,
+                                 box_score score, search_stats *sample_stats, std::vector<int> &candidate_pairs) {
+  int atts = ds.get_cols();
+  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, sample, num_threads);
+  feature_tree *ftree = create_feature_tree(ds, *ia, sample, bin_size, mode);
+  pair_screen *screen = mk_pair_screen(ds, *ia, sample, bin_size, support, screen_purity, pairs);
+
+  feature_map *table = NULL;
+  if(num_threads < 2)
+    table = search_for_max_subrectangles(ds, ftree, sample, bin_size, support, purity, mode, *ia, sample_stats, NULL,
+                                         0, NULL, screen);
+  else
+    table = search_for_max_subrectangles_threaded(ds, ftree, sample, bin_size, support, purity, num_threads, mode, *ia,
+                                                  sample_stats, NULL, 0, NULL, screen);
+
+  /* Max-heap on best box score, lower pair index first on ties */
+  std::priority_queue<std::pair<double, int> > queue;
+  for(int i=0; i<atts; i++) {
+    for(int j=i+1; j<atts; j++) {
+      if(screen && !(screen->is_assigned(i, j) && screen->keep(i, j)))
+        continue;
+      prlist &prl = table->getListOfProjections(i, j);
+      double best = -DBL_MAX;
+      for(int k=0; k<prl.size(); k++)
+        best = std::max(best, score(prl.get(k)));
+      queue.push(std::make_pair(best, -(i*atts + j)));
+    }
+  }
+  while(!queue.empty() && (int)candidate_pairs.size() < candidates) {
+    candidate_pairs.push_back(-queue.top().second);
+    queue.pop();
+  }
+
+  delete table;
+  delete screen;
+  delete ftree;
+  delete ia;
+}
+
 /*
  * Main function to exhaustively search for high-sum boxes for all 2-D projections.
  * bin_size : Size of data points in each tree leaf
  * num_threads :  No. of threads to use
  * support = Min. no. of data points to be contained in a projection-box
  * purity_threshold = Min purity of each projection found
+ * top_k = Keep only the best 'top_k' boxes, in order of 'rank_by' (0 to keep all)
+ * screen_purity = Skip attribute pairs failing a pair_screen at this purity (0 to evaluate all pairs)
+ * sample_size, candidates = Approximate search (if 0 < 'sample_size' < rows) : Only the 'candidates' attribute pairs
+ *                           with the best boxes on a stratified sample of 'sample_size' rows are searched on all rows.
+ *                           Candidates are ranked by 'rank_by' if 'top_k' is set, by purity or sum of squared error otherwise.
+ * seed = Seed for drawing the sample (negative to use the global rand() state)
+ * pairs = Attribute pairs to search, as i*atts + j with i < j (NULL for all pairs)
  */
-feature_map *search::search_projections(Datset& ds, int bin_size, int support, double purity_threshold, int mode, int num_threads) {
+feature_map *search::search_projections(Datset& ds, int bin_size, int support, double purity_threshold, int mode, int num_threads,
+                                        int top_k, int rank_by, double screen_purity, int sample_size, int candidates,
+                                        int seed, std::vector<int> *pairs) {
   feature_map *table = NULL;
-  const clock_t begin_time = std::clock();
+  double begin_time = Helper::wall_time();
+  search_stats stats;
+  stats_publisher publish(*this, stats);
+  stats.reset(num_threads);
   bool valid = validate_params(ds, bin_size, support, purity_threshold, num_threads, mode);
   if(!valid)
     return NULL;
 
+  box_score score = NULL;
+  if(top_k > 0) {
+    score = rank_score(rank_by, !ds.is_classification());
+    if(!score) {
+      log("Boxes can be ranked by purity (discrete output), support or sum of squared error (numeric output) only");
+      return NULL;
+    }
+  }
+
+  if(screen_purity > 0 && !ds.is_classification())
+    log("Attribute pairs are screened for discrete output only, evaluating all pairs");
+
+  int atts = ds.get_cols();
+  for(unsigned int k=0; pairs && k<pairs->size(); k++) {
+    int pair = (*pairs)[k];
+    if(pair < 0 || pair >= atts * atts || pair / atts >= pair % atts) {
+      log("Attribute pairs should be given as i * attributes + j, with i < j");
+      return NULL;
+    }
+  }
+
   int rows = ds.get_rows();
   std::vector<int> train_rows(rows);
   for(int i=0; i<rows; i++)
     train_rows[i] = i;
 
+  double phase_time;
+  pair_screen *screen = NULL;
+  bool approximate = sample_size > 0 && sample_size < rows;
+  if(approximate) {
+    if(candidates <= 0) {
+      log("candidates should be a positive integer for the approximate search");
+      return NULL;
+    }
+    phase_time = Helper::wall_time();
+    stats.sample_rows = sample_size;
+    /* Same bin_size, so the sample has 'rows / sample_size' times fewer leaves per attribute to search over */
+    stats.sample_bin_size = std::min(bin_size, std::max(1, sample_size / 2));
+    stats.sample_support = std::max(1, (int)((double)support * sample_size / rows + 0.5));
+    stats.candidate_budget = candidates;
+
+    box_score pair_score = score ? score : rank_score(ds.is_classification() ? RANK_PURITY : RANK_SSE, !ds.is_classification());
+    std::vector<int> sample = mk_stratified_sample(ds, train_rows, sample_size, seed);
+    search_stats sample_stats;
+    sample_stats.reset(num_threads);
+    std::vector<int> candidate_pairs;
+    find_candidate_pairs(ds, sample, stats.sample_bin_size, stats.sample_support, purity_threshold, mode, num_threads,
+                         screen_purity, pairs, candidates, pair_score, &sample_stats, candidate_pairs);
+    stats.sample_pairs = sample_stats.counters.pairs;
+    screen = new pair_screen(atts);
+    screen->keep_only(candidate_pairs);
+    if(pairs)
+      screen->assign(*pairs);
+    stats.sample_time = Helper::wall_time() - phase_time;
+  }
+
   /* Get sorted indices for all attributes.
    * This is done only once /
    */
-  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, train_rows);
+  phase_time = Helper::wall_time();
+  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, train_rows, num_threads);
+  stats.sort_time = Helper::wall_time() - phase_time;
+
+  phase_time = Helper::wall_time();
   feature_tree *ftree = create_feature_tree(ds, *ia, train_rows, bin_size, mode);
+  stats.tree_time = Helper::wall_time() - phase_time;
 
+  phase_time = Helper::wall_time();
+  if(!approximate)
+    screen = mk_pair_screen(ds, *ia, train_rows, bin_size, support, screen_purity, pairs);
   if(num_threads < 2)
-    table = search_for_max_subrectangles(ds, ftree, train_rows, bin_size, support, purity_threshold, mode, *ia);
+    table = search_for_max_subrectangles(ds, ftree, train_rows, bin_size, support, purity_threshold, mode, *ia, &stats, NULL,
+                                         top_k, score, screen);
   else
-    table = search_for_max_subrectangles_threaded(ds, ftree, train_rows, bin_size, support, purity_threshold, num_threads, mode, *ia);
+    table = search_for_max_subrectangles_threaded(ds, ftree, train_rows, bin_size, support, purity_threshold, num_threads, mode, *ia,
+                                                  &stats, NULL, top_k, score, screen);
+  stats.evaluation_time = Helper::wall_time() - phase_time;
+  delete screen;
+
+  #ifdef DEBUG
+  printf("Evaluations pruned = %ld\n", stats.counters.pruned);
+  #endif
 
   delete ftree;
   delete ia;
 
-  printf("Time taken = %d sec\n", (int)(std::clock() - begin_time ) /  CLOCKS_PER_SEC);
+  stats.total_time = Helper::wall_time() - begin_time;
+  log("Time taken = %.2f sec (sort %.2f, trees %.2f, pairs %.2f), %ld boxes found", stats.total_time, stats.sort_time,
+      stats.tree_time, stats.evaluation_time, stats.counters.boxes_found);
+  if(approximate)
+    log("Approximate search on %d sampled rows (binsize %d, support %d) in %.2f sec, %ld of %ld attribute pairs verified",
+        stats.sample_rows, stats.sample_bin_size, stats.sample_support, stats.sample_time, stats.counters.pairs,
+        stats.sample_pairs);
+  else if(stats.counters.screened > 0)
+    log("%ld of %ld attribute pairs screened out", stats.counters.screened, stats.counters.screened + stats.counters.pairs);
+  return table;
+}
+
+/*
+ * Box of 'record' (as written by feature_map::fill_records())
+ */
+static projection *mk_projection_from_record(search_record &record, bool is_numeric_problem) {
+  if(is_numeric_problem) {
+    numeric_projection *npr = new numeric_projection(record.att1, record.att2, record.bounds[0], record.bounds[1],
+                                                     record.bounds[2], record.bounds[3]);
+    npr->set_mean(record.metric);
+    npr->set_total(record.counts[0]);
+    npr->set_sum_sq_error(record.sum_sq_error);
+    npr->set_coverage(record.coverage);
+    return npr;
+  }
+
+  discrete_projection *dpr = new discrete_projection(record.att1, record.att2, record.bounds[0], record.bounds[1],
+                                                     record.bounds[2], record.bounds[3]);
+  dpr->set_class((int)record.metric);
+  dpr->set_pos(record.counts[1]);
+  dpr->set_neg(record.counts[0] - record.counts[1]);
+  dpr->set_coverage(record.coverage);
+  return dpr;
+}
+
+/*
+ * Merges the boxes of searches of disjoint sets of attribute pairs (search_projections() with 'pairs').
+ * parts - Boxes of each search, 'sizes' search_record each, in the order the search numbered them
+ * Boxes are kept as by a single search of all the pairs : in order of attribute pair, or the best 'top_k' by 'rank_by'.
+ * totals - Stats of all the parts, which become the stats of this call with the time taken to merge added to total_time
+ */
+feature_map *search::merge_projections(Datset &ds, std::vector<search_record *> &parts, std::vector<int> &sizes,
+                                       int top_k, int rank_by, search_stats &totals) {
+  double begin_time = Helper::wall_time();
+  search_stats stats = totals;
+  stats_publisher publish(*this, stats);
+  int atts = ds.get_cols();
+  bool is_numeric_problem = !ds.is_classification();
+
+  box_score score = NULL;
+  if(top_k > 0) {
+    score = rank_score(rank_by, is_numeric_problem);
+    if(!score) {
+      log("Boxes can be ranked by purity (discrete output), support or sum of squared error (numeric output) only");
+      return NULL;
+    }
+  }
+
+  /* Parts searched in top-k mode list boxes best first. Boxes of a pair with equal scores are still in the order
+   * they were found, so ties break as in a single search. */
+  std::map<int, std::vector<projection *> > boxes;
+  for(unsigned int p=0; p<parts.size(); p++) {
+    for(int k=0; k<sizes[p]; k++) {
+      search_record &record = parts[p][k];
+      boxes[record.att1 * atts + record.att2].push_back(mk_projection_from_record(record, is_numeric_problem));
+    }
+  }
+
+  feature_map *table = new feature_map(atts, top_k, score);
+  for(std::map<int, std::vector<projection *> >::iterator it = boxes.begin(); it != boxes.end(); ++it) {
+    prlist prl(it->second);
+    table->setProjections(it->first / atts, it->first % atts, prl);
+  }
+
+  stats.total_time += Helper::wall_time() - begin_time;
   return table;
 }
 
@@ -532,16 +1132,204 @@ bool is_projection_better(projection *pr, int mode, bool is_numeric_problem, dou
   return purity_lb > maxpurity;
 }
 
+/*
+ * Score used to rank candidate projections in lazy greedy mode (higher is better).
+ * Same ordering as is_projection_better() for discrete output and low variance (mode 0) boxes.
+ */
+static double greedy_score(projection *pr, bool is_numeric_problem) {
+  if(is_numeric_problem) {
+    numeric_projection *np = (numeric_projection *)pr;
+    return -np->get_sum_sq_error();
+  }
+
+  discrete_projection *dp = (discrete_projection *)pr;
+  double purity = (double)dp->get_pos()/(double)(dp->get_neg() + dp->get_pos());
+  return compute_lower_confidence_interval(purity, dp->get_total(), 1.96);
+}
+
+static double purity_score(projection *pr) {
+  return greedy_score(pr, false);
+}
+
+static double support_score(projection *pr) {
+  return pr->get_total();
+}
+
+static double sse_score(projection *pr) {
+  return greedy_score(pr, true);
+}
+
+/*
+ * Score for ranking boxes by 'rank_by' (higher is better), NULL if it does not apply to the output type
+ */
+static box_score rank_score(int rank_by, bool is_numeric_problem) {
+  if(rank_by == RANK_PURITY && !is_numeric_problem)
+    return purity_score;
+  if(rank_by == RANK_SUPPORT)
+    return support_score;
+  if(rank_by == RANK_SSE && is_numeric_problem)
+    return sse_score;
+  return NULL;
+}
+
+/*
+ * Best projection found so far in a lazy greedy round
+ */
+typedef struct greedy_choice {
+  double score;                    /* Score of best projection */
+  int pair;                        /* Index (i*atts + j) of attribute pair it came from */
+  projection *pr;                  /* Copy of best projection (NULL if none yet) */
+}greedy_choice;
+
+/*
+ * Goes through the projections found for attribute pair 'pair'.
+ * Keeps the best one holding up on the validation set in 'choice'. Ties go to the lowest pair index, as in a full scan.
+ * Sets 'priority' to the best score among all projections of the pair, which orders it in later rounds.
+ */
+static void consider_pair_projections(prlist &array, Datset &ds, std::vector<int> &val_rows, int mode, double purity,
+                                      bool is_numeric_problem, int pair, double *priority, greedy_choice &choice, long *rejected) {
+  *priority = -DBL_MAX;
+
+  for(int k=0; k<array.size(); k++) {
+    projection *candidate = array.get(k);
+    double score = greedy_score(candidate, is_numeric_problem);
+    if(score > *priority)
+      *priority = score;
+
+    bool better = (score > choice.score) || (choice.pr && score == choice.score && pair < choice.pair);
+    if(!better)
+      continue;
+    int valsupport = 0;
+    if(!candidate->is_projection_good_on_validation_set(ds, val_rows, mode, 0, purity, &valsupport))
+      (*rejected)++;
+    else {
+      if(choice.pr)
+        delete choice.pr;
+      if(is_numeric_problem)
+        choice.pr = new numeric_projection();
+      else
+        choice.pr = new discrete_projection();
+      candidate->copy_projection(choice.pr);
+      choice.score = score;
+      choice.pair = pair;
+    }
+  }
+}
+
+/*
+ * Finds the best projection for one round of decision list learning, evaluating as few attribute pairs as possible.
+ * priorities - Score of each pair when it was last evaluated. Pairs are re-evaluated in decreasing order of priority
+ *              until no remaining priority can beat the best fresh score. A priority is not an upper bound : removing rows
+ *              re-cuts the bins and can raise a pair's purity (or lower its squared error), so a pair left unevaluated
+ *              may hold a better box and the result can differ from a full scan after the first round.
+ *              Empty in the first round, where all pairs are evaluated.
+ * stats - Work done is added to these. Time spent on validation is added to 'round'.
+ * limits - Stops evaluating pairs once the deadline passes
+ * screen_purity - Screens attribute pairs in the first round; screened pairs get no priority, so are never re-evaluated
+ * Returns copy of best projection (NULL if none found)
+ */
+static projection *find_best_projection_lazily(Datset &ds, feature_tree *ftree, indices_array &ia, std::vector<int> &train_rows,
+                                               std::vector<int> &val_rows, int bin_size, int support, double purity, int mode,
+                                               int num_threads, std::vector<double> &priorities, search_stats *stats,
+                                               round_stats *round, search_limits *limits, double screen_purity) {
+  int atts = ds.get_cols();
+  bool is_numeric_problem = !(ds.is_classification());
+
+  greedy_choice choice;
+  choice.score = is_numeric_problem ? -1E6 : 0;
+  choice.pair = -1;
+  choice.pr = NULL;
+
+  if(priorities.empty()) {
+    priorities.resize(atts * atts, -DBL_MAX);
+
+    feature_map *table = NULL;
+    pair_screen *screen = mk_pair_screen(ds, ia, train_rows, bin_size, support, screen_purity);
+    if(num_threads <= 2)
+      table = search_for_max_subrectangles(ds, ftree, train_rows, bin_size, support, purity, mode, ia, stats, limits, 0, NULL,
+                                           screen);
+    else
+      table = search_for_max_subrectangles_threaded(ds, ftree, train_rows, bin_size, support, purity, num_threads, mode, ia, stats,
+                                                    limits, 0, NULL, screen);
+    delete screen;
+
+    double begin_time = Helper::wall_time();
+    for(int i=0; i<atts; i++) {
+      for(int j=i+1; j<atts; j++) {
+        int pair = i*atts + j;
+        consider_pair_projections(table->getListOfProjections(i, j), ds, val_rows, mode, purity, is_numeric_problem, pair,
+                                  &priorities[pair], choice, &stats->validation_rejected);
+      }
+    }
+    round->validation_time += Helper::wall_time() - begin_time;
+
+    delete table;
+    return choice.pr;
+  }
+
+  double tree_purity = purity;
+  if(is_numeric_problem)
+    tree_purity = compute_mean(ds, train_rows, ia.get_indices(0));
+
+  /* Max-heap on priority, lower pair index first on ties */
+  std::priority_queue<std::pair<double, int> > queue;
+  for(unsigned int pair=0; pair<priorities.size(); pair++) {
+    if(priorities[pair] > choice.score)
+      queue.push(std::make_pair(priorities[pair], -(int)pair));
+  }
+
+  while(!queue.empty() && !limits->timed_out()) {
+    double priority = queue.top().first;
+    int pair = -queue.top().second;
+    if(choice.pr && (priority < choice.score || (priority == choice.score && pair > choice.pair)))
+      break;
+    queue.pop();
+
+    int i = pair / atts;
+    int j = pair % atts;
+    double begin_time = Helper::wall_time();
+    std::vector<projection *> garr = evaluate_attribute_pair(ia.get_indices(i), ia.get_indices(j), ftree,
+                                                             ds, train_rows, bin_size, i, j, support, tree_purity, -1, mode,
+                                                             &stats->counters);
+    stats->thread_busy[0] += Helper::wall_time() - begin_time;
+
+    begin_time = Helper::wall_time();
+    prlist array(garr);
+    consider_pair_projections(array, ds, val_rows, mode, purity, is_numeric_problem, pair, &priorities[pair], choice,
+                              &stats->validation_rejected);
+    round->validation_time += Helper::wall_time() - begin_time;
+
+    for(unsigned int k=0; k<garr.size(); k++)
+      delete garr[k];
+  }
+
+  return choice.pr;
+}
+
 /*
  * Learn decision list showing easily separable data
+ * lazy - Re-evaluate only the most promising attribute pairs after the first round (discrete output and mode 0 only).
+ *        Approximate : later rounds can pick other boxes than the full search.
+ * rows - Rows to learn from (NULL for the training rows set on the Datset, or all rows)
+ * seed - Seed for splitting off the validation rows (negative to use the global rand() state)
+ * timeout - Wall-clock seconds after which to stop (negative for no limit)
+ * max_rounds - Max. no. of greedy rounds (negative for no limit)
+ * screen_purity - Skip attribute pairs failing a pair_screen at this purity (0 to evaluate all pairs)
+ * A round cut short by the deadline is dropped, so a partial list holds the boxes of the completed rounds.
  */
 projection_array *search::find_easy_explain_data(Datset& ds, double val_prop, int bin_size, int support, double purity, int mode,
-                                                 int num_threads) {
+                                                 int num_threads, bool lazy, std::vector<int> *rows_subset, int seed,
+                                                 double timeout, int max_rounds, double screen_purity) {
+  double begin_time = Helper::wall_time();
+  search_limits limits(timeout, max_rounds);
+  search_stats stats;
+  stats_publisher publish(*this, stats);
+  stats.reset(num_threads);
   bool valid = validate_params(ds, bin_size, support, purity, num_threads, mode);
   if(!valid)
     return NULL;
 
-  std::vector<int> *subset = ds.get_training_rows();
+  std::vector<int> *subset = rows_subset ? rows_subset : ds.get_training_rows();
 
   int i, j, k, rows;
   int atts = ds.get_cols();
@@ -561,11 +1349,16 @@ projection_array *search::find_easy_explain_data(Datset& ds, double val_prop, in
 
   if(val_prop <= 0.0 || val_prop >= 1.0) {
     val_prop = 0.1;
-    printf("Validation set proportion needs to be between 0 - 1\n");
+    log("Validation set proportion needs to be between 0 - 1");
   }
 
   int train_prop = rows - (int)(val_prop * rows + 0.5);
-  std::random_shuffle(seq.begin(), seq.end());
+  if(seed >= 0) {
+    std::mt19937 generator(seed);
+    std::shuffle(seq.begin(), seq.end(), generator);
+  }
+  else
+    std::random_shuffle(seq.begin(), seq.end());
 
   std::vector<int> *train_rows = Helper::get_vector_subset(seq, 0, train_prop);
   std::vector<int> *val_rows = Helper::get_vector_subset(seq, train_prop, rows);
@@ -575,62 +1368,111 @@ projection_array *search::find_easy_explain_data(Datset& ds, double val_prop, in
   #endif
 
   projection *pr = NULL;
-  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, *train_rows);
+  double phase_time = Helper::wall_time();
+  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, *train_rows, num_threads);
+  stats.sort_time = Helper::wall_time() - phase_time;
   std::vector<double> proportions;
   std::vector<projection *> pr_array;
 
   bool is_numeric_problem = !(ds.is_classification());
 
+  /* Validation of high/low mean boxes depends on the best box so far, so those need the full scan */
+  bool lazy_greedy = lazy && (!is_numeric_problem || mode == 0);
+  std::vector<double> priorities;
+
   // Loop through all projections finding the best one greedily at each iteration
   // Stop when you can't find a projection meeting criteria
   do {
+    if(pr) {
+      delete pr;
+      pr = NULL;
+    }
+
+    if(limits.rounds_done(stats.rounds.size()) || limits.timed_out()) {
+      stats.partial = true;
+      break;
+    }
+
+    round_stats round = round_stats();
+    long pairs = stats.counters.pairs;
+
     feature_map *table = NULL;
+    phase_time = Helper::wall_time();
     feature_tree *ftree = create_feature_tree(ds, *ia, *train_rows, bin_size, mode);
-
-    if(num_threads <= 2)
-      table = search_for_max_subrectangles(ds, ftree, *train_rows, bin_size, support, purity, mode, *ia);
+    round.tree_time = Helper::wall_time() - phase_time;
+
+    phase_time = Helper::wall_time();
+    pair_screen *screen = NULL;
+    if(!lazy_greedy)
+      screen = mk_pair_screen(ds, *ia, *train_rows, bin_size, support, screen_purity);
+    if(lazy_greedy)
+      pr = find_best_projection_lazily(ds, ftree, *ia, *train_rows, *val_rows, bin_size, support, purity, mode, num_threads,
+                                       priorities, &stats, &round, &limits, screen_purity);
+    else if(num_threads <= 2)
+      table = search_for_max_subrectangles(ds, ftree, *train_rows, bin_size, support, purity, mode, *ia, &stats, &limits, 0, NULL,
+                                           screen);
     else
-      table = search_for_max_subrectangles_threaded(ds, ftree, *train_rows, bin_size, support, purity, num_threads, mode, *ia);
+      table = search_for_max_subrectangles_threaded(ds, ftree, *train_rows, bin_size, support, purity, num_threads, mode, *ia,
+                                                    &stats, &limits, 0, NULL, screen);
+    delete screen;
+    round.evaluation_time = Helper::wall_time() - phase_time - round.validation_time;
+    round.pairs = stats.counters.pairs - pairs;
+
+    /* Deadline passed before all attribute pairs were evaluated : the round's best box is unknown, so drop it */
+    if(limits.has_expired()) {
+      if(pr) {
+        delete pr;
+        pr = NULL;
+      }
+      delete table;
+      delete ftree;
+      stats.tree_time += round.tree_time;
+      stats.evaluation_time += round.evaluation_time;
+      stats.partial = true;
+      break;
+    }
 
     double maxpurity = 0;
     double sqerr = 1E6;
     double mean = (mode == 1) ? 0 : 1E6;
 
-    if(pr) {
-      delete pr;
-      pr = NULL;
-    }
-
     // Loop through all projections finding the best one greedily
-    for(i=0; i<atts; i++) {
+    phase_time = Helper::wall_time();
+    for(i=0; i<atts && table; i++) {
       for(j=i+1; j<atts; j++) {
         prlist array = table->getListOfProjections(i, j);
         for(k=0; k<array.size(); k++) {
           projection *bestprojection = array.get(k); 
           int valsupport = 0;
-          if(is_projection_better(bestprojection, mode, is_numeric_problem, maxpurity, mean, sqerr) &&
-             bestprojection->is_projection_good_on_validation_set(ds, *val_rows, mode, mean, purity, &valsupport)) {
-            if(pr)
-              delete pr;
-            if(is_numeric_problem) {
-              numeric_projection *np = new numeric_projection();
-              pr = np;
-              bestprojection->copy_projection(pr);
-              mean = np->get_mean();
-              sqerr = np->get_sum_sq_error();
-            }
-            else {
-              discrete_projection *dp = new discrete_projection();
-              pr = dp;
-              bestprojection->copy_projection(pr);
-              double mp = (double)dp->get_pos()/(double)(dp->get_neg() + dp->get_pos());
-              maxpurity = compute_lower_confidence_interval(mp, dp->get_total(), 1.96);
-            }
+          if(!is_projection_better(bestprojection, mode, is_numeric_problem, maxpurity, mean, sqerr))
+            continue;
+          if(!bestprojection->is_projection_good_on_validation_set(ds, *val_rows, mode, mean, purity, &valsupport)) {
+            stats.validation_rejected++;
+            continue;
+          }
+          if(pr)
+            delete pr;
+          if(is_numeric_problem) {
+            numeric_projection *np = new numeric_projection();
+            pr = np;
+            bestprojection->copy_projection(pr);
+            mean = np->get_mean();
+            sqerr = np->get_sum_sq_error();
+          }
+          else {
+            discrete_projection *dp = new discrete_projection();
+            pr = dp;
+            bestprojection->copy_projection(pr);
+            double mp = (double)dp->get_pos()/(double)(dp->get_neg() + dp->get_pos());
+            maxpurity = compute_lower_confidence_interval(mp, dp->get_total(), 1.96);
           }
         } //End loop for k
       } // End loop for j
     } // End loop for i
+    if(table)
+      round.validation_time = Helper::wall_time() - phase_time;
 
+    phase_time = Helper::wall_time();
     if(pr) { //Found best projection
       #ifdef DEBUG
       pr->pprojection();
@@ -643,7 +1485,7 @@ projection_array *search::find_easy_explain_data(Datset& ds, double val_prop, in
       else
         dp = new discrete_projection();
 
-      indices_array *newia = remove_projection(*ia, pr);
+      indices_array *newia = remove_projection(*ia, pr, train_rows->size());
       delete ia;
       ia = newia;
       tcount += pr->get_total();
@@ -654,56 +1496,63 @@ projection_array *search::find_easy_explain_data(Datset& ds, double val_prop, in
       pr_array.push_back(dp);
     }
 
+    round.removal_time = Helper::wall_time() - phase_time;
+
     delete table;
     delete ftree;
+
+    stats.tree_time += round.tree_time;
+    stats.evaluation_time += round.evaluation_time;
+    stats.validation_time += round.validation_time;
+    stats.removal_time += round.removal_time;
+    stats.rounds.push_back(round);
   } while(pr && tcount < train_rows->size());
 
   #ifdef DEBUG
+  if(lazy_greedy)
+    printf("Attribute pairs evaluated = %ld\n", stats.counters.pairs);
+  printf("Evaluations pruned = %ld\n", stats.counters.pruned);
   printf("easy data explained = %u / %lu (%f)\n\n", tcount, train_rows->size(), (double)tcount/(double)(train_rows->size()));
 
   projection::print_decision_list(pr_array, ds, proportions, is_numeric_problem);
   #endif
 
+  if(pr)
+    delete pr;
+
   projection_array *prarray = new projection_array(pr_array);
+  prarray->set_partial(stats.partial);
 
   delete train_rows;
   delete val_rows;
   delete ia;
 
+  stats.total_time = Helper::wall_time() - begin_time;
+  log("Time taken = %.2f sec (sort %.2f, trees %.2f, pairs %.2f, validation %.2f, removal %.2f), %d boxes in %d rounds%s",
+      stats.total_time, stats.sort_time, stats.tree_time, stats.evaluation_time, stats.validation_time, stats.removal_time,
+      (int)pr_array.size(), (int)stats.rounds.size(), stats.partial ? " (stopped early)" : "");
   return prarray;
 }
 
 /*
  * Remove rows in projection from each indices in indices_array.
+ * num_rows - Positions in the indices are in [0, num_rows)
  */
-indices_array *remove_projection(indices_array &ia, projection *pr) {
-  int i, j;
+indices_array *remove_projection(indices_array &ia, projection *pr, int num_rows) {
   if(!pr)
     return NULL;
 
+  row_set covered(num_rows);
   std::vector<int> &common = *(pr->get_indices());
-  std::set<int> ht;
-
-  for(unsigned i=0; i<common.size(); i++) {
-    int val = common[i];
-    ht.insert(val);
-  }
+  covered.insert(common, 0, common.size());
 
-  int rows = ia.size();
-  int cols = ia.get_indices(0).size() - common.size();
-  indices_array *newia = new indices_array(rows);
+  int atts = ia.size();
+  indices_array *newia = new indices_array(atts);
 
-  for(i=0; i<rows; i++) {
-    std::vector<int> &iv = ia.get_indices(i);
-    std::vector<int> *vec = new std::vector<int>(cols);
+  for(int i=0; i<atts; i++) {
+    std::vector<int> *vec = new std::vector<int>();
+    covered.filter_out(ia.get_indices(i), *vec);
     newia->set_indices(i, vec);
-    int k = cols-1;
-    for(j=iv.size()-1; j>=0; j--) {
-      int val = iv[j];
-      const bool is_in = ht.find(val) != ht.end();
-      if(is_in == false)  
-        vec->at(k--) = val;
-    }
   }
   
   return newia;
@@ -721,7 +1570,7 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
   int neg = bfound->get_neg();
  
   if(ds.is_classification() == false) {
-    printf("Please run this option for symbolic/discrete output only!\n");
+    log("Please run this option for symbolic/discrete output only!");
     return;
   }
 
@@ -737,7 +1586,10 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
     Helper::sort_indices_based_on_values(ds, att, iv);
   }
 
-  printf("Trying to clean projection now\n");
+  search_stats stats;
+  stats_publisher publish(*this, stats);
+  stats.reset(1);
+  log("Trying to clean projection now");
   while(neg > 0) {
     int maxsum = 0;
     feature_tree *ftree = create_feature_tree(ds, *ia, train_rows, bin_size, -1);
@@ -746,6 +1598,8 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
     for(i=0; i<atts-1; i++) {     
       int f1att = i; /* Y-axis */
       std::vector<int> &ivatt1 = ia->get_indices(f1att);
+      std::vector<int> counts;
+      mk_class_prefix_counts(ivatt1, ds, train_rows, counts);
 
       for(j=i+1; j<atts; j++) {
     
@@ -754,7 +1608,8 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
         
         /* For tracking best box for this projection */
         std::vector<projection *> garr = evaluate_attribute_pair(ivatt1, ivatt2, ftree,
-                                                                 ds, train_rows, bin_size, i, j, 2, 1.0, bfound->get_class(), -1);
+                                                                 ds, train_rows, bin_size, i, j, 2, 1.0, bfound->get_class(), -1,
+                                                                 &stats.counters, &counts);
         for(unsigned int k=0; k<garr.size(); k++) {
           discrete_projection *pr = (discrete_projection *)garr[k];
           int this_sum = pr->get_pos();
@@ -777,10 +1632,10 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
     #endif
     discrete_projection *bp = (discrete_projection *)bestprojection;
     neg -= bp->get_pos();
-    printf("Left with %d pos and %d neg\n", pos, neg);
+    log("Left with %d pos and %d neg", pos, neg);
 
     bestprojection->mk_projection_indices(ds, train_rows, *ia);
-    indices_array *newia = remove_projection(*ia, bestprojection);
+    indices_array *newia = remove_projection(*ia, bestprojection, train_rows.size());
     delete bestprojection;
     bestprojection = NULL;
     delete ia;
@@ -789,7 +1644,6 @@ void search::find_nuggets_in_projection(Datset& ds, std::vector<int> &train_rows
   } /* Ends while loop */
 
   delete ia;
-  printf("\n\n");
 }
 
 /*
@@ -802,7 +1656,7 @@ void search::find_class_nuggets(Datset& ds, int bin_size, int support, double pu
   int atts = ds.get_cols();
 
   if(ds.is_classification() == false) {
-    printf("Please run this option for symbolic/discrete output only!\n");
+    log("Please run this option for symbolic/discrete output only!");
     return;
   }
 
@@ -810,11 +1664,14 @@ void search::find_class_nuggets(Datset& ds, int bin_size, int support, double pu
   for(int i=0; i<rows; i++)
     train_rows[i] = i;
 
-  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, train_rows);
+  indices_array *ia = Helper::mk_indices_array_sorted_values(ds, train_rows, 1);
+  search_stats stats;
+  stats_publisher publish(*this, stats);
+  stats.reset(1);
 
   do {
     feature_tree *ftree = create_feature_tree(ds, *ia, train_rows, bin_size, -1);
-    feature_map *table = search_for_max_subrectangles(ds, ftree, train_rows, bin_size, support, purity, -1, *ia);
+    feature_map *table = search_for_max_subrectangles(ds, ftree, train_rows, bin_size, support, purity, -1, *ia, &stats);
 
     int maxsupport = 0;
     if(pr) {
@@ -843,8 +1700,8 @@ void search::find_class_nuggets(Datset& ds, int bin_size, int support, double pu
       pr->pprojection();
       #endif
       pr->mk_projection_indices(ds, train_rows, *ia);
+      indices_array *newia = remove_projection(*ia, pr, train_rows.size());
       delete ia;
-      indices_array *newia = remove_projection(*ia, pr);
       ia = newia;
     }
 
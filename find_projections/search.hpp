@@ -13,9 +13,121 @@
 #include "projection.hpp"
 #include "feature_map.hpp"
 
+/* Orders for keeping only the best boxes of search_projections() */
+#define RANK_PURITY 0                /* Lower confidence bound of purity (discrete output) */
+#define RANK_SUPPORT 1               /* No. of data points */
+#define RANK_SSE 2                   /* Lowest sum of squared error (numeric output) */
+
+/*
+ * Work counters of a search. Each search thread keeps its own, summed when the thread is done.
+ */
+typedef struct search_counters {
+  long pairs;                      /* Attribute pairs evaluated */
+  long ranges;                     /* Row ranges (m, n) enumerated */
+  long tree_updates;               /* Row ranges for which the tree optima were recomputed */
+  long pruned;                     /* (Row range, class) evaluations skipped as unable to meet support and purity */
+  long screened;                   /* Attribute pairs skipped by screening */
+  long boxes_found;                /* Boxes meeting support and purity */
+  long boxes_replaced;             /* Kept boxes replaced by a better overlapping box */
+  long boxes_rejected;             /* Boxes dropped for overlapping a better box */
+
+  void add(const search_counters &other) {
+    pairs += other.pairs;
+    ranges += other.ranges;
+    tree_updates += other.tree_updates;
+    pruned += other.pruned;
+    screened += other.screened;
+    boxes_found += other.boxes_found;
+    boxes_replaced += other.boxes_replaced;
+    boxes_rejected += other.boxes_rejected;
+  }
+}search_counters;
+
+/*
+ * Wall-clock times (seconds) of one greedy round of find_easy_explain_data()
+ */
+typedef struct round_stats {
+  double tree_time;                /* Building the feature trees */
+  double evaluation_time;          /* Evaluating attribute pairs */
+  double validation_time;          /* Checking candidate boxes on the validation rows */
+  double removal_time;             /* Removing the rows of the chosen box */
+  long pairs;                      /* Attribute pairs evaluated */
+}round_stats;
+
+/*
+ * Counters and wall-clock phase times (seconds) of one search_projections() or find_easy_explain_data() call
+ */
+class search_stats {
+public:
+  search_counters counters;
+  double total_time, sort_time, tree_time, evaluation_time, validation_time, removal_time;
+  long validation_rejected;        /* Boxes better than the best so far failing on the validation rows */
+  std::vector<round_stats> rounds; /* Greedy rounds (empty for search_projections()) */
+  std::vector<double> thread_busy; /* Time each search thread spent evaluating attribute pairs */
+  bool partial;                    /* Greedy search stopped by its deadline or round limit */
+
+  /* Approximate search_projections() (all 0 if exact) */
+  int sample_rows;                 /* Rows sampled */
+  int sample_bin_size, sample_support; /* binsize (as given, at most half the sample) and support scaled to the sample */
+  int candidate_budget;            /* Max. no. of attribute pairs searched on all rows */
+  long sample_pairs;               /* Attribute pairs searched on the sample */
+  double sample_time;              /* Sampling and searching the sample */
+
+  search_stats() { reset(1); }
+
+  void reset(int num_threads) {
+    counters = search_counters();
+    total_time = sort_time = tree_time = evaluation_time = validation_time = removal_time = 0;
+    validation_rejected = 0;
+    partial = false;
+    sample_rows = sample_bin_size = sample_support = candidate_budget = 0;
+    sample_pairs = 0;
+    sample_time = 0;
+    rounds.clear();
+    thread_busy.assign(num_threads < 1 ? 1 : num_threads, 0);
+  }
+};
+
+/*
+ * Several calls may run concurrently on one search object (from Python threads, with the GIL released).
+ * Each call counts into its own search_stats, copied to 'last_stats' when it returns.
+ */
 class search {
 private:
+  search_stats last_stats;         /* Stats of the last call to return */
+  pthread_mutex_t stats_mutex;     /* Guards 'last_stats' */
+  bool verbose;                    /* Print messages (or pass them to 'logger') */
+  p::object logger;                /* Python callable receiving each message (None to print them) */
+
+  bool validate_params(Datset &ds, int bin_size,int support, double purity_threshold, int num_threads, int mode);
 public:
+  search() : verbose(true) { pthread_mutex_init(&stats_mutex, NULL); }
+  ~search() { pthread_mutex_destroy(&stats_mutex); }
+
+/*
+ * Messages are printed to stdout by default. A Python callable 'logger' gets each message (a str) instead,
+ * None restores printing. set_verbose(false) drops all messages.
+ */
+  void set_logger(p::object logger) { this->logger = logger; }
+  void set_verbose(bool verbose) { this->verbose = verbose; }
+
+/*
+ * Prints/logs a message formatted as by printf. May be called without holding the GIL.
+ */
+  void log(const char *format, ...);
+
+/*
+ * Copy of the stats of the last call to return. With concurrent calls, each call's stats are complete
+ * but only those of the last one to return are kept.
+ */
+  search_stats get_stats();
+  void set_stats(search_stats &call_stats);
+
+/*
+ * No. of (row range, class) evaluations skipped as unable to meet support and purity in the last
+ * search_projections() or find_easy_explain_data() call to return
+ */
+  long get_pruned_evaluations() { return get_stats().counters.pruned; }
 
 /*
  * Keep the nuggets in the projection as indicated by class.
@@ -32,16 +144,49 @@ public:
  * 0 : Tries to find low variance boxes
  * 1 : Tries to find high mean boxes
  * 2 : Tries to find low mean boxes
+ * top_k : Keep only the best 'top_k' boxes, in order of 'rank_by' (0 to keep all boxes, in order of attribute pair)
+ * rank_by : RANK_PURITY, RANK_SUPPORT or RANK_SSE
+ * screen_purity : Evaluate only attribute pairs where one of the attributes alone has a range of at least 'support' rows
+ *                 with a class proportion of at least 'screen_purity' (discrete output; 0 to evaluate all pairs).
+ *                 Not exact : values above the largest class proportion can miss boxes (see pair_screen).
+ * sample_size, candidates : Approximate search if 0 < 'sample_size' < rows. All attribute pairs are searched on a
+ *                           stratified sample of 'sample_size' rows, with the same bin_size (so fewer leaves) and
+ *                           support scaled down to it, and only the 'candidates' pairs with the best boxes there are
+ *                           searched on all rows.
+ * seed : Seed for drawing the sample (negative to use the global rand() state)
+ * pairs : Attribute pairs to search, as i * attributes + j with i < j (NULL for all pairs).
+ *         Searches of disjoint sets of pairs can be merged with merge_projections().
  */
-  feature_map *search_projections(Datset& Ds, int bin_size, int support, double purity_threshold, int mode, int num_threads);
+  feature_map *search_projections(Datset& Ds, int bin_size, int support, double purity_threshold, int mode, int num_threads,
+                                  int top_k, int rank_by, double screen_purity, int sample_size, int candidates, int seed,
+                                  std::vector<int> *pairs);
 
 /*
  * Learn decision list showing easily separable data
+ * lazy : Re-evaluate only the most promising attribute pairs after the first round,
+ *        ranked by each pair's score from the round it was last evaluated in.
+ *        Approximate : that score is not an upper bound, so later rounds can pick other boxes than the full search.
+ *        Used for discrete output and mode 0 only.
+ * rows : Rows to learn from (NULL for the training rows set on the Datset, or all rows)
+ * seed : Seed for splitting off the validation rows (negative to use the global rand() state)
+ * timeout : Wall-clock seconds after which to stop (negative for no limit)
+ * max_rounds : Max. no. of greedy rounds (negative for no limit)
+ * Stopping early returns the boxes of the rounds completed so far, flagged as partial.
+ * screen_purity : As for search_projections(), redone each round on the rows left (first round only when lazy)
  */
   projection_array *find_easy_explain_data(Datset& Ds, double val_prop, int bin_size, int support, double purity_threshold, int mode,
-                                           int num_threads);
+                                           int num_threads, bool lazy, std::vector<int> *rows, int seed,
+                                           double timeout, int max_rounds, double screen_purity);
 
   void find_class_nuggets(Datset& Ds, int bin_size, int support, double purity);
+
+/*
+ * Merges the boxes of searches of disjoint sets of attribute pairs (search_projections() with 'pairs'), as written by
+ * feature_map::fill_records(). 'parts' holds 'sizes' records each. Boxes are kept as by a single search of all the pairs,
+ * in order of attribute pair or the best 'top_k' by 'rank_by'.
+ */
+  feature_map *merge_projections(Datset& Ds, std::vector<search_record *> &parts, std::vector<int> &sizes,
+                                 int top_k, int rank_by, search_stats &totals);
 };
 
 #endif
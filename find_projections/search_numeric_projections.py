@@ -8,6 +8,7 @@
 # Copyright (c) 2016 Carnegie Mellon University
 ##
 
+import logging
 import os
 from typing import Any
 
@@ -19,7 +20,9 @@ from d3m.metadata import params
 from d3m.primitive_interfaces import base
 from d3m.primitive_interfaces.supervised_learning import SupervisedLearnerPrimitiveBase
 
-from . import feature_map, datset
+from . import feature_map, datset, parallel
+
+logger = logging.getLogger(__name__)
 
 Input = container.DataFrame
 Output = container.DataFrame
@@ -51,6 +54,13 @@ class SearchNumericHyperparams(hyperparams.Hyperparams):
         'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
                                           description='Proportion of training data which is held out for validation '
                                                       'purposes.')
+    approximate_greedy = hyperparams.UniformBool(default=False, semantic_types=[
+        'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+                                                 description='After the first round of decision list learning, '
+                                                             're-evaluate only the attribute pairs that scored best '
+                                                             'when last evaluated. Approximate : faster, but later '
+                                                             'boxes can differ from the exhaustive search. Used for '
+                                                             'mode 0 only.')
 
 
 class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericParams, SearchNumericHyperparams]):
@@ -92,6 +102,7 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
     def __init__(self, *, hyperparams: SearchNumericHyperparams) -> None:
         super().__init__(hyperparams=hyperparams)
         self._search_obj = libfind_projections.search()
+        self._search_obj.set_logger(logger.info)
         self.hyperparams = hyperparams
         self._ds = None
         self._fmap = None
@@ -105,33 +116,66 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
     def __setstate__(self, state):
         self.hyperparams, self._fmap_py, self._default_value, self._is_fitted = state
         self._fmap = None
+        if isinstance(self._fmap_py, list):
+            self._fmap_py = feature_map.DecisionList.from_tuples(self._fmap_py)
 
     """
      Comprehensively evaluates all possible pairs of 2-d projections in the data
      Returns all projection boxes which match search criteria
+     Parameters
+     ----------
+     top_k : Keep only the best 'top_k' boxes, best first (all boxes, in order of attribute pair, if None)
+     rank_by : Order for top_k, 'sse' or 'support'
+     sample_size : Approximate search on this many rows (exact search of all rows if None).
+                   All attribute pairs are searched on a stratified sample, with the same binsize (so fewer leaves)
+                   and support scaled down to it, and only the 'candidates' pairs with the best boxes there are searched on all rows.
+                   get_search_stats()['approximate'] has the settings used.
+     candidates : Max. no. of attribute pairs searched on all rows in an approximate search
+     seed : Seed for drawing the sample (-1 for unseeded)
+     processes : Search disjoint sets of attribute pairs in this many worker processes, each with num_threads
+                 threads, sharing the data through memory-mapped files (in this process if None).
+                 Exact search only.
+
      Returns
      -------
      FeatureMap instance containing all the projection boxes found
      """
 
-    def search_projections(self) -> feature_map.FeatureMap:
+    def search_projections(self, top_k=None, rank_by='sse', sample_size=None, candidates=100,
+                           seed=-1, processes=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
             return None
+        if processes is not None and processes > 1:
+            if sample_size is not None:
+                raise ValueError("processes cannot be combined with sample_size")
+            return feature_map.FeatureMap(
+                parallel.search_projections(self._search_obj, self._ds, self.hyperparams['binsize'],
+                                            self.hyperparams['support'], 1.0, self.hyperparams['mode'], processes,
+                                            num_threads=self.hyperparams['num_threads'], top_k=top_k or 0,
+                                            rank_by=feature_map.RANK_BY[rank_by]))
         return feature_map.FeatureMap(
             self._search_obj.search_projections(self._ds.ds, self.hyperparams['binsize'], self.hyperparams['support'],
-                                                1.0, self.hyperparams['mode'], self.hyperparams['num_threads']))
+                                                1.0, self.hyperparams['mode'], self.hyperparams['num_threads'],
+                                                top_k=top_k or 0, rank_by=feature_map.RANK_BY[rank_by],
+                                                sample_size=sample_size or 0, candidates=candidates, seed=seed))
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for regression)
      Returns projection boxes in a decision-list based scheme (if-else-if)
+     Parameters
+     ----------
+     timeout : Wall-clock seconds after which to stop (no limit if None)
+     iterations : Max. no. of greedy rounds, each adding one box (no limit if None)
+
      Returns
      -------
-     FeatureMap instance containing all the projection boxes found
+     FeatureMap instance containing all the projection boxes found.
+     If stopped by 'timeout' or 'iterations', it holds the boxes found so far and is_partial() is True.
      """
 
-    def find_easy_explain_data(self) -> feature_map.FeatureMap:
+    def find_easy_explain_data(self, timeout=None, iterations=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
@@ -140,7 +184,18 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
             self._search_obj.find_easy_explain_data(self._ds.ds, self.hyperparams['validation_size'],
                                                     self.hyperparams['binsize'],
                                                     self.hyperparams['support'], 1.0, self.hyperparams['mode'],
-                                                    self.hyperparams['num_threads']))
+                                                    self.hyperparams['num_threads'],
+                                                    self.hyperparams['approximate_greedy'],
+                                                    timeout=-1 if timeout is None else timeout,
+                                                    max_rounds=-1 if iterations is None else iterations))
+
+    """
+     Returns counters and wall-clock phase times (seconds) of the last search, as a dict.
+     Search messages go to this module's logger at INFO level.
+     """
+
+    def get_search_stats(self) -> dict:
+        return self._search_obj.get_stats()
 
     """
      Return the FeatureMap instance containing all the projection boxes learnt
@@ -154,24 +209,14 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for classification/regression)
+     Stops after 'timeout' seconds or 'iterations' greedy rounds, keeping the boxes found so far (has_finished is then False)
      """
 
     def fit(self, *, timeout: float = None, iterations: int = None) -> base.CallResult[None]:
-        self._fmap = self.find_easy_explain_data()
-        self._fmap_py = []
-        num = self._fmap.get_num_projections()
-        for i in range(num):
-            pr = self._fmap.get_projection(i)
-            att1 = pr.get_att1()
-            att2 = pr.get_att2()
-            start1 = pr.get_att1_start()
-            start2 = pr.get_att2_start()
-            end1 = pr.get_att1_end()
-            end2 = pr.get_att2_end()
-            value = pr.get_projection_metric()
-            self._fmap_py.append((att1, att2, start1, start2, end1, end2, value,))
+        self._fmap = self.find_easy_explain_data(timeout=timeout, iterations=iterations)
+        self._fmap_py = feature_map.DecisionList.from_feature_map(self._fmap, default_value=self._default_value)
         self._is_fitted = True
-        return base.CallResult(None)
+        return base.CallResult(None, has_finished=not self._fmap.is_partial())
 
     """
      Sets input and output feature space.
@@ -186,7 +231,7 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
      """
 
     def set_training_data(self, *, inputs: Input, outputs: Output) -> None:
-        self._ds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
+        self._ds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
         self._ds.setOutputForRegression(np.ascontiguousarray(outputs.values, dtype=float))
         self._fmap = None
         self._fmap_py = None
@@ -234,31 +279,16 @@ class SearchNumeric(SupervisedLearnerPrimitiveBase[Input, Output, SearchNumericP
         if self._fmap is None and self._fmap_py is None:
             return base.CallResult(None)
 
-        testds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
-        rows = testds.getSize()
-        predictedTargets = np.zeros(rows)
-
-        # Loop through all the test rows
-        for j in range(rows):
-
-            # Loop through all the projections in order of attributes
-            predicted = False
-            if bool(self._fmap):
-                num = self._fmap.get_num_projections()
-                for i in range(num):
-                    pr = self._fmap.get_projection(i)
-                    if pr.point_lies_in_projection(testds.ds, j) is True:
-                        predictedTargets[j] = pr.get_projection_metric()
-                        predicted = True
-                        break
-            else:
-                (value, predicted) = testds._helper(-1, self._fmap_py, j)
-                if predicted is True:
-                    predictedTargets[j] = value
-
-            # Predict using outside blackbox regressor
-            if predicted is False:
-                predictedTargets[j] = self._default_value  # clf.predict(testData[j,:])
+        testds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
+
+        # Find the first projection containing each test row
+        if bool(self._fmap):
+            (index, value) = self._fmap.find_first_match(testds, -1)
+        else:
+            (index, value) = self._fmap_py.find_first_match(testds, -1)
+
+        # Rows outside all projections get the default mean
+        predictedTargets = np.where(index >= 0, value, self._default_value)
 
         output = container.DataFrame(predictedTargets, generate_metadata=True)
         return base.CallResult(output)
@@ -8,6 +8,8 @@
 # Copyright (c) 2016 Carnegie Mellon University
 ##
 
+import concurrent.futures
+import logging
 import os
 from typing import Any
 
@@ -23,7 +25,9 @@ from d3m.primitive_interfaces.supervised_learning import SupervisedLearnerPrimit
 # from d3m.primitives.regression.random_forest import SKlearn as SKRandomForestRegressor
 from d3m.primitives.regression.gradient_boosting import SKlearn as GradientBoostingRegressor
 
-from . import feature_map, datset, helper
+from . import feature_map, datset, helper, parallel
+
+logger = logging.getLogger(__name__)
 
 Input = container.DataFrame
 Output = container.DataFrame
@@ -56,6 +60,17 @@ class SearchHybridNumericHyperparams(hyperparams.Hyperparams):
         'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
                                           description='Proportion of training data which is held out for validation '
                                                       'purposes.')
+    approximate_greedy = hyperparams.UniformBool(default=False, semantic_types=[
+        'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+                                                 description='After the first round of decision list learning, '
+                                                             're-evaluate only the attribute pairs that scored best '
+                                                             'when last evaluated. Approximate : faster, but later '
+                                                             'boxes can differ from the exhaustive search. Used for '
+                                                             'mode 0 only.')
+    bootstraps = hyperparams.UniformInt(lower=2, upper=100, default=2, semantic_types=[
+        'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+                                        description='No. of bootstrap runs for choosing the decision list coverage. '
+                                                    'Bootstraps run in parallel on num_threads threads.')
     blackbox = hyperparams.Primitive[SupervisedLearnerPrimitiveBase](
         primitive_families=[PrimitiveFamily.REGRESSION],
         default=GradientBoostingRegressor,
@@ -103,6 +118,7 @@ class SearchHybridNumeric(
     def __init__(self, *, hyperparams: SearchHybridNumericHyperparams) -> None:
         super().__init__(hyperparams=hyperparams)
         self._search_obj = libfind_projections.search()
+        self._search_obj.set_logger(logger.info)
         self.hyperparams = hyperparams
         self._ds = None
         self._fmap = None
@@ -119,42 +135,98 @@ class SearchHybridNumeric(
     def __setstate__(self, state):
         self.hyperparams, self._fmap_py, self._num, self._prim_instance, self._is_fitted = state
         self._fmap = None
+        if isinstance(self._fmap_py, list):
+            self._fmap_py = feature_map.DecisionList.from_tuples(self._fmap_py)
 
     """
      Comprehensively evaluates all possible pairs of 2-d projection boxes in the data
      Returns all projection boxes which match search criteria
+     Parameters
+     ----------
+     top_k : Keep only the best 'top_k' boxes, best first (all boxes, in order of attribute pair, if None)
+     rank_by : Order for top_k, 'sse' or 'support'
+     sample_size : Approximate search on this many rows (exact search of all rows if None).
+                   All attribute pairs are searched on a stratified sample, with the same binsize (so fewer leaves)
+                   and support scaled down to it, and only the 'candidates' pairs with the best boxes there are searched on all rows.
+                   get_search_stats()['approximate'] has the settings used.
+     candidates : Max. no. of attribute pairs searched on all rows in an approximate search
+     seed : Seed for drawing the sample (-1 for unseeded)
+     processes : Search disjoint sets of attribute pairs in this many worker processes, each with num_threads
+                 threads, sharing the data through memory-mapped files (in this process if None).
+                 Exact search only.
+
      Returns
      -------
      FeatureMap instance containing all the projection boxes found
      """
 
-    def search_projections(self) -> feature_map.FeatureMap:
+    def search_projections(self, top_k=None, rank_by='sse', sample_size=None, candidates=100,
+                           seed=-1, processes=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
             return None
+        if processes is not None and processes > 1:
+            if sample_size is not None:
+                raise ValueError("processes cannot be combined with sample_size")
+            return feature_map.FeatureMap(
+                parallel.search_projections(self._search_obj, self._ds, self.hyperparams['binsize'],
+                                            self.hyperparams['support'], 1.0, self.hyperparams['mode'], processes,
+                                            num_threads=self.hyperparams['num_threads'], top_k=top_k or 0,
+                                            rank_by=feature_map.RANK_BY[rank_by]))
         return feature_map.FeatureMap(
             self._search_obj.search_projections(self._ds.ds, self.hyperparams['binsize'], self.hyperparams['support'],
-                                                1.0, self.hyperparams['mode'], self.hyperparams['num_threads']))
+                                                1.0, self.hyperparams['mode'], self.hyperparams['num_threads'],
+                                                top_k=top_k or 0, rank_by=feature_map.RANK_BY[rank_by],
+                                                sample_size=sample_size or 0, candidates=candidates, seed=seed))
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for regression)
      Returns projection boxes in a decision-list based scheme (if-else-if)
+     Parameters
+     ----------
+     rows : Row indices to learn from (all rows if None)
+     seed : Seed for splitting off the validation rows (-1 for unseeded)
+     num_threads : No. of search threads (hyperparameter 'num_threads' if None)
+     timeout : Wall-clock seconds after which to stop (no limit if None)
+     iterations : Max. no. of greedy rounds, each adding one box (no limit if None)
+
      Returns
      -------
      FeatureMap instance containing all the projection boxes found
      """
 
-    def find_easy_explain_data(self) -> feature_map.FeatureMap:
+    def find_easy_explain_data(self, rows=None, seed=-1, num_threads=None, timeout=None,
+                               iterations=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
             return None
+        if num_threads is None:
+            num_threads = self.hyperparams['num_threads']
+        # Searches on row subsets may run concurrently (bootstraps), so each gets its own search object
+        if rows is None:
+            search_obj = self._search_obj
+        else:
+            search_obj = libfind_projections.search()
+            search_obj.set_logger(logger.info)
+            rows = np.ascontiguousarray(rows, dtype=float)
         return feature_map.FeatureMap(
-            self._search_obj.find_easy_explain_data(self._ds.ds, self.hyperparams['validation_size'],
-                                                    self.hyperparams['binsize'],
-                                                    self.hyperparams['support'], 1.0, self.hyperparams['mode'],
-                                                    self.hyperparams['num_threads']))
+            search_obj.find_easy_explain_data(self._ds.ds, self.hyperparams['validation_size'],
+                                              self.hyperparams['binsize'],
+                                              self.hyperparams['support'], 1.0, self.hyperparams['mode'],
+                                              num_threads,
+                                              self.hyperparams['approximate_greedy'], rows, seed,
+                                              -1 if timeout is None else timeout,
+                                              -1 if iterations is None else iterations))
+
+    """
+     Returns counters and wall-clock phase times (seconds) of the last search, as a dict.
+     Search messages go to this module's logger at INFO level.
+     """
+
+    def get_search_stats(self) -> dict:
+        return self._search_obj.get_stats()
 
     """
      Return the FeatureMap instance containing all the projection boxes learnt
@@ -168,48 +240,49 @@ class SearchHybridNumeric(
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for regression)
+     Searches stop when 'timeout' seconds are up or after 'iterations' greedy rounds, keeping the boxes found so far
+     (has_finished is then False). Blackbox fits are not limited.
      """
 
     def fit(self, *, timeout: float = None, iterations: int = None) -> base.CallResult[None]:
         primitive = self.hyperparams['blackbox']
         idf = self._inputs
         odf = self._outputs
+        num_threads = self.hyperparams['num_threads']
+        deadline = helper.mk_deadline(timeout)
         optimal_cvg = helper.find_optimal_coverage(self, self._ds, idf, odf, primitive, 'REGRESSION',
-                                                   random_seed=self.random_seed)
-        self._fmap = self.find_easy_explain_data()
-        self._fmap_py = []
-
-        primitive_hyperparams = primitive.metadata.query()['primitive_code']['class_type_arguments']['Hyperparams']
-        custom_hyperparams = dict()
-        custom_hyperparams['n_estimators'] = 100
-        if isinstance(primitive, d3m.primitive_interfaces.base.PrimitiveBaseMeta):  # is a class
-            self._prim_instance = primitive(
-                hyperparams=primitive_hyperparams(primitive_hyperparams.defaults(), **custom_hyperparams))
-        else:  # is an instance
-            self._prim_instance = primitive
+                                                   random_seed=self.random_seed,
+                                                   bootstraps=self.hyperparams['bootstraps'], num_threads=num_threads,
+                                                   deadline=deadline, iterations=iterations)
+
+        # Final search runs alongside the final blackbox fit
+        self._prim_instance = helper.mk_blackbox(primitive)
         self._prim_instance.set_training_data(inputs=idf, outputs=odf)
-        self._prim_instance.fit()
+        if num_threads > 1:
+            with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor:
+                future = executor.submit(self.find_easy_explain_data, None, -1, max(1, num_threads - 1),
+                                         helper.time_left(deadline), iterations)
+                self._prim_instance.fit()
+                self._fmap = future.result()
+        else:
+            self._fmap = self.find_easy_explain_data(timeout=helper.time_left(deadline), iterations=iterations)
+            self._prim_instance.fit()
 
         num = self._fmap.get_num_projections()
         self._num = 0
+        size = num
         for i in range(num):
             pr = self._fmap.get_projection(i)
             cvg = pr.get_coverage()
 
             if cvg > optimal_cvg:
                 self._num = i
+                size = i
                 break
 
-            att1 = pr.get_att1()
-            att2 = pr.get_att2()
-            start1 = pr.get_att1_start()
-            start2 = pr.get_att2_start()
-            end1 = pr.get_att1_end()
-            end2 = pr.get_att2_end()
-            value = pr.get_projection_metric()
-            self._fmap_py.append((att1, att2, start1, start2, end1, end2, value,))
+        self._fmap_py = feature_map.DecisionList.from_feature_map(self._fmap, size)
         self._is_fitted = True
-        return base.CallResult(None)
+        return base.CallResult(None, has_finished=not self._fmap.is_partial())
 
     """
      Sets input and output feature space.
@@ -224,7 +297,7 @@ class SearchHybridNumeric(
      """
 
     def set_training_data(self, *, inputs: Input, outputs: Output) -> None:
-        self._ds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
+        self._ds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
         self._ds.setOutputForRegression(np.ascontiguousarray(outputs.values, dtype=float))
 
         self._inputs = inputs
@@ -278,33 +351,18 @@ class SearchHybridNumeric(
             # TODO `produce` should never return `None` but just abort if it cannot run; throw an exception or something
             return base.CallResult(None)
 
-        testds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
-        rows = testds.getSize()
-        predictedTargets = np.zeros(rows)
+        testds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
 
         clfp = self._prim_instance.produce(inputs=inputs).value.values
 
-        # Loop through all the test rows
-        for j in range(rows):
-
-            # Loop through all the projections in order of attributes
-            predicted = False
-            if bool(self._fmap):
-                num = self._num
-                for i in range(num):
-                    pr = self._fmap.get_projection(i)
-                    if pr.point_lies_in_projection(testds.ds, j) is True:
-                        predictedTargets[j] = pr.get_projection_metric()
-                        predicted = True
-                        break
-            else:
-                (value, predicted) = testds._helper(self._num, self._fmap_py, j)
-                if predicted is True:
-                    predictedTargets[j] = value
-
-            # Predict using outside blackbox classifier
-            if predicted is False:
-                predictedTargets[j] = clfp[j]
+        # Find the first projection (before self._num) containing each test row
+        if bool(self._fmap):
+            (index, value) = self._fmap.find_first_match(testds, self._num)
+        else:
+            (index, value) = self._fmap_py.find_first_match(testds, self._num)
+
+        # Predict using outside blackbox regressor for rows outside all projections
+        predictedTargets = np.where(index >= 0, value, np.ravel(clfp))
 
         output = container.DataFrame(predictedTargets, generate_metadata=True)
         return base.CallResult(output)
@@ -8,6 +8,7 @@
 # Copyright (c) 2016 Carnegie Mellon University
 ##
 
+import logging
 import os
 from typing import Any
 
@@ -20,7 +21,9 @@ from d3m.primitive_interfaces import base
 from d3m.primitive_interfaces.supervised_learning import SupervisedLearnerPrimitiveBase
 from sklearn import preprocessing
 
-from . import feature_map, datset
+from . import feature_map, datset, parallel
+
+logger = logging.getLogger(__name__)
 
 Input = container.DataFrame
 Output = container.DataFrame
@@ -52,6 +55,20 @@ class SearchHyperparams(hyperparams.Hyperparams):
         'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
                                           description='Proportion of training data which is held out for validation '
                                                       'purposes.')
+    approximate_greedy = hyperparams.UniformBool(default=False, semantic_types=[
+        'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+                                                 description='After the first round of decision list learning, '
+                                                             're-evaluate only the attribute pairs that scored best '
+                                                             'when last evaluated. Approximate : faster, but later '
+                                                             'boxes can differ from the exhaustive search.')
+    screen_purity = hyperparams.Uniform(lower=0.0, upper=1.0, default=0.0, semantic_types=[
+        'https://metadata.datadrivendiscovery.org/types/ControlParameter'],
+                                        description='Skip attribute pairs where neither attribute alone has a range '
+                                                    'of at least support data points reaching this class proportion. '
+                                                    'Faster on wide data, but not exact : a box can be purer than every '
+                                                    'range of its two features, so values above the largest class '
+                                                    'proportion can miss boxes, and values above purity usually do. '
+                                                    '0 (the default) evaluates all pairs.')
 
 
 class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchHyperparams]):
@@ -93,6 +110,7 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
     def __init__(self, *, hyperparams: SearchHyperparams) -> None:
         super().__init__(hyperparams=hyperparams)
         self._search_obj = libfind_projections.search()
+        self._search_obj.set_logger(logger.info)
         self.hyperparams = hyperparams
         self._ds = None
         self._fmap = None
@@ -107,33 +125,68 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
     def __setstate__(self, state):
         self.hyperparams, self._fmap_py, self._default_value, self._is_fitted, self._le = state
         self._fmap = None
+        if isinstance(self._fmap_py, list):
+            self._fmap_py = feature_map.DecisionList.from_tuples(self._fmap_py)
 
     """
      Comprehensively evaluates all possible pairs of 2-d projection boxes in the data
      Returns all projection boxes which match search criteria
+     Parameters
+     ----------
+     top_k : Keep only the best 'top_k' boxes, best first (all boxes, in order of attribute pair, if None)
+     rank_by : Order for top_k, 'purity' or 'support'
+     sample_size : Approximate search on this many rows (exact search of all rows if None).
+                   All attribute pairs are searched on a stratified sample, with the same binsize (so fewer leaves)
+                   and support scaled down to it, and only the 'candidates' pairs with the best boxes there are searched on all rows.
+                   get_search_stats()['approximate'] has the settings used.
+     candidates : Max. no. of attribute pairs searched on all rows in an approximate search
+     seed : Seed for drawing the sample (-1 for unseeded)
+     processes : Search disjoint sets of attribute pairs in this many worker processes, each with num_threads
+                 threads, sharing the data through memory-mapped files (in this process if None).
+                 Exact search only.
+
      Returns
      -------
      FeatureMap instance containing all the projection boxes found
      """
 
-    def search_projections(self) -> feature_map.FeatureMap:
+    def search_projections(self, top_k=None, rank_by='purity', sample_size=None, candidates=100,
+                           seed=-1, processes=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
             return None
+        if processes is not None and processes > 1:
+            if sample_size is not None:
+                raise ValueError("processes cannot be combined with sample_size")
+            return feature_map.FeatureMap(
+                parallel.search_projections(self._search_obj, self._ds, self.hyperparams['binsize'],
+                                            self.hyperparams['support'], self.hyperparams['purity'], 1, processes,
+                                            num_threads=self.hyperparams['num_threads'], top_k=top_k or 0,
+                                            rank_by=feature_map.RANK_BY[rank_by],
+                                            screen_purity=self.hyperparams['screen_purity']))
         return feature_map.FeatureMap(
             self._search_obj.search_projections(self._ds.ds, self.hyperparams['binsize'], self.hyperparams['support'],
-                                                self.hyperparams['purity'], 1, self.hyperparams['num_threads']))
+                                                self.hyperparams['purity'], 1, self.hyperparams['num_threads'],
+                                                top_k=top_k or 0, rank_by=feature_map.RANK_BY[rank_by],
+                                                screen_purity=self.hyperparams['screen_purity'],
+                                                sample_size=sample_size or 0, candidates=candidates, seed=seed))
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for classification)
      Returns projection boxes in a decision-list based scheme (if-else-if)
+     Parameters
+     ----------
+     timeout : Wall-clock seconds after which to stop (no limit if None)
+     iterations : Max. no. of greedy rounds, each adding one box (no limit if None)
+
      Returns
      -------
-     FeatureMap instance containing all the projection boxes found
+     FeatureMap instance containing all the projection boxes found.
+     If stopped by 'timeout' or 'iterations', it holds the boxes found so far and is_partial() is True.
      """
 
-    def find_easy_explain_data(self) -> feature_map.FeatureMap:
+    def find_easy_explain_data(self, timeout=None, iterations=None) -> feature_map.FeatureMap:
         valid = datset.validate_params(self._ds, self.hyperparams['binsize'], self.hyperparams['support'])
         if valid is False:
             print("Invalid parameters!")
@@ -142,7 +195,19 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
             self._search_obj.find_easy_explain_data(self._ds.ds, self.hyperparams['validation_size'],
                                                     self.hyperparams['binsize'],
                                                     self.hyperparams['support'], self.hyperparams['purity'], 1,
-                                                    self.hyperparams['num_threads']))
+                                                    self.hyperparams['num_threads'],
+                                                    self.hyperparams['approximate_greedy'],
+                                                    timeout=-1 if timeout is None else timeout,
+                                                    max_rounds=-1 if iterations is None else iterations,
+                                                    screen_purity=self.hyperparams['screen_purity']))
+
+    """
+     Returns counters and wall-clock phase times (seconds) of the last search, as a dict.
+     Search messages go to this module's logger at INFO level.
+     """
+
+    def get_search_stats(self) -> dict:
+        return self._search_obj.get_stats()
 
     """
      Return the FeatureMap instance containing all the projection boxes learnt
@@ -156,24 +221,14 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
 
     """
      Learns decision list of projection boxes for easy-to-explain data (for classification)
+     Stops after 'timeout' seconds or 'iterations' greedy rounds, keeping the boxes found so far (has_finished is then False)
      """
 
     def fit(self, *, timeout: float = None, iterations: int = None) -> base.CallResult[None]:
-        self._fmap = self.find_easy_explain_data()
-        self._fmap_py = []
-        num = self._fmap.get_num_projections()
-        for i in range(num):
-            pr = self._fmap.get_projection(i)
-            att1 = pr.get_att1()
-            att2 = pr.get_att2()
-            start1 = pr.get_att1_start()
-            start2 = pr.get_att2_start()
-            end1 = pr.get_att1_end()
-            end2 = pr.get_att2_end()
-            value = pr.get_projection_metric()
-            self._fmap_py.append((att1, att2, start1, start2, end1, end2, value,))
+        self._fmap = self.find_easy_explain_data(timeout=timeout, iterations=iterations)
+        self._fmap_py = feature_map.DecisionList.from_feature_map(self._fmap, default_value=self._default_value)
         self._is_fitted = True
-        return base.CallResult(None)
+        return base.CallResult(None, has_finished=not self._fmap.is_partial())
 
     """
      Sets input and output feature space.
@@ -188,7 +243,7 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
      """
 
     def set_training_data(self, *, inputs: Input, outputs: Output) -> base.CallResult[None]:
-        self._ds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
+        self._ds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
         v = self._le.fit_transform(outputs.values.ravel())
         self._ds.setOutputForClassification(np.ascontiguousarray(v, dtype=float))
 
@@ -243,31 +298,16 @@ class Search(SupervisedLearnerPrimitiveBase[Input, Output, SearchParams, SearchH
             # TODO `produce` should never return `None` but just abort if it cannot run; throw an exception or something
             return base.CallResult(None)
 
-        testds = datset.Datset(np.ascontiguousarray(inputs.values, dtype=float))
-        rows = testds.getSize()
-        predictedTargets = np.zeros(rows, dtype=np.int8)
-
-        # Loop through all the test rows
-        for j in range(rows):
-
-            # Loop through all the projections in order of attributes
-            predicted = False
-            if bool(self._fmap):
-                num = self._fmap.get_num_projections()
-                for i in range(num):
-                    pr = self._fmap.get_projection(i)
-                    if pr.point_lies_in_projection(testds.ds, j) is True:
-                        predictedTargets[j] = (int)(pr.get_projection_metric())
-                        predicted = True
-                        break
-            else:
-                (value, predicted) = testds._helper(-1, self._fmap_py, j)
-                if predicted is True:
-                    predictedTargets[j] = (int)(value)
-
-            # Predict using outside blackbox classifier
-            if predicted is False:
-                predictedTargets[j] = (int)(self._default_value)  # clf.predict(testData[j,:])
+        testds = datset.Datset(np.asfortranarray(inputs.values, dtype=float), copy=False)
+
+        # Find the first projection containing each test row
+        if bool(self._fmap):
+            (index, value) = self._fmap.find_first_match(testds, -1)
+        else:
+            (index, value) = self._fmap_py.find_first_match(testds, -1)
+
+        # Rows outside all projections get the default class
+        predictedTargets = np.where(index >= 0, value, self._default_value).astype(np.int8)
 
         predictedTargetNames = self._le.inverse_transform(predictedTargets)
         output = container.DataFrame(predictedTargetNames, generate_metadata=True)
@@ -0,0 +1,112 @@
+"""
+Checks that Datsets mapped from files or stored as float32, and searches over several processes, find the boxes of a
+plain search, and that class labels are stored at the narrowest width.
+Run with pytest, or as a script (the processes are spawned, so this file keeps the __main__ guard below).
+"""
+import os
+import shutil
+import tempfile
+
+import numpy
+import libfind_projections
+
+from find_projections import datset, parallel
+from test_equivalence import boxes, make_data
+
+def new_search():
+    search = libfind_projections.search()
+    search.set_verbose(False)
+    return search
+
+def plain_datset(X, labels):
+    ds = datset.Datset(X)
+    ds.setOutputForClassification(labels)
+    return ds
+
+def test_rejects_non_float_data():
+    try:
+        datset.Datset(numpy.zeros((10, 2), dtype=int))
+    except ValueError:
+        return
+    assert False, "integer data was accepted"
+
+def test_from_file():
+    X, labels, output, rows = make_data('mixed')
+    expected = boxes(new_search().search_projections(plain_datset(X, labels).ds, 10, 30, 0.7, 1, 1))
+    folder = tempfile.mkdtemp()
+    try:
+        data_path, labels_path, raw_path = (os.path.join(folder, name) for name in ('X.npy', 'y.npy', 'X.bin'))
+        numpy.save(data_path, numpy.asfortranarray(X))
+        numpy.save(labels_path, labels)
+        numpy.asfortranarray(X).T.tofile(raw_path)
+        for ds in (datset.Datset.from_file(data_path, labels_path=labels_path),
+                   datset.Datset.from_file(raw_path, labels_path=labels_path, shape=X.shape)):
+            assert boxes(new_search().search_projections(ds.ds, 10, 30, 0.7, 1, 1)) == expected
+    finally:
+        shutil.rmtree(folder)
+
+def test_processes():
+    X, labels, output, rows = make_data('mixed')
+    for top_k in (0, 20):
+        expected = boxes(new_search().search_projections(plain_datset(X, labels).ds, 10, 30, 0.7, 1, 1,
+                                                         top_k=top_k))
+        ds = plain_datset(X, labels)
+        found = parallel.search_projections(new_search(), ds, 10, 30, 0.7, 1, 2, top_k=top_k)
+        assert boxes(found) == expected, "top_k %d : boxes differ" % top_k
+
+def test_float32():
+    # float32 features give the boxes of float64 features holding the same float32 values
+    X, labels, output, rows = make_data('mixed')
+    X32 = X.astype(numpy.float32)
+    X64 = X32.astype(float)
+    search = new_search()
+    for layout in ('fortran', 'columns', 'single'):
+        if layout == 'fortran':
+            ds32 = libfind_projections.Datset(numpy.asfortranarray(X32), True)
+            ds64 = libfind_projections.Datset(numpy.asfortranarray(X64), True)
+        elif layout == 'columns':
+            ds32 = libfind_projections.Datset([numpy.ascontiguousarray(X32[:, j]) for j in range(X.shape[1])], True)
+            ds64 = libfind_projections.Datset([numpy.ascontiguousarray(X64[:, j]) for j in range(X.shape[1])], True)
+        else:
+            ds32 = datset.Datset(X, single=True).ds
+            ds64 = datset.Datset(X64).ds
+        assert ds32.is_single_precision() and not ds64.is_single_precision()
+        for ds in (ds32, ds64):
+            ds.fill_datset_output_for_classification(labels)
+        assert (boxes(search.search_projections(ds32, 10, 30, 0.7, 1, 3)) ==
+                boxes(search.search_projections(ds64, 10, 30, 0.7, 1, 3))), layout
+        assert (boxes(search.find_easy_explain_data(ds32, 0.1, 10, 30, 0.7, 1, 1, seed=1)) ==
+                boxes(search.find_easy_explain_data(ds64, 0.1, 10, 30, 0.7, 1, 1, seed=1))), layout
+        for ds in (ds32, ds64):
+            ds.fill_datset_output_for_regression(output)
+        assert (boxes(search.search_projections(ds32, 10, 30, 1.0, 1, 3)) ==
+                boxes(search.search_projections(ds64, 10, 30, 1.0, 1, 3))), layout
+
+def test_label_width():
+    # Classes are numbered 0 to classes-1, stored in the narrowest of 1, 2 or 4 bytes
+    for classes, width in ((2, 1), (256, 1), (257, 2), (65536, 2), (65537, 4)):
+        ds = datset.Datset(numpy.zeros((classes, 1)))
+        ds.setOutputForClassification(numpy.arange(classes, dtype=float))
+        assert ds.ds.get_label_width() == width, "%d classes" % classes
+
+    # A class above 255 is found in its box
+    rng = numpy.random.RandomState(5)
+    X = rng.rand(3000, 3)
+    labels = (numpy.arange(3000) % 300).astype(float)
+    inside = (X[:, 0] < 0.3) & (X[:, 1] < 0.3)
+    labels[inside] = 300
+    ds = plain_datset(X, labels)
+    assert ds.ds.get_label_width() == 2
+    found = boxes(new_search().search_projections(ds.ds, 10, 30, 0.9, 1, 1))
+    assert len(found) == 1
+    att1, att2, start1, end1, start2, end2, total, metric = found[0]
+    assert (att1, att2, metric) == (0, 1, 300)
+    assert 0.25 < end1 < 0.35 and 0.25 < end2 < 0.35 and total > 0.8 * inside.sum()
+
+if __name__ == '__main__':
+    test_rejects_non_float_data()
+    test_from_file()
+    test_processes()
+    test_float32()
+    test_label_width()
+    print("All Datsets match")
@@ -0,0 +1,126 @@
+"""
+Checks scoring of rows against decision lists, the arrays it accepts, and saving and loading decision lists.
+Run with pytest, or as a script.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy
+import libfind_projections
+
+from find_projections import datset, feature_map
+from test_equivalence import make_data
+
+def make_datset(rows=200, cols=3):
+    rng = numpy.random.RandomState(3)
+    return datset.Datset(rng.rand(rows, cols))
+
+def raises_value_error(call):
+    try:
+        call()
+    except ValueError:
+        return True
+    return False
+
+def test_rejects_invalid_arrays():
+    ds = make_datset()
+    dlist = feature_map.DecisionList.from_tuples([(0, 1, 0.0, 0.0, 0.5, 0.5, 1.0)])
+    rows = ds.getSize()
+    index = numpy.empty(rows, dtype=numpy.intc)
+    value = numpy.empty(rows, dtype=float)
+    for bad_index, bad_value in ((numpy.empty(rows - 1, dtype=numpy.intc), value),
+                                 (numpy.empty(rows, dtype=numpy.int64), value),
+                                 (numpy.empty(2 * rows, dtype=numpy.intc)[::2], value),
+                                 (list(index), value),
+                                 (index, numpy.empty(rows, dtype=numpy.float32)),
+                                 (index, numpy.empty(rows + 1, dtype=float))):
+        assert raises_value_error(lambda: dlist.dlist.find_first_match(ds.ds, -1, bad_index, bad_value))
+    dlist.dlist.find_first_match(ds.ds, -1, index, value)
+
+    assert raises_value_error(lambda: libfind_projections.decision_list([1, 2, 3]))
+    assert raises_value_error(lambda: libfind_projections.decision_list(numpy.zeros(3)))
+
+def test_rejects_missing_attributes():
+    ds = make_datset(cols=3)
+    for att1, att2 in ((0, 500000), (3, 1), (-1, 2)):
+        def score():
+            dlist = feature_map.DecisionList.from_tuples([(att1, att2, 0.0, 0.0, 0.5, 0.5, 1.0)])
+            dlist.find_first_match(ds)
+        assert raises_value_error(score), "attributes %d, %d" % (att1, att2)
+
+    # Only the boxes used need to fit the Datset
+    dlist = feature_map.DecisionList.from_tuples([(0, 1, 0.0, 0.0, 0.5, 0.5, 1.0), (0, 7, 0.0, 0.0, 1.0, 1.0, 2.0)])
+    index, value = dlist.find_first_match(ds, 1)
+    assert set(index) <= {-1, 0}
+
+def learn_decision_list():
+    X, labels, output, rows = make_data('mixed')
+    ds = datset.Datset(X)
+    ds.setOutputForClassification(labels)
+    search = libfind_projections.search()
+    search.set_verbose(False)
+    fmap = feature_map.FeatureMap(search.find_easy_explain_data(ds.ds, 0.1, 10, 30, 0.7, 1, 1, seed=1))
+    assert fmap.get_num_projections() > 1
+    return ds, fmap
+
+def copies(dlist, folder):
+    path = os.path.join(folder, 'model.fpdl')
+    dlist.save(path)
+    yield feature_map.DecisionList.load(path)
+    yield feature_map.DecisionList.load(path, mmap=False)
+    yield feature_map.DecisionList.from_bytes(dlist.to_bytes())
+    yield pickle.loads(pickle.dumps(dlist))
+
+def test_round_trip():
+    ds, fmap = learn_decision_list()
+    folder = tempfile.mkdtemp()
+    try:
+        for dlist in (feature_map.DecisionList.from_feature_map(fmap, default_value=ds.get_default_value()),
+                      feature_map.DecisionList.from_feature_map(fmap, num=2),
+                      feature_map.DecisionList.from_feature_map(fmap, num=0, default_value=1.0)):
+            for copy in copies(dlist, folder):
+                assert copy.get_num_projections() == dlist.get_num_projections()
+                assert copy.records.tobytes() == dlist.records.tobytes()
+                assert copy.default_value == dlist.default_value
+    finally:
+        shutil.rmtree(folder)
+
+def test_header_checks():
+    dlist = feature_map.DecisionList.from_tuples([(0, 1, 0.0, 0.0, 0.5, 0.5, 1.0)])
+    header = dlist._header()
+    newer = header.copy()
+    newer['version'] = feature_map.MODEL_VERSION + 1
+    other = header.copy()
+    other['magic'] = b'XXXX'
+    for bad in (newer, other):
+        buf = bad.tobytes() + dlist.records.tobytes()
+        assert raises_value_error(lambda: feature_map.DecisionList.from_bytes(buf))
+    assert header['version'] == feature_map.MODEL_VERSION
+
+def test_loaded_scores():
+    ds, fmap = learn_decision_list()
+    folder = tempfile.mkdtemp()
+    try:
+        for copy in copies(feature_map.DecisionList.from_feature_map(fmap), folder):
+            index, value = copy.find_first_match(ds)
+            for row in range(ds.getSize()):
+                first = -1
+                for k in range(fmap.get_num_projections()):
+                    if fmap.get_projection(k).point_lies_in_projection(ds.ds, row):
+                        first = k
+                        break
+                assert index[row] == first, "row %d" % row
+                assert value[row] == (fmap.get_projection(first).get_projection_metric() if first >= 0 else 0)
+            assert (index >= 0).any() and (index < 0).any()
+    finally:
+        shutil.rmtree(folder)
+
+if __name__ == '__main__':
+    test_rejects_invalid_arrays()
+    test_rejects_missing_attributes()
+    test_round_trip()
+    test_header_checks()
+    test_loaded_scores()
+    print("All decision list checks pass")
@@ -0,0 +1,105 @@
+"""
+Checks that search_projections and find_easy_explain_data still find the boxes of the original implementation.
+Expected boxes in test_equivalence.json were recorded on the data below, which has continuous attributes, attributes
+with many tied values and repeated training rows. They are the boxes of the baseline libfind_projections, except that
+tied values now always keep row order (the baseline left it to std::sort, which changed the easy regression boxes).
+Run with pytest, or as a script. 'python test_equivalence.py --record' rewrites the expected boxes with the
+libfind_projections found on the path (only do so from a build known to be correct).
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import sys
+
+import numpy
+import libfind_projections
+
+EXPECTED = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'test_equivalence.json')
+
+# find_easy_explain_data draws its validation rows from the C library's rand() state, reset before each call
+libc = ctypes.CDLL(ctypes.util.find_library('c'))
+
+def easy_boxes(search, ds, purity, mode, threads):
+    libc.srand(1)
+    return boxes(search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, threads))
+
+def make_data(kind):
+    rng = numpy.random.RandomState(7)
+    n = 1200
+    if kind == 'continuous':
+        X = rng.rand(n, 5)
+    elif kind == 'tied':
+        X = rng.randint(0, 7, size=(n, 5)).astype(float)
+    else:
+        X = numpy.column_stack([rng.randint(0, 4, n), rng.rand(n), numpy.round(rng.rand(n), 1), rng.rand(n),
+                                rng.randint(0, 3, n)]).astype(float)
+    labels = ((X[:, 2] < numpy.percentile(X[:, 2], 30)) & (X[:, 3] > numpy.median(X[:, 3]))).astype(float)
+    output = X[:, 0] * 2 + (X[:, 1] > numpy.median(X[:, 1])) * 3 + rng.rand(n)
+    rows = rng.randint(0, n, n).astype(float)
+    return numpy.ascontiguousarray(X), labels, output, rows
+
+def make_datset(X, layout):
+    if layout == 'fortran':
+        return libfind_projections.Datset(numpy.asfortranarray(X), True)
+    if layout == 'columns':
+        return libfind_projections.Datset([numpy.ascontiguousarray(X[:, j]) for j in range(X.shape[1])], True)
+    return libfind_projections.Datset(X)
+
+def boxes(fmap):
+    result = []
+    for i in range(fmap.get_num_projections()):
+        pr = fmap.get_projection(i)
+        result.append([pr.get_att1(), pr.get_att2(), pr.get_att1_start(), pr.get_att1_end(), pr.get_att2_start(),
+                       pr.get_att2_end(), pr.get_total(), round(pr.get_projection_metric(), 9)])
+    return result
+
+def run_searches(kind, layout='copy'):
+    X, labels, output, rows = make_data(kind)
+    search = libfind_projections.search()
+    results = {}
+    for threads in (1, 3):
+        ds = make_datset(X, layout)
+        ds.fill_datset_output_for_classification(labels)
+        results['classification search %d' % threads] = boxes(search.search_projections(ds, 10, 30, 0.7, 1, threads))
+        results['classification easy %d' % threads] = easy_boxes(search, ds, 0.7, 1, threads)
+        ds.set_training_rows(rows)
+        results['classification training rows %d' % threads] = easy_boxes(search, ds, 0.7, 1, threads)
+        for mode in (0, 1, 2):
+            ds = make_datset(X, layout)
+            ds.fill_datset_output_for_regression(output)
+            results['regression search %d %d' % (mode, threads)] = boxes(search.search_projections(ds, 10, 30, 1.0,
+                                                                                                   mode, threads))
+            results['regression easy %d %d' % (mode, threads)] = easy_boxes(search, ds, 1.0, mode, threads)
+    return results
+
+def check(kind, layout='copy'):
+    with open(EXPECTED) as f:
+        expected = json.load(f)[kind]
+    found = run_searches(kind, layout)
+    for name in expected:
+        assert found[name] == expected[name], "%s data, %s datset : %s boxes differ" % (kind, layout, name)
+
+def test_continuous_values():
+    check('continuous')
+
+def test_tied_values():
+    check('tied')
+
+def test_mixed_values():
+    check('mixed')
+
+def test_wrapped_datset():
+    for layout in ('fortran', 'columns'):
+        check('mixed', layout)
+
+if __name__ == '__main__':
+    if '--record' in sys.argv:
+        with open(EXPECTED, 'w') as f:
+            json.dump({kind: run_searches(kind) for kind in ('continuous', 'tied', 'mixed')}, f, indent=0)
+    else:
+        test_continuous_values()
+        test_tied_values()
+        test_mixed_values()
+        test_wrapped_datset()
+        print("All boxes match")
@@ -0,0 +1,132 @@
+"""
+Checks the options of search_projections and find_easy_explain_data against the plain search on the same data.
+Run with pytest, or as a script.
+"""
+import numpy
+import libfind_projections
+
+from test_equivalence import boxes
+
+def make_data(seed, n=600, cols=5):
+    rng = numpy.random.RandomState(seed)
+    X = rng.rand(n, cols)
+    labels = (((X[:, 1] < 0.4) & (X[:, 2] > 0.5)) | (X[:, 3] < 0.2)).astype(float)
+    labels[rng.rand(n) < 0.1] = 2
+    output = X[:, 0] * 2 + (X[:, 1] > 0.5) * 3 + rng.rand(n)
+    return X, labels, output
+
+def new_search():
+    search = libfind_projections.search()
+    search.set_verbose(False)
+    return search
+
+def classification_datset(seed):
+    X, labels, output = make_data(seed)
+    ds = libfind_projections.Datset(X)
+    ds.fill_datset_output_for_classification(labels)
+    return ds
+
+def regression_datset(seed):
+    X, labels, output = make_data(seed)
+    ds = libfind_projections.Datset(X)
+    ds.fill_datset_output_for_regression(output)
+    return ds
+
+def test_approximate_greedy_first_round():
+    # Only the first round is a full scan, later rounds may pick other boxes (see find_best_projection_lazily)
+    search = new_search()
+    for seed in range(5):
+        for ds, purity, mode in ((classification_datset(seed), 0.7, 1), (regression_datset(seed), 1.0, 0)):
+            full = search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, 1, False, seed=seed, max_rounds=1)
+            lazy = search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, 1, True, seed=seed, max_rounds=1)
+            assert boxes(lazy) == boxes(full), "seed %d, mode %d : first boxes differ" % (seed, mode)
+            assert len(boxes(full)) == 1
+
+def test_approximate_search_of_all_pairs():
+    # With every attribute pair a candidate, the sample only orders the pairs, so the exact boxes are found
+    search = new_search()
+    for seed in range(3):
+        for ds, purity, mode in ((classification_datset(seed), 0.7, 1), (regression_datset(seed), 1.0, 0)):
+            for top_k in (0, 10):
+                exact = search.search_projections(ds, 10, 30, purity, mode, 1, top_k=top_k, rank_by=1)
+                approximate = search.search_projections(ds, 10, 30, purity, mode, 1, top_k=top_k, rank_by=1,
+                                                        sample_size=150, candidates=10, seed=seed)
+                assert search.get_stats()['approximate']['sample_binsize'] == 10
+                assert boxes(approximate) == boxes(exact), "seed %d, mode %d, top_k %d" % (seed, mode, top_k)
+
+def test_pruned_evaluations():
+    # Pruning skips (range, class) evaluations that cannot reach the purity, whatever the no. of threads
+    search = new_search()
+    pruned = {}
+    for purity in (0.5, 0.9):
+        found = []
+        for threads in (1, 3):
+            found.append(boxes(search.search_projections(classification_datset(0), 10, 30, purity, 1, threads)))
+            stats = search.get_stats()
+            pruned.setdefault(purity, stats['pruned_evaluations'])
+            assert stats['pruned_evaluations'] == pruned[purity], "purity %g, %d threads" % (purity, threads)
+            assert stats['ranges_evaluated'] > 0
+        assert found[0] == found[1]
+    assert 0 < pruned[0.5] < pruned[0.9]
+
+    search.search_projections(regression_datset(0), 10, 30, 1.0, 0, 3)
+    assert search.get_stats()['pruned_evaluations'] == 0
+
+def test_screen_purity():
+    # The default screens nothing, and nor does a screen at the largest class proportion, which every attribute passes
+    search = new_search()
+    for seed in range(3):
+        X, labels, output = make_data(seed)
+        largest = numpy.bincount(labels.astype(int)).max() / float(len(labels))
+        for threads in (1, 3):
+            plain = boxes(search.search_projections(classification_datset(seed), 10, 30, 0.7, 1, threads))
+            for screen_purity in (0.0, largest):
+                found = search.search_projections(classification_datset(seed), 10, 30, 0.7, 1, threads,
+                                                  screen_purity=screen_purity)
+                assert boxes(found) == plain, "seed %d, screen_purity %g" % (seed, screen_purity)
+                assert search.get_stats()['pairs_screened'] == 0
+
+def test_top_k():
+    # The top 'k' boxes are the first 'k' of the ranking of all boxes
+    search = new_search()
+    for ds, purity, mode, rank_by in ((classification_datset(0), 0.7, 1, (0, 1)),
+                                      (regression_datset(0), 1.0, 0, (1, 2))):
+        found = boxes(search.search_projections(ds, 10, 30, purity, mode, 1))
+        for rank in rank_by:
+            ranking = boxes(search.search_projections(ds, 10, 30, purity, mode, 1, top_k=len(found) + 1, rank_by=rank))
+            assert sorted(ranking) == sorted(found)
+            for top_k in (1, 5, len(found) // 2):
+                for threads in (1, 3):
+                    best = search.search_projections(ds, 10, 30, purity, mode, threads, top_k=top_k, rank_by=rank)
+                    assert boxes(best) == ranking[:top_k], "mode %d, rank_by %d, top_k %d" % (mode, rank, top_k)
+        support = boxes(search.search_projections(ds, 10, 30, purity, mode, 1, top_k=len(found), rank_by=1))
+        assert [box[6] for box in support] == sorted((box[6] for box in found), reverse=True)
+
+def test_max_rounds():
+    search = new_search()
+    for ds, purity, mode in ((classification_datset(0), 0.7, 1), (regression_datset(0), 1.0, 1)):
+        full = search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, 1, seed=1)
+        assert not full.is_partial() and full.get_num_projections() > 2
+        for rounds in (1, 2):
+            limited = search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, 1, seed=1, max_rounds=rounds)
+            assert limited.get_num_projections() == rounds
+            assert limited.is_partial() and search.get_stats()['partial']
+            assert boxes(limited) == boxes(full)[:rounds]
+
+def test_zero_timeout():
+    search = new_search()
+    for ds, purity, mode in ((classification_datset(0), 0.7, 1), (regression_datset(0), 1.0, 1)):
+        for threads in (1, 3):
+            found = search.find_easy_explain_data(ds, 0.1, 10, 30, purity, mode, threads, seed=1, timeout=0)
+            assert found.get_num_projections() == 0
+            assert found.is_partial() and search.get_stats()['partial']
+
+if __name__ == '__main__':
+    test_approximate_greedy_first_round()
+    test_approximate_search_of_all_pairs()
+    test_pruned_evaluations()
+    test_screen_purity()
+    test_top_k()
+    test_max_rounds()
+    test_zero_timeout()
+    print("All searches match")